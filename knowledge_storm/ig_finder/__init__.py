@@ -27,6 +27,21 @@ from .engine import (
     IGFinderArguments,
 )
 
+from .batch import (
+    BatchIGFinderRunner,
+    TokenBudget,
+    TokenBudgetExceeded,
+    TopicStatus,
+    load_topic_manifest,
+)
+
+from .cache import (
+    MetadataCache,
+    PaperMetadataStore,
+    CachedEncoder,
+    DeviationAnalysisStore,
+)
+
 __all__ = [
     # Data classes
     "CognitiveBaseline",
@@ -46,4 +61,15 @@ __all__ = [
     "IGFinderRunner",
     "IGFinderLMConfigs",
     "IGFinderArguments",
+    # Batch execution
+    "BatchIGFinderRunner",
+    "TokenBudget",
+    "TokenBudgetExceeded",
+    "TopicStatus",
+    "load_topic_manifest",
+    # Caches
+    "MetadataCache",
+    "PaperMetadataStore",
+    "CachedEncoder",
+    "DeviationAnalysisStore",
 ]
@@ -0,0 +1,463 @@
+"""
+IG-Finder Batch Runner
+
+Runs the IG-Finder pipeline for many topics in one process. Topics are scheduled
+concurrently under global LM / retrieval concurrency limits and a shared token
+budget, and in-process caches (retrieval, paper metadata, embeddings) are shared
+across topics.
+"""
+
+import asyncio
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from ..interface import InformationRegistry, Retriever
+from ..utils import truncate_filename
+from .cache import CachedEncoder, MetadataCache, PaperMetadataStore
+from .engine import IGFinderArguments, IGFinderLMConfigs, IGFinderRunner
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised when an LM call is attempted after the token budget is exhausted."""
+
+
+class TokenBudget:
+    """Thread-safe budget of LM tokens (prompt + completion) shared by several runs."""
+    
+    def __init__(self, max_tokens: Optional[int] = None):
+        """
+        Args:
+            max_tokens: Maximum number of tokens. None means unlimited (tokens are still counted).
+        """
+        self.max_tokens = max_tokens
+        self.used = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def exhausted(self) -> bool:
+        return self.max_tokens is not None and self.used >= self.max_tokens
+    
+    @property
+    def remaining(self) -> Optional[int]:
+        if self.max_tokens is None:
+            return None
+        return max(self.max_tokens - self.used, 0)
+    
+    def charge(self, tokens: int):
+        with self._lock:
+            self.used += tokens
+    
+    def check(self):
+        if self.exhausted:
+            raise TokenBudgetExceeded(f"Token budget of {self.max_tokens} tokens is exhausted.")
+
+
+class GovernedLM:
+    """
+    Wrapper of an LM enforcing a shared concurrency limit and token budget.
+    
+    Every call (and every stream, for its whole duration) holds a permit of the shared
+    semaphore, and is refused once the budget is exhausted; `refused` records whether a
+    call of this LM was refused. The tokens booked by the LM (its `prompt_tokens` and
+    `completion_tokens` counters, and the hedge counters of discarded hedged requests)
+    are charged to the budget. Everything else is delegated to the wrapped LM, so usage
+    collection is unchanged.
+    """
+    
+    def __init__(self, lm, semaphore: threading.Semaphore, budget: TokenBudget):
+        object.__setattr__(self, "_lm", lm)
+        object.__setattr__(self, "_semaphore", semaphore)
+        object.__setattr__(self, "_budget", budget)
+        object.__setattr__(self, "_usage_lock", threading.Lock())
+        object.__setattr__(self, "refused", False)
+        
+        self._charge_counters("log_usage", ("prompt_tokens", "completion_tokens"))
+        # Losing hedged requests are booked separately by `LitellmModel._log_hedge_usage`.
+        self._charge_counters("_log_hedge_usage", ("hedge_prompt_tokens", "hedge_completion_tokens"))
+    
+    def _charge_counters(self, method_name: str, counters: Tuple[str, ...]):
+        """Patch a usage-booking method of the LM to charge the tokens it books to the budget."""
+        method = getattr(self._lm, method_name, None)
+        if method is None:
+            return
+        
+        def booked_tokens() -> int:
+            return sum(getattr(self._lm, counter, 0) for counter in counters)
+        
+        def charged_method(*args, **kwargs):
+            # Serialized, so the counter delta is the usage booked by this call only.
+            with self._usage_lock:
+                before = booked_tokens()
+                method(*args, **kwargs)
+                self._budget.charge(max(booked_tokens() - before, 0))
+        
+        setattr(self._lm, method_name, charged_method)
+    
+    def _check_budget(self):
+        try:
+            self._budget.check()
+        except TokenBudgetExceeded:
+            object.__setattr__(self, "refused", True)
+            raise
+    
+    def __call__(self, *args, **kwargs):
+        self._check_budget()
+        with self._semaphore:
+            return self._lm(*args, **kwargs)
+    
+    def stream(self, *args, **kwargs):
+        self._check_budget()
+        with self._semaphore:
+            yield from self._lm.stream(*args, **kwargs)
+    
+    def __getattr__(self, name):
+        return getattr(self._lm, name)
+    
+    def __setattr__(self, name, value):
+        # e.g. `history` is reset on the wrapped LM by `collect_and_reset_lm_history`.
+        setattr(self._lm, name, value)
+
+
+class GovernedRetriever(Retriever):
+    """
+    Per-topic view of a retriever shared by several runs.
+    
+    Calls go through the shared retriever (and its cache) under a shared concurrency
+    limit, and the results are interned in a registry of the topic, so the papers of
+    one topic are not merged with the hits of another topic.
+    """
+    
+    def __init__(self, retriever: Retriever, semaphore: threading.Semaphore):
+        super().__init__(
+            rm=retriever.rm,
+            max_thread=retriever.max_thread,
+            cache=retriever.cache,
+            registry=InformationRegistry(),
+        )
+        self.retriever = retriever
+        self.semaphore = semaphore
+    
+    def collect_and_reset_rm_usage(self):
+        # The usage of the shared retriever is collected once by the batch runner.
+        return {}
+    
+    async def aretrieve(self, query, exclude_urls: List[str] = [], use_cache: bool = True):
+        return await asyncio.to_thread(self.retrieve, query, exclude_urls, use_cache)
+    
+    def retrieve(self, query, exclude_urls: List[str] = [], use_cache: bool = True):
+        with self.semaphore:
+            results = self.retriever.retrieve(query, exclude_urls=exclude_urls, use_cache=use_cache)
+        return self._intern(results)
+
+
+@dataclasses.dataclass
+class TopicStatus:
+    """Status of the run of one topic."""
+    topic: str
+    output_dir: str
+    status: str = "pending"  # pending, running, completed, failed, budget_exceeded or skipped
+    duration: Optional[float] = None  # Seconds
+    num_clusters: Optional[int] = None
+    tokens: int = 0  # Prompt + completion tokens of the topic's LMs
+    lm_usage: Dict[str, Dict[str, int]] = dataclasses.field(default_factory=dict)
+    error: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+def load_topic_manifest(manifest_path: str) -> List[Dict[str, Any]]:
+    """
+    Load the topics of a batch from a manifest file.
+    
+    Supported formats:
+    - .json: a list of topics, each a string or an object with a "topic" key and optional
+      `IGFinderArguments` overrides (e.g. {"topic": "...", "top_k_reviews": 5})
+    - .jsonl: one such object (or JSON string) per line
+    - anything else: one topic per line
+    
+    Returns:
+        List of dictionaries, each with a "topic" key and optional argument overrides
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        if manifest_path.endswith(".json"):
+            entries = json.load(f)
+        elif manifest_path.endswith(".jsonl"):
+            entries = [json.loads(line) for line in f if line.strip()]
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return [entry if isinstance(entry, dict) else {"topic": entry} for entry in entries]
+
+
+class BatchIGFinderRunner:
+    """
+    Runs IG-Finder for many topics concurrently.
+    
+    Each topic gets its own `IGFinderRunner`, language models (built by `lm_configs_factory`,
+    so token usage is tracked per topic), registry and output subdirectory. Across topics:
+    - at most `max_concurrent_topics` topics run at once
+    - at most `max_concurrent_lm_calls` LM calls and `max_concurrent_retrievals` retrieval
+      calls are in flight at once
+    - LM tokens are charged to a shared budget; once it is exhausted, further LM calls are
+      refused (their topics end as `budget_exceeded`) and pending topics are skipped
+    - the retriever (with its `RetrievalCache`, if any), the paper metadata cache and the
+      embedding cache are shared
+    
+    Usage:
+        >>> runner = BatchIGFinderRunner(base_args, lm_configs_factory, rm, encoder=encoder)
+        >>> statuses = runner.run(["topic A", "topic B"])
+        >>> runner.summary()
+    """
+    
+    def __init__(
+        self,
+        base_args: IGFinderArguments,
+        lm_configs_factory: Callable[[], IGFinderLMConfigs],
+        rm: Retriever,
+        encoder=None,
+        max_concurrent_topics: int = 4,
+        max_concurrent_lm_calls: int = 16,
+        max_concurrent_retrievals: int = 8,
+        max_total_tokens: Optional[int] = None,
+        metadata_cache: Optional[MetadataCache] = None,
+    ):
+        """
+        Args:
+            base_args: Arguments shared by all topics. `topic` is overridden per topic, and
+                `output_dir` is the base directory of the per-topic subdirectories.
+            lm_configs_factory: Function returning a new, initialized `IGFinderLMConfigs`. It is
+                called once per topic and should create new LM objects each time.
+            rm: Retriever shared by all topics.
+            encoder: Optional embedding model shared by all topics (wrapped in a `CachedEncoder`).
+            max_concurrent_topics: Maximum number of topics running at once.
+            max_concurrent_lm_calls: Maximum number of LM calls in flight at once, across topics.
+            max_concurrent_retrievals: Maximum number of retrieval calls in flight at once, across topics.
+            max_total_tokens: Optional budget of LM tokens (prompt + completion) for the whole batch.
+            metadata_cache: Optional paper metadata cache. If not given, a `PaperMetadataStore` in
+                `base_args.metadata_cache_dir` is used if set, and an in-memory cache otherwise.
+        """
+        self.base_args = base_args
+        self.lm_configs_factory = lm_configs_factory
+        self.rm = rm
+        self.encoder = CachedEncoder(encoder) if encoder is not None else None
+        if metadata_cache is None:
+            if base_args.metadata_cache_dir is not None:
+                metadata_cache = PaperMetadataStore(base_args.metadata_cache_dir)
+            else:
+                metadata_cache = MetadataCache()
+        self.metadata_cache = metadata_cache
+        self.max_concurrent_topics = max_concurrent_topics
+        self.lm_semaphore = threading.BoundedSemaphore(max_concurrent_lm_calls)
+        self.rm_semaphore = threading.BoundedSemaphore(max_concurrent_retrievals)
+        self.budget = TokenBudget(max_total_tokens)
+        
+        self.statuses: List[TopicStatus] = []
+        self.rm_usage = {}
+        self.wall_time = None
+        self._status_lock = threading.Lock()
+        
+        self.output_dir = Path(base_args.output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+    
+    def _topic_output_dir(self, topic: str) -> str:
+        dir_name = truncate_filename(topic.replace(" ", "_").replace("/", "_"))
+        return str(self.output_dir / dir_name)
+    
+    def _govern_lm_configs(self, lm_configs: IGFinderLMConfigs) -> IGFinderLMConfigs:
+        """Wrap every LM of the configs once, even if it is used by several roles."""
+        wrapped = {}
+        for attr_name in list(lm_configs.__dict__):
+            lm = getattr(lm_configs, attr_name)
+            if "_lm" not in attr_name or lm is None:
+                continue
+            if id(lm) not in wrapped:
+                wrapped[id(lm)] = GovernedLM(lm, self.lm_semaphore, self.budget)
+            setattr(lm_configs, attr_name, wrapped[id(lm)])
+        return lm_configs
+    
+    def _update_status(self, topic_status: TopicStatus, **changes):
+        with self._status_lock:
+            for key, value in changes.items():
+                setattr(topic_status, key, value)
+            self._save_status()
+    
+    def _run_topic(self, status: TopicStatus, overrides: Dict[str, Any]):
+        if self.budget.exhausted:
+            self._update_status(status, status="skipped", error="Token budget exhausted before start")
+            return
+        
+        self._update_status(status, status="running")
+        start = time.time()
+        runner = None
+        try:
+            args = dataclasses.replace(
+                self.base_args,
+                **{**overrides, "topic": status.topic, "output_dir": status.output_dir},
+            )
+            lm_configs = self._govern_lm_configs(self.lm_configs_factory())
+            runner = IGFinderRunner(
+                args,
+                lm_configs,
+                GovernedRetriever(self.rm, self.rm_semaphore),
+                encoder=self.encoder,
+                metadata_cache=self.metadata_cache,
+            )
+            runner.run()
+            # Phases log and skip the papers they fail on, so a refused call may not raise.
+            refused = any(
+                lm.refused for lm in vars(lm_configs).values() if isinstance(lm, GovernedLM)
+            )
+            result = "budget_exceeded" if refused else "completed"
+            error = "LM calls were refused by the exhausted token budget" if refused else None
+        except TokenBudgetExceeded as e:
+            result, error = "budget_exceeded", str(e)
+        except Exception as e:
+            logger.exception(f"IG-Finder run failed for topic '{status.topic}'")
+            result, error = "failed", f"{type(e).__name__}: {e}"
+        
+        lm_usage = {}
+        if runner is not None:
+            # Usage of a step that did not complete (e.g. interrupted by the budget).
+            unattributed = runner.lm_configs.collect_and_reset_lm_usage()
+            if unattributed:
+                runner.lm_cost["unattributed"] = unattributed
+            for usage in runner.lm_cost.values():
+                for model_name, tokens in usage.items():
+                    model_usage = lm_usage.setdefault(model_name, {})
+                    for key, value in tokens.items():
+                        model_usage[key] = model_usage.get(key, 0) + value
+        
+        self._update_status(
+            status,
+            status=result,
+            error=error,
+            duration=time.time() - start,
+            num_clusters=len(runner.innovation_clusters) if runner and runner.innovation_clusters is not None else None,
+            lm_usage=lm_usage,
+            tokens=sum(u.get("prompt_tokens", 0) + u.get("completion_tokens", 0) for u in lm_usage.values()),
+        )
+        logger.info(f"Topic '{status.topic}' finished with status: {result}")
+    
+    def run(self, topics: Union[str, List[Union[str, Dict[str, Any]]]]) -> List[TopicStatus]:
+        """
+        Run IG-Finder for all topics.
+        
+        Args:
+            topics: Path of a topic manifest (see `load_topic_manifest`), or a list of topics, each
+                a string or a dictionary with a "topic" key and optional `IGFinderArguments` overrides
+        
+        Returns:
+            List of TopicStatus, in the order of the topics
+        """
+        entries = load_topic_manifest(topics) if isinstance(topics, str) else [
+            entry if isinstance(entry, dict) else {"topic": entry} for entry in topics
+        ]
+        
+        jobs = []
+        for entry in entries:
+            overrides = {k: v for k, v in entry.items() if k != "topic"}
+            jobs.append((TopicStatus(topic=entry["topic"], output_dir=self._topic_output_dir(entry["topic"])), overrides))
+        with self._status_lock:
+            self.statuses = [status for status, _ in jobs]
+            self._save_status()
+        
+        logger.info(f"Running IG-Finder for {len(jobs)} topics ({self.max_concurrent_topics} at a time)")
+        start = time.time()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrent_topics) as executor:
+            list(executor.map(lambda job: self._run_topic(*job), jobs))
+        self.wall_time = time.time() - start
+        
+        self.rm_usage = self.rm.collect_and_reset_rm_usage()
+        with self._status_lock:
+            self._save_status()
+        return self.statuses
+    
+    def aggregate_metrics(self) -> Dict[str, Any]:
+        """Aggregate cost and latency metrics of the batch."""
+        durations = sorted(s.duration for s in self.statuses if s.duration is not None)
+        status_counts = {}
+        lm_usage = {}
+        for status in self.statuses:
+            status_counts[status.status] = status_counts.get(status.status, 0) + 1
+            for model_name, tokens in status.lm_usage.items():
+                model_usage = lm_usage.setdefault(model_name, {})
+                for key, value in tokens.items():
+                    model_usage[key] = model_usage.get(key, 0) + value
+        
+        return {
+            "num_topics": len(self.statuses),
+            "status_counts": status_counts,
+            "wall_time": self.wall_time,
+            "topic_duration": {
+                "total": sum(durations),
+                "mean": sum(durations) / len(durations) if durations else None,
+                "median": durations[len(durations) // 2] if durations else None,
+                "max": durations[-1] if durations else None,
+            },
+            "total_tokens": self.budget.used,
+            "token_budget": self.budget.max_tokens,
+            "lm_usage": lm_usage,
+            "rm_usage": self.rm_usage,
+            "metadata_cache": {"entries": len(self.metadata_cache), "hits": self.metadata_cache.hits, "misses": self.metadata_cache.misses},
+            "embedding_cache": {"hits": self.encoder.hits, "misses": self.encoder.misses} if self.encoder else None,
+        }
+    
+    def _save_status(self):
+        """Save the status table and metrics (called with the status lock held)."""
+        output_file = self.output_dir / "batch_status.json"
+        data = {
+            "topics": [s.to_dict() for s in self.statuses],
+            "metrics": self.aggregate_metrics(),
+        }
+        tmp_file = output_file.with_suffix(".json.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, output_file)
+    
+    def status_table(self) -> str:
+        """Per-topic status table in Markdown."""
+        lines = [
+            "| Topic | Status | Duration (s) | Clusters | Tokens | Error |",
+            "|---|---|---|---|---|---|",
+        ]
+        for s in self.statuses:
+            duration = f"{s.duration:.1f}" if s.duration is not None else "-"
+            clusters = s.num_clusters if s.num_clusters is not None else "-"
+            lines.append(f"| {s.topic} | {s.status} | {duration} | {clusters} | {s.tokens} | {s.error or ''} |")
+        return "\n".join(lines)
+    
+    def summary(self):
+        """Print the status table and aggregate metrics of the batch."""
+        metrics = self.aggregate_metrics()
+        print("\n" + "="*80)
+        print("IG-FINDER BATCH SUMMARY")
+        print("="*80 + "\n")
+        print(self.status_table())
+        
+        print(f"\nTopics: {metrics['num_topics']} ({', '.join(f'{k}: {v}' for k, v in metrics['status_counts'].items())})")
+        if metrics["wall_time"] is not None:
+            print(f"Wall time: {metrics['wall_time']:.1f}s")
+        if metrics["topic_duration"]["mean"] is not None:
+            print(f"Topic duration: mean {metrics['topic_duration']['mean']:.1f}s, "
+                  f"median {metrics['topic_duration']['median']:.1f}s, max {metrics['topic_duration']['max']:.1f}s")
+        budget = f" / {metrics['token_budget']}" if metrics["token_budget"] is not None else ""
+        print(f"LM tokens: {metrics['total_tokens']}{budget}")
+        for model_name, tokens in metrics["lm_usage"].items():
+            print(f"  {model_name}: {tokens}")
+        if metrics["rm_usage"]:
+            print(f"Retrieval usage: {metrics['rm_usage']}")
+        print(f"Metadata cache: {metrics['metadata_cache']}")
+        if metrics["embedding_cache"] is not None:
+            print(f"Embedding cache: {metrics['embedding_cache']}")
+        
+        print(f"\nOutput directory: {self.output_dir}")
+        print("="*80 + "\n")
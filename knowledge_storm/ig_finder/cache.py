@@ -0,0 +1,257 @@
+"""
+Caches and stores of IG-Finder.
+
+The metadata and embedding caches are meant to be shared by the runs of several
+topics (see `BatchIGFinderRunner`), so that papers and texts appearing in
+overlapping topics are processed once. The deviation analysis store lets
+recurring runs of a topic only analyze new frontier papers.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import diskcache
+import numpy as np
+
+from ..utils import canonicalize_url
+from .dataclass import DeviationAnalysis, ResearchPaper
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataCache:
+    """
+    Thread-safe cache of paper metadata extracted by an LM.
+    
+    Entries are keyed by the kind of extraction (e.g. "review" or "paper"), the canonical
+    URL of the paper and a hash of its title and abstract, so a paper whose content changed
+    is extracted again. The cache lives in memory; see `PaperMetadataStore` for a
+    persistent version.
+    """
+    
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str, str], Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    @staticmethod
+    def content_hash(title: str, abstract: str) -> str:
+        return hashlib.sha1(f"{title}\n{abstract}".encode("utf-8")).hexdigest()
+    
+    def _key(self, kind: str, url: str, title: str, abstract: str) -> Tuple[str, str, str]:
+        return kind, canonicalize_url(url), self.content_hash(title, abstract)
+    
+    def _load(self, key: Tuple[str, str, str]) -> Optional[Dict[str, str]]:
+        """Load an entry missing from memory (overridden by persistent caches)."""
+        return None
+    
+    def _store(self, key: Tuple[str, str, str], metadata: Dict[str, str]):
+        """Persist an entry (overridden by persistent caches)."""
+    
+    def get(self, kind: str, url: str, title: str, abstract: str) -> Optional[Dict[str, str]]:
+        """Return a copy of the cached metadata fields, or None on a miss."""
+        key = self._key(kind, url, title, abstract)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return dict(entry)
+    
+    def set(self, kind: str, url: str, title: str, abstract: str, metadata: Dict[str, str]):
+        key = self._key(kind, url, title, abstract)
+        with self._lock:
+            self._entries[key] = dict(metadata)
+        self._store(key, dict(metadata))
+    
+    def get_usage_and_reset(self) -> Dict[str, int]:
+        with self._lock:
+            usage = {"hits": self.hits, "misses": self.misses}
+            self.hits = 0
+            self.misses = 0
+        return usage
+
+
+class PaperMetadataStore(MetadataCache):
+    """
+    Persistent paper metadata cache, keyed by canonical URL plus content hash.
+    
+    Metadata extraction is a pure function of the title, abstract and URL of a paper, so
+    its results are reused across runs and topics: a paper appearing in several topics of
+    a batch sweep, or in a later run of the same topic, is only extracted once.
+    """
+    
+    def __init__(self, cache_dir: Optional[str] = None, size_limit: int = 2**28):
+        """
+        Args:
+            cache_dir: Directory of the store. Defaults to ~/.storm_local_cache/paper_metadata.
+            size_limit: Maximum size (in bytes) of the store on disk.
+        """
+        super().__init__()
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser("~"), ".storm_local_cache", "paper_metadata")
+        self.cache = diskcache.Cache(cache_dir, size_limit=size_limit)
+    
+    def __len__(self):
+        return len(self.cache)
+    
+    def _load(self, key: Tuple[str, str, str]) -> Optional[Dict[str, str]]:
+        return self.cache.get(("metadata",) + key)
+    
+    def _store(self, key: Tuple[str, str, str], metadata: Dict[str, str]):
+        self.cache.set(("metadata",) + key, metadata)
+
+
+class CachedEncoder:
+    """
+    Thread-safe memoizing wrapper of an embedding model.
+    
+    Only the texts that have not been embedded before are sent to the wrapped encoder,
+    in a single `encode` call.
+    """
+    
+    def __init__(self, encoder, max_entries: int = 100000):
+        """
+        Args:
+            encoder: Embedding model with an `encode(texts) -> np.ndarray` method (e.g. `Encoder`).
+            max_entries: Maximum number of cached embeddings. The oldest entries are evicted first.
+        """
+        self.encoder = encoder
+        self.max_entries = max_entries
+        self._embeddings: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def encode(self, texts: Union[str, List[str]], **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        
+        with self._lock:
+            found = {t: self._embeddings[t] for t in texts if t in self._embeddings}
+            missing = list(dict.fromkeys(t for t in texts if t not in found))
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        
+        if missing:
+            embeddings = np.asarray(self.encoder.encode(missing, **kwargs))
+            if len(embeddings) != len(missing):
+                raise ValueError(f"Expected {len(missing)} embeddings, got {len(embeddings)}.")
+            found.update(zip(missing, embeddings))
+            with self._lock:
+                self._embeddings.update(zip(missing, embeddings))
+                # Dicts keep insertion order, so the oldest entries come first.
+                for text in list(self._embeddings)[:max(len(self._embeddings) - self.max_entries, 0)]:
+                    del self._embeddings[text]
+        
+        result = np.stack([found[t] for t in texts])
+        return result[0] if single else result
+    
+    def get_usage_and_reset(self) -> Dict[str, int]:
+        with self._lock:
+            usage = {"hits": self.hits, "misses": self.misses}
+            self.hits = 0
+            self.misses = 0
+        return usage
+    
+    def __getattr__(self, name):
+        # Other methods of the encoder (e.g. token usage) are delegated to it.
+        return getattr(self.encoder, name)
+
+
+class DeviationAnalysisStore:
+    """
+    Persistent per-paper deviation analyses of a topic, saved as a JSON file.
+    
+    Entries are keyed by the canonical URL of the paper and an analysis context, which
+    identifies everything the analysis depends on besides the paper: the fingerprint of
+    the cognitive baseline, the expert set and the prompt version. An analysis is reused
+    only if it was made in the same context.
+    """
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Path of the JSON file. Existing entries are loaded from it.
+        """
+        self.path = Path(path)
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+            logger.info(f"Loaded {len(self._entries)} stored deviation analyses from {self.path}")
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    @staticmethod
+    def make_context(baseline_fingerprint: str, experts: List[Dict[str, str]], prompt_version: str) -> str:
+        expert_set = sorted((expert["name"], expert["description"]) for expert in experts)
+        experts_hash = hashlib.sha1(json.dumps(expert_set).encode("utf-8")).hexdigest()[:16]
+        return f"{baseline_fingerprint}:{experts_hash}:{prompt_version}"
+    
+    @staticmethod
+    def _key(paper_url: str, context: str) -> str:
+        return f"{canonicalize_url(paper_url)} {context}"
+    
+    @staticmethod
+    def _decode(entry: Dict) -> Tuple[ResearchPaper, Dict[str, DeviationAnalysis]]:
+        return (
+            ResearchPaper.from_dict(entry["paper"]),
+            {name: DeviationAnalysis.from_dict(a) for name, a in entry["analyses"].items()},
+        )
+    
+    def get(self, paper_url: str, context: str) -> Optional[Tuple[ResearchPaper, Dict[str, DeviationAnalysis]]]:
+        """Return the stored (paper, expert -> analysis) of the paper in this context, or None."""
+        with self._lock:
+            entry = self._entries.get(self._key(paper_url, context))
+        return self._decode(entry) if entry is not None else None
+    
+    def put(self, paper: ResearchPaper, analyses: Dict[str, DeviationAnalysis], context: str):
+        with self._lock:
+            self._entries[self._key(paper.url, context)] = {
+                "context": context,
+                "analyzed_at": time.time(),
+                "paper": paper.to_dict(),
+                "analyses": {name: a.to_dict() for name, a in analyses.items()},
+            }
+    
+    def entries(self, context: str) -> List[Tuple[ResearchPaper, Dict[str, DeviationAnalysis]]]:
+        """All stored analyses made in this context, oldest first."""
+        with self._lock:
+            entries = [e for e in self._entries.values() if e["context"] == context]
+        entries.sort(key=lambda e: e["analyzed_at"])
+        return [self._decode(e) for e in entries]
+    
+    def prune(self, context: str) -> int:
+        """Drop the analyses made in other contexts (e.g. against an outdated baseline)."""
+        with self._lock:
+            stale = [key for key, e in self._entries.items() if e["context"] != context]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+    
+    def save(self):
+        with self._lock:
+            data = json.dumps(self._entries, indent=2, ensure_ascii=False)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
@@ -123,6 +123,7 @@ class ResearchParadigm:
     description: str
     representative_works: List[str] = field(default_factory=list)
     time_period: Optional[TimeRange] = None
+    source_papers: List[str] = field(default_factory=list)  # URLs of the reviews it was extracted from
     
     def to_dict(self):
         return {
@@ -130,6 +131,7 @@ class ResearchParadigm:
             "description": self.description,
             "representative_works": self.representative_works,
             "time_period": self.time_period.to_dict() if self.time_period else None,
+            "source_papers": self.source_papers,
         }
     
     @classmethod
@@ -139,6 +141,7 @@ class ResearchParadigm:
             description=data["description"],
             representative_works=data.get("representative_works", []),
             time_period=TimeRange.from_dict(data["time_period"]) if data.get("time_period") else None,
+            source_papers=data.get("source_papers", []),
         )
 
 
@@ -150,6 +153,7 @@ class Method:
     category: str = ""
     advantages: List[str] = field(default_factory=list)
     limitations: List[str] = field(default_factory=list)
+    source_papers: List[str] = field(default_factory=list)  # URLs of the reviews it was extracted from
     
     def to_dict(self):
         return {
@@ -158,6 +162,7 @@ class Method:
             "category": self.category,
             "advantages": self.advantages,
             "limitations": self.limitations,
+            "source_papers": self.source_papers,
         }
     
     @classmethod
@@ -172,6 +177,7 @@ class Boundary:
     description: str
     known_limits: List[str] = field(default_factory=list)
     open_questions: List[str] = field(default_factory=list)
+    source_papers: List[str] = field(default_factory=list)  # URLs of the reviews it was extracted from
     
     def to_dict(self):
         return {
@@ -179,6 +185,7 @@ class Boundary:
             "description": self.description,
             "known_limits": self.known_limits,
             "open_questions": self.open_questions,
+            "source_papers": self.source_papers,
         }
     
     @classmethod
@@ -251,6 +258,7 @@ class InnovationCluster:
     knowledge_path: List[str]  # Path in the mind map
     cluster_summary: str = ""
     potential_impact: str = ""
+    consensus_distance: Optional[float] = None  # Embedding distance of the cluster to the closest consensus node
     
     def to_dict(self):
         return {
@@ -264,6 +272,7 @@ class InnovationCluster:
             "knowledge_path": self.knowledge_path,
             "cluster_summary": self.cluster_summary,
             "potential_impact": self.potential_impact,
+            "consensus_distance": self.consensus_distance,
         }
     
     @classmethod
@@ -279,6 +288,7 @@ class InnovationCluster:
             knowledge_path=data["knowledge_path"],
             cluster_summary=data.get("cluster_summary", ""),
             potential_impact=data.get("potential_impact", ""),
+            consensus_distance=data.get("consensus_distance"),
         )
 
 
@@ -11,18 +11,21 @@ import os
 import json
 import logging
 from dataclasses import dataclass, field
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from pathlib import Path
 
 from ..interface import LMConfigs, Retriever
-from ..lm import LitellmModel
+from ..lm import LitellmModel, HedgingPolicy
 from ..dataclass import KnowledgeBase
-from .dataclass import CognitiveBaseline, InnovationGapReport
+from .cache import DeviationAnalysisStore, MetadataCache, PaperMetadataStore
+from .dataclass import CognitiveBaseline, InnovationGapReport, ReviewPaper
 from .modules import (
     CognitiveSelfConstructionModule,
     InnovativeNonSelfIdentificationModule,
     DynamicMindMapManager,
     InnovationGapReportGenerator,
+    EmbeddingReranker,
+    InternalCoherenceScorer,
 )
 
 logger = logging.getLogger(__name__)
@@ -47,14 +50,22 @@ class IGFinderLMConfigs(LMConfigs):
         lm_type: Literal["openai", "azure", "together"],
         temperature: Optional[float] = 1.0,
         top_p: Optional[float] = 0.9,
+        hedging_policy: Optional[HedgingPolicy] = None,
     ):
-        """Initialize with default configurations based on provider."""
+        """
+        Initialize with default configurations based on provider.
+        
+        Args:
+            hedging_policy: Optional policy to hedge slow LM requests. Each LM learns
+                its own latency distribution, so the policy can be shared by all roles.
+        """
         if lm_type == "openai":
             openai_kwargs = {
                 "api_key": os.getenv("OPENAI_API_KEY"),
                 "temperature": temperature,
                 "top_p": top_p,
                 "api_base": None,
+                "hedging_policy": hedging_policy,
             }
             # Use GPT-4 for complex reasoning tasks
             self.consensus_extraction_lm = LitellmModel(
@@ -76,6 +87,7 @@ class IGFinderLMConfigs(LMConfigs):
                 "top_p": top_p,
                 "api_base": os.getenv("AZURE_API_BASE"),
                 "api_version": os.getenv("AZURE_API_VERSION"),
+                "hedging_policy": hedging_policy,
             }
             self.consensus_extraction_lm = LitellmModel(
                 model="azure/gpt-4o", max_tokens=3000, **azure_kwargs, model_type="chat"
@@ -94,6 +106,7 @@ class IGFinderLMConfigs(LMConfigs):
                 "api_key": os.getenv("TOGETHER_API_KEY"),
                 "temperature": temperature,
                 "top_p": top_p,
+                "hedging_policy": hedging_policy,
             }
             model_name = "together_ai/meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo"
             self.consensus_extraction_lm = LitellmModel(
@@ -157,6 +170,35 @@ class IGFinderArguments:
         default=True,
         metadata={"help": "Whether to save intermediate results"}
     )
+    stream_report: bool = field(
+        default=False,
+        metadata={"help": "Whether to stream the Markdown report to disk while it is being generated"}
+    )
+    prompt_layout: str = field(
+        default="legacy",
+        metadata={"help": "Prompt layout of the deviation analysis: 'legacy' keeps the original field order, "
+                          "'prefix_stable' (opt-in) puts run-invariant context first to benefit from provider "
+                          "prompt caching"}
+    )
+    max_thread_num: int = field(
+        default=4,
+        metadata={"help": "Maximum number of threads issuing concurrent LM calls (e.g. cluster validation)"}
+    )
+    incremental_phase1: bool = field(
+        default=False,
+        metadata={"help": "Whether to update the cognitive baseline saved in output_dir by a previous run, "
+                          "extracting consensus only from reviews that are not in it yet"}
+    )
+    incremental_phase2: bool = field(
+        default=False,
+        metadata={"help": "Whether to store per-paper deviation analyses in output_dir and only analyze "
+                          "papers without a stored analysis for the current baseline on later runs"}
+    )
+    metadata_cache_dir: Optional[str] = field(
+        default=None,
+        metadata={"help": "Directory of a persistent paper metadata store shared across runs and topics "
+                          "(None disables it)"}
+    )
 
 
 class IGFinderRunner:
@@ -167,6 +209,12 @@ class IGFinderRunner:
         >>> runner = IGFinderRunner(args, lm_configs, rm)
         >>> runner.run()
         >>> report = runner.get_report()
+    
+    If an encoder (e.g. `Encoder`) is given, review and frontier papers are selected by
+    an embedding reranker instead of keyword heuristics, and the internal coherence of
+    innovation clusters is computed from claim embeddings. A metadata cache can be shared
+    by several runners so that paper metadata is extracted once; if none is given and
+    `args.metadata_cache_dir` is set, a persistent `PaperMetadataStore` is used.
     """
     
     def __init__(
@@ -174,16 +222,29 @@ class IGFinderRunner:
         args: IGFinderArguments,
         lm_configs: IGFinderLMConfigs,
         rm: Retriever,
+        encoder=None,
+        metadata_cache: Optional[MetadataCache] = None,
     ):
         self.args = args
         self.lm_configs = lm_configs
+        if getattr(rm, "registry", None) is None:
+            # Papers hit by several queries or by both phases are processed once. The registry
+            # belongs to this run, so the caller's retriever (possibly shared) is not modified.
+            rm = rm.with_registry()
         self.rm = rm
+        self.encoder = encoder
+        if metadata_cache is None and args.metadata_cache_dir is not None:
+            metadata_cache = PaperMetadataStore(args.metadata_cache_dir)
+        self.metadata_cache = metadata_cache
+        reranker = EmbeddingReranker(encoder) if encoder is not None else None
         
         # Initialize modules
         self.phase1_module = CognitiveSelfConstructionModule(
             retriever=rm,
             consensus_extraction_lm=lm_configs.consensus_extraction_lm,
             top_k_reviews=args.top_k_reviews,
+            reranker=reranker,
+            metadata_cache=metadata_cache,
         )
         
         self.phase2_module = InnovativeNonSelfIdentificationModule(
@@ -192,6 +253,15 @@ class IGFinderRunner:
             top_k_papers=args.top_k_research_papers,
             min_cluster_size=args.min_cluster_size,
             deviation_threshold=args.deviation_threshold,
+            prompt_layout=args.prompt_layout,
+            reranker=reranker,
+            max_thread_num=args.max_thread_num,
+            coherence_scorer=InternalCoherenceScorer(encoder) if encoder is not None else None,
+            metadata_cache=metadata_cache,
+            analysis_store=(
+                DeviationAnalysisStore(os.path.join(args.output_dir, "deviation_analyses.json"))
+                if args.incremental_phase2 else None
+            ),
         )
         
         self.mind_map_manager = DynamicMindMapManager()
@@ -205,6 +275,7 @@ class IGFinderRunner:
         self.innovation_clusters = None
         self.papers_with_deviations = None
         self.final_report: Optional[InnovationGapReport] = None
+        self.lm_cost = {}  # Token usage of language models per pipeline step
         
         # Setup output directory
         self.output_dir = Path(args.output_dir)
@@ -224,8 +295,13 @@ class IGFinderRunner:
         logger.info("PHASE 1: COGNITIVE SELF CONSTRUCTION")
         logger.info("="*80 + "\n")
         
-        cognitive_baseline = self.phase1_module.construct_cognitive_self(self.args.topic)
+        prior_review_papers = self._load_prior_review_papers() if self.args.incremental_phase1 else None
+        cognitive_baseline = self.phase1_module.construct_cognitive_self(
+            self.args.topic,
+            prior_review_papers=prior_review_papers,
+        )
         self.cognitive_baseline = cognitive_baseline
+        self.lm_cost["phase1"] = self.lm_configs.collect_and_reset_lm_usage()
         
         # Save intermediate results
         if self.args.save_intermediate_results:
@@ -259,6 +335,7 @@ class IGFinderRunner:
         
         self.papers_with_deviations = papers_with_deviations
         self.innovation_clusters = innovation_clusters
+        self.lm_cost["phase2"] = self.lm_configs.collect_and_reset_lm_usage()
         
         # Update mind map with evolution states
         logger.info("\nUpdating mind map with evolution states...")
@@ -294,18 +371,31 @@ class IGFinderRunner:
         )
         
         # Generate report
-        report = self.report_generator.generate_report(
-            topic=self.args.topic,
-            cognitive_baseline=self.cognitive_baseline,
-            innovation_clusters=self.innovation_clusters,
-            papers_with_deviations=self.papers_with_deviations,
-            mind_map_visualization_data=mind_map_viz_data,
-        )
+        md_file = self.output_dir / "innovation_gap_report.md"
+        if self.args.stream_report:
+            report = self.report_generator.generate_report_streaming(
+                topic=self.args.topic,
+                cognitive_baseline=self.cognitive_baseline,
+                innovation_clusters=self.innovation_clusters,
+                papers_with_deviations=self.papers_with_deviations,
+                mind_map_visualization_data=mind_map_viz_data,
+                output_path=md_file,
+            )
+            logger.info(f"Saved report (Markdown) to {md_file}")
+        else:
+            report = self.report_generator.generate_report(
+                topic=self.args.topic,
+                cognitive_baseline=self.cognitive_baseline,
+                innovation_clusters=self.innovation_clusters,
+                papers_with_deviations=self.papers_with_deviations,
+                mind_map_visualization_data=mind_map_viz_data,
+            )
         
         self.final_report = report
+        self.lm_cost["report"] = self.lm_configs.collect_and_reset_lm_usage()
         
-        # Save report
-        self._save_report(report)
+        # Save report (the Markdown version has already been written when streaming)
+        self._save_report(report, save_markdown=not self.args.stream_report)
         
         return report
     
@@ -379,7 +469,7 @@ class IGFinderRunner:
             json.dump(data, f, indent=2, ensure_ascii=False)
         logger.info(f"Saved Phase 2 results to {output_file}")
     
-    def _save_report(self, report: InnovationGapReport):
+    def _save_report(self, report: InnovationGapReport, save_markdown: bool = True):
         """Save final report to file."""
         # Save JSON version
         json_file = self.output_dir / "innovation_gap_report.json"
@@ -387,6 +477,9 @@ class IGFinderRunner:
             json.dump(report.to_dict(), f, indent=2, ensure_ascii=False)
         logger.info(f"Saved report (JSON) to {json_file}")
         
+        if not save_markdown:
+            return
+        
         # Save Markdown version
         md_file = self.output_dir / "innovation_gap_report.md"
         md_content = self.report_generator.format_report_as_markdown(report)
@@ -405,6 +498,21 @@ class IGFinderRunner:
         else:
             logger.warning(f"Cognitive baseline file not found: {input_file}")
     
+    def _load_prior_review_papers(self) -> List[ReviewPaper]:
+        """Load the reviews of the cognitive baseline saved by a previous run, if any."""
+        input_file = self.output_dir / "cognitive_baseline.json"
+        if not input_file.exists():
+            logger.info(f"No prior cognitive baseline at {input_file}, building it from scratch")
+            return []
+        with open(input_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("topic") != self.args.topic:
+            logger.warning(f"Prior cognitive baseline is for topic '{data.get('topic')}', building it from scratch")
+            return []
+        review_papers = [ReviewPaper.from_dict(p) for p in data.get("review_papers", [])]
+        logger.info(f"Loaded {len(review_papers)} reviews of the prior cognitive baseline from {input_file}")
+        return review_papers
+    
     def _load_phase2_results(self):
         """Load Phase 2 results from file."""
         input_file = self.output_dir / "phase2_results.json"
@@ -445,5 +553,12 @@ class IGFinderRunner:
             print(f"  - Gap analysis dimensions: {len(self.final_report.gap_analysis_by_dimension)}")
             print(f"  - Innovation paths: {len(self.final_report.mind_map_visualization_data.get('innovation_paths', []))}")
         
+        if self.lm_cost:
+            print("\nToken usage of language models")
+            for step, usage in self.lm_cost.items():
+                print(f"  - {step}")
+                for model_name, tokens in usage.items():
+                    print(f"      {model_name}: {tokens}")
+        
         print(f"\nOutput directory: {self.output_dir}")
         print("="*80 + "\n")
@@ -26,6 +26,15 @@ from .report_generation import (
     InnovationGapReportGenerator,
 )
 
+from .reranker import (
+    EmbeddingReranker,
+)
+
+from .coherence_scoring import (
+    CoherenceScores,
+    InternalCoherenceScorer,
+)
+
 __all__ = [
     # Cognitive Self Construction
     "ReviewRetriever",
@@ -43,4 +52,9 @@ __all__ = [
     "EvolutionStateAnnotator",
     # Report Generation
     "InnovationGapReportGenerator",
+    # Reranking
+    "EmbeddingReranker",
+    # Coherence Scoring
+    "CoherenceScores",
+    "InternalCoherenceScorer",
 ]
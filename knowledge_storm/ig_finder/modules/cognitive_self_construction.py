@@ -6,11 +6,13 @@ by extracting consensus from review papers.
 """
 
 import dspy
+import json
 import logging
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 from datetime import datetime
 
 from ...interface import Retriever, Information
+from ...utils import canonicalize_url
 from ...dataclass import KnowledgeBase
 from ..dataclass import (
     CognitiveBaseline,
@@ -22,6 +24,9 @@ from ..dataclass import (
     ExtendedKnowledgeNode,
     EvolutionState,
 )
+from ..cache import MetadataCache
+from ..utils import parse_json_output
+from .reranker import EmbeddingReranker
 
 logger = logging.getLogger(__name__)
 
@@ -34,11 +39,15 @@ class ReviewRetriever:
     - Prioritize papers with "survey", "review", "overview" in title
     - Sort by citations and recency
     - Filter to ensure they are actual review papers, not research articles
+    
+    If a reranker is given, the filtered candidates are ranked by embedding similarity,
+    recency and review likelihood instead of the keyword heuristic.
     """
     
-    def __init__(self, retriever: Retriever, top_k: int = 10):
+    def __init__(self, retriever: Retriever, top_k: int = 10, reranker: Optional[EmbeddingReranker] = None):
         self.retriever = retriever
         self.top_k = top_k
+        self.reranker = reranker
     
     def retrieve_reviews(self, topic: str) -> List[Information]:
         """
@@ -66,17 +75,21 @@ class ReviewRetriever:
             results = self.retriever.retrieve(query=query, exclude_urls=[])
             all_results.extend(results)
         
-        # Remove duplicates based on URL
+        # Remove duplicates based on canonical URL
         seen_urls = set()
         unique_results = []
         for result in all_results:
-            if result.url not in seen_urls:
-                seen_urls.add(result.url)
+            url = canonicalize_url(result.url)
+            if url not in seen_urls:
+                seen_urls.add(url)
                 unique_results.append(result)
         
         # Filter to keep likely review papers (heuristic: longer descriptions, certain keywords)
         filtered_results = self._filter_review_papers(unique_results)
         
+        if self.reranker is not None:
+            return self.reranker.rerank(topic, filtered_results, self.top_k, prefer_reviews=True)
+        
         # Sort by relevance (using a simple heuristic)
         sorted_results = self._sort_by_relevance(filtered_results, topic)
         
@@ -158,6 +171,62 @@ class ExtractConsensusFromReview(dspy.Signature):
     key_concepts_hierarchy = dspy.OutputField(desc="Hierarchical organization of key concepts in JSON format: {concept_name: {description, subconcepts: [...]}}")
 
 
+# JSON schemas of the structured fields of ExtractConsensusFromReview, used to
+# constrain the targeted re-ask of a field whose output could not be parsed.
+_STRING_LIST_SCHEMA = {"type": "array", "items": {"type": "string"}}
+CONSENSUS_FIELD_SCHEMAS = {
+    "research_paradigms": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "description": {"type": "string"},
+                "time_period": {"type": "string"},
+            },
+            "required": ["name", "description"],
+        },
+    },
+    "mainstream_methods": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "description": {"type": "string"},
+                "category": {"type": "string"},
+                "advantages": _STRING_LIST_SCHEMA,
+                "limitations": _STRING_LIST_SCHEMA,
+            },
+            "required": ["name", "description"],
+        },
+    },
+    "knowledge_boundaries": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "dimension": {"type": "string"},
+                "description": {"type": "string"},
+                "known_limits": _STRING_LIST_SCHEMA,
+                "open_questions": _STRING_LIST_SCHEMA,
+            },
+            "required": ["dimension", "description"],
+        },
+    },
+    "key_concepts_hierarchy": {
+        "type": "object",
+        "additionalProperties": {
+            "type": "object",
+            "properties": {
+                "description": {"type": "string"},
+                "subconcepts": {"type": "array"},
+            },
+        },
+    },
+}
+
+
 class ConsensusExtractor:
     """
     Extracts structured consensus knowledge from review papers.
@@ -167,13 +236,51 @@ class ConsensusExtractor:
     - Mainstream methodologies
     - Knowledge boundaries
     - Concept hierarchies
+    
+    JSON fields are parsed with a tolerant repair parser. A field that still cannot be
+    parsed is re-asked on its own (with provider JSON mode / schema-constrained output
+    when supported), instead of being silently dropped or re-running the whole extraction.
+    
+    If a metadata cache is given, the metadata of a review is only extracted once per
+    content, even across topics sharing the cache.
     """
     
-    def __init__(self, lm: dspy.LM):
+    def __init__(
+        self,
+        lm: dspy.LM,
+        max_field_retries: int = 1,
+        metadata_cache: Optional[MetadataCache] = None,
+    ):
         self.lm = lm
+        self.max_field_retries = max_field_retries
+        self.metadata_cache = metadata_cache
         self.metadata_extractor = dspy.ChainOfThought(ExtractReviewMetadata)
         self.consensus_extractor = dspy.ChainOfThought(ExtractConsensusFromReview)
     
+    def _extract_metadata(self, review_info: Information) -> Dict[str, str]:
+        """Raw metadata fields of a review, from the cache if possible."""
+        if self.metadata_cache is not None:
+            metadata = self.metadata_cache.get(
+                "review", review_info.url, review_info.title, review_info.description
+            )
+            # Entries stored before a change of the signature are extracted again.
+            if metadata is not None and set(ExtractReviewMetadata.output_fields) <= set(metadata):
+                return metadata
+        
+        with dspy.context(lm=self.lm):
+            metadata_result = self.metadata_extractor(
+                title=review_info.title,
+                abstract=review_info.description,
+                url=review_info.url,
+            )
+        metadata = {name: getattr(metadata_result, name) for name in ExtractReviewMetadata.output_fields}
+        
+        if self.metadata_cache is not None:
+            self.metadata_cache.set(
+                "review", review_info.url, review_info.title, review_info.description, metadata
+            )
+        return metadata
+    
     def extract_from_review(self, topic: str, review_info: Information) -> ReviewPaper:
         """
         Extract consensus from a single review paper.
@@ -188,22 +295,17 @@ class ConsensusExtractor:
         logger.info(f"Extracting consensus from review: {review_info.title}")
         
         # Extract metadata
-        with dspy.context(lm=self.lm):
-            metadata_result = self.metadata_extractor(
-                title=review_info.title,
-                abstract=review_info.description,
-                url=review_info.url,
-            )
+        metadata = self._extract_metadata(review_info)
         
         # Parse metadata
         try:
-            year = int(metadata_result.year.strip())
+            year = int(metadata["year"].strip())
         except:
             year = datetime.now().year
         
-        authors = [a.strip() for a in metadata_result.authors.split(',')] if metadata_result.authors != 'Unknown' else []
-        venue = metadata_result.venue if metadata_result.venue != 'Unknown' else ""
-        key_contributions = [c.strip() for c in metadata_result.key_contributions.split(',')]
+        authors = [a.strip() for a in metadata["authors"].split(',')] if metadata["authors"] != 'Unknown' else []
+        venue = metadata["venue"] if metadata["venue"] != 'Unknown' else ""
+        key_contributions = [c.strip() for c in metadata["key_contributions"].split(',')]
         
         # Extract consensus knowledge
         review_content = f"{review_info.description}\n\n" + "\n".join(review_info.snippets[:5])
@@ -216,34 +318,15 @@ class ConsensusExtractor:
             )
         
         # Parse extracted consensus
-        import json
-        try:
-            research_paradigms_data = json.loads(consensus_result.research_paradigms)
-        except:
-            research_paradigms_data = []
-        
-        try:
-            mainstream_methods_data = json.loads(consensus_result.mainstream_methods)
-        except:
-            mainstream_methods_data = []
-        
-        try:
-            knowledge_boundaries_data = json.loads(consensus_result.knowledge_boundaries)
-        except:
-            knowledge_boundaries_data = []
-        
-        try:
-            key_concepts_hierarchy = json.loads(consensus_result.key_concepts_hierarchy)
-        except:
-            key_concepts_hierarchy = {}
-        
         extracted_consensus = {
             "field_development_history": consensus_result.field_development_history,
-            "research_paradigms": research_paradigms_data,
-            "mainstream_methods": mainstream_methods_data,
-            "knowledge_boundaries": knowledge_boundaries_data,
-            "key_concepts_hierarchy": key_concepts_hierarchy,
         }
+        for field_name in CONSENSUS_FIELD_SCHEMAS:
+            extracted_consensus[field_name] = self._parse_json_field(
+                field_name,
+                getattr(consensus_result, field_name, None),
+                review_info.title,
+            )
         
         review_paper = ReviewPaper(
             title=review_info.title,
@@ -259,6 +342,64 @@ class ConsensusExtractor:
         
         return review_paper
     
+    def _parse_json_field(self, field_name: str, raw_value: Optional[str], review_title: str) -> Any:
+        """Parse a JSON field of the consensus extraction, re-asking only this field if needed."""
+        schema = CONSENSUS_FIELD_SCHEMAS[field_name]
+        expected_type = list if schema["type"] == "array" else dict
+        
+        try:
+            return parse_json_output(raw_value, expected_type, key=field_name)
+        except ValueError as e:
+            logger.warning(f"Malformed '{field_name}' for review '{review_title}': {e}")
+        
+        if not raw_value or not raw_value.strip():
+            # Nothing to repair; re-asking without content would only invite hallucinations.
+            return expected_type()
+        
+        for _ in range(self.max_field_retries):
+            try:
+                return parse_json_output(
+                    self._reask_field(field_name, raw_value, schema),
+                    expected_type,
+                    key=field_name,
+                )
+            except Exception as e:
+                logger.warning(f"Re-asking '{field_name}' for review '{review_title}' failed: {e}")
+        
+        try:
+            # e.g. output cut at max_tokens: keep what could be recovered.
+            return parse_json_output(raw_value, expected_type, key=field_name, allow_truncated=True)
+        except ValueError:
+            pass
+        
+        logger.error(f"Dropping unparseable '{field_name}' for review '{review_title}'")
+        return expected_type()
+    
+    def _reask_field(self, field_name: str, raw_value: Optional[str], schema: Dict) -> str:
+        """Ask the LM to rewrite a single malformed field as valid JSON."""
+        # JSON mode requires a top-level object, so the value is wrapped under the field name.
+        wrapped_schema = {
+            "type": "object",
+            "properties": {field_name: schema},
+            "required": [field_name],
+        }
+        prompt = (
+            f"The following value of the field '{field_name}' is not valid JSON.\n"
+            f"Rewrite it as a JSON object of the form {{\"{field_name}\": ...}} that follows this "
+            f"JSON schema: {json.dumps(wrapped_schema)}\n"
+            f"Keep the content unchanged and do not add information. Respond with JSON only.\n\n"
+            f"Value:\n{raw_value}"
+        )
+        
+        kwargs = {}
+        get_response_format = getattr(self.lm, "get_response_format", None)
+        if get_response_format is not None:
+            response_format = get_response_format(wrapped_schema, name=field_name)
+            if response_format is not None:
+                kwargs["response_format"] = response_format
+        
+        return self.lm(prompt, **kwargs)[0]
+    
     def extract_from_reviews(self, topic: str, review_infos: List[Information]) -> List[ReviewPaper]:
         """Extract consensus from multiple review papers."""
         review_papers = []
@@ -273,24 +414,45 @@ class ConsensusExtractor:
         return review_papers
 
 
+def _extend_unique(items: List, new_items: List):
+    """Append the new items that are not in the list yet, in place."""
+    for item in new_items:
+        if item not in items:
+            items.append(item)
+
+
 class CognitiveBaselineBuilder:
     """
     Builds the cognitive baseline by:
     1. Aggregating extracted consensus from multiple reviews
     2. Organizing consensus into a dynamic mind map (KnowledgeBase)
     3. Marking all nodes with CONSENSUS evolution state
+    
+    The baseline is a deterministic function of the extracted consensus of the reviews, so
+    it can be rebuilt without LM calls when reviews are added (see incremental Phase 1).
+    Every paradigm, method, boundary and mind map node keeps the URLs of its source reviews.
+    In incremental mode, same-name paradigms and methods from several reviews are merged.
     """
     
     def __init__(self, lm: dspy.LM):
         self.lm = lm
     
-    def build_baseline(self, topic: str, review_papers: List[ReviewPaper]) -> CognitiveBaseline:
+    def build_baseline(
+        self,
+        topic: str,
+        review_papers: List[ReviewPaper],
+        merge_duplicates: bool = False,
+    ) -> CognitiveBaseline:
         """
         Build cognitive baseline from extracted review papers.
         
         Args:
             topic: The research topic
             review_papers: List of ReviewPaper objects with extracted consensus
+            merge_duplicates: Merge paradigms and methods with the same name (and boundaries with
+                the same dimension) from several reviews, unioning their lists and source reviews,
+                so a rebuilt baseline does not repeat entries. Used by incremental Phase 1.
+                Otherwise every paradigm and method is kept and the last boundary of a dimension wins.
             
         Returns:
             CognitiveBaseline object
@@ -300,6 +462,8 @@ class CognitiveBaselineBuilder:
         # Aggregate consensus from all reviews
         all_paradigms = []
         all_methods = []
+        paradigms_by_name: Dict[str, ResearchParadigm] = {}
+        methods_by_name: Dict[str, Method] = {}
         all_boundaries = {}
         timeline_events = []
         
@@ -313,8 +477,17 @@ class CognitiveBaselineBuilder:
                     description=paradigm_data.get("description", ""),
                     representative_works=paradigm_data.get("representative_works", []),
                     time_period=None,  # Could parse from time_period field if available
+                    source_papers=[review.url],
                 )
-                all_paradigms.append(paradigm)
+                if not merge_duplicates:
+                    all_paradigms.append(paradigm)
+                    continue
+                existing = paradigms_by_name.setdefault(paradigm.name.strip().lower(), paradigm)
+                if existing is paradigm:
+                    all_paradigms.append(paradigm)
+                else:
+                    _extend_unique(existing.representative_works, paradigm.representative_works)
+                    _extend_unique(existing.source_papers, paradigm.source_papers)
             
             # Collect methods
             for method_data in consensus.get("mainstream_methods", []):
@@ -324,8 +497,18 @@ class CognitiveBaselineBuilder:
                     category=method_data.get("category", ""),
                     advantages=method_data.get("advantages", []) if isinstance(method_data.get("advantages"), list) else [],
                     limitations=method_data.get("limitations", []) if isinstance(method_data.get("limitations"), list) else [],
+                    source_papers=[review.url],
                 )
-                all_methods.append(method)
+                if not merge_duplicates:
+                    all_methods.append(method)
+                    continue
+                existing = methods_by_name.setdefault(method.name.strip().lower(), method)
+                if existing is method:
+                    all_methods.append(method)
+                else:
+                    _extend_unique(existing.advantages, method.advantages)
+                    _extend_unique(existing.limitations, method.limitations)
+                    _extend_unique(existing.source_papers, method.source_papers)
             
             # Collect boundaries
             for boundary_data in consensus.get("knowledge_boundaries", []):
@@ -335,8 +518,16 @@ class CognitiveBaselineBuilder:
                     description=boundary_data.get("description", ""),
                     known_limits=boundary_data.get("known_limits", []) if isinstance(boundary_data.get("known_limits"), list) else [],
                     open_questions=boundary_data.get("open_questions", []) if isinstance(boundary_data.get("open_questions"), list) else [],
+                    source_papers=[review.url],
                 )
-                all_boundaries[dimension] = boundary
+                if not merge_duplicates:
+                    all_boundaries[dimension] = boundary
+                    continue
+                existing = all_boundaries.setdefault(dimension, boundary)
+                if existing is not boundary:
+                    _extend_unique(existing.known_limits, boundary.known_limits)
+                    _extend_unique(existing.open_questions, boundary.open_questions)
+                    _extend_unique(existing.source_papers, boundary.source_papers)
         
         # Build mind map from concept hierarchies
         consensus_map = self._build_consensus_mind_map(topic, review_papers)
@@ -438,7 +629,10 @@ class CognitiveBaselineBuilder:
                                 sub_existing = child
                                 break
                         
-                        if not sub_existing:
+                        if sub_existing:
+                            if review_url not in sub_existing.source_papers:
+                                sub_existing.source_papers.append(review_url)
+                        else:
                             sub_node = ExtendedKnowledgeNode(
                                 name=subconcept_name,
                                 parent=existing_node,
@@ -466,29 +660,46 @@ class CognitiveSelfConstructionModule:
         retriever: Retriever,
         consensus_extraction_lm: dspy.LM,
         top_k_reviews: int = 10,
+        reranker: Optional[EmbeddingReranker] = None,
+        metadata_cache: Optional[MetadataCache] = None,
     ):
-        self.review_retriever = ReviewRetriever(retriever, top_k=top_k_reviews)
-        self.consensus_extractor = ConsensusExtractor(consensus_extraction_lm)
+        self.review_retriever = ReviewRetriever(retriever, top_k=top_k_reviews, reranker=reranker)
+        self.consensus_extractor = ConsensusExtractor(consensus_extraction_lm, metadata_cache=metadata_cache)
         self.baseline_builder = CognitiveBaselineBuilder(consensus_extraction_lm)
     
-    def construct_cognitive_self(self, topic: str) -> CognitiveBaseline:
+    def construct_cognitive_self(
+        self,
+        topic: str,
+        prior_review_papers: Optional[List[ReviewPaper]] = None,
+    ) -> CognitiveBaseline:
         """
         Execute Phase 1: Construct cognitive baseline from review papers.
         
         Args:
             topic: The research topic
+            prior_review_papers: Reviews of a previous baseline of the topic, or an empty list when
+                there is none yet; passing a list turns on incremental mode. Retrieved reviews are
+                diffed against them by canonical URL, consensus is only extracted from the new ones,
+                and the baseline is rebuilt from the prior and new reviews, merging same-name entries.
             
         Returns:
             CognitiveBaseline object representing the "self" in immune system metaphor
         """
         logger.info(f"=== Phase 1: Cognitive Self Construction for '{topic}' ===")
+        incremental = prior_review_papers is not None
+        prior_review_papers = prior_review_papers or []
         
         # Step 1: Retrieve review papers
         logger.info("Step 1: Retrieving review papers...")
         review_infos = self.review_retriever.retrieve_reviews(topic)
         logger.info(f"Retrieved {len(review_infos)} review papers")
         
-        if not review_infos:
+        if prior_review_papers:
+            known_urls = {canonicalize_url(review.url) for review in prior_review_papers}
+            review_infos = [info for info in review_infos if canonicalize_url(info.url) not in known_urls]
+            logger.info(f"{len(review_infos)} reviews are new to the prior baseline of {len(prior_review_papers)} reviews")
+        
+        if not review_infos and not prior_review_papers:
             logger.warning("No review papers found. Creating empty baseline.")
             return CognitiveBaseline(
                 topic=topic,
@@ -508,7 +719,9 @@ class CognitiveSelfConstructionModule:
         
         # Step 3: Build cognitive baseline
         logger.info("Step 3: Building cognitive baseline...")
-        cognitive_baseline = self.baseline_builder.build_baseline(topic, review_papers)
+        cognitive_baseline = self.baseline_builder.build_baseline(
+            topic, prior_review_papers + review_papers, merge_duplicates=incremental
+        )
         logger.info(f"Cognitive baseline constructed with {len(cognitive_baseline.consensus_map.root.children)} top-level concepts")
         
         logger.info("=== Phase 1 Complete ===\n")
@@ -0,0 +1,170 @@
+"""
+Internal Coherence Scoring
+
+Computes the internal coherence of candidate innovation clusters from the geometry
+of their claim embeddings, instead of fixed scores. Incoherent groups can be rejected
+before an LM validation call is spent on them.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..dataclass import CognitiveBaseline, ResearchPaper
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CoherenceScores:
+    """Coherence measures of one candidate cluster."""
+    cohesion: float  # Mean pairwise cosine similarity of the papers
+    silhouette: Optional[float]  # Mean silhouette against the other candidates (None if there are none)
+    consensus_distance: Optional[float]  # 1 - max cosine similarity of the centroid to a consensus node
+    coherence: float  # Combined internal coherence score in [0, 1]
+    claim_confidences: Dict[Tuple[str, str], float] = field(default_factory=dict)  # (paper url, claim) -> [0, 1]
+
+
+class InternalCoherenceScorer:
+    """
+    Scores candidate clusters from the embeddings of their papers' claims.
+    
+    Each paper is represented by the normalized mean of its claim embeddings. For every
+    candidate group, the scorer computes (all vectorized with NumPy):
+    - cohesion: mean pairwise cosine similarity between the papers of the group
+    - silhouette: mean silhouette coefficient of the papers against the other groups
+    - consensus distance: distance between the group centroid and the closest consensus node
+    The combined coherence is the mean of the cohesion and the rescaled silhouette (the
+    cohesion alone if there is a single group). Each claim gets a confidence equal to its
+    cosine similarity to the group centroid.
+    """
+    
+    def __init__(self, encoder, min_coherence: float = 0.3):
+        """
+        Args:
+            encoder: Embedding model with an `encode(texts) -> np.ndarray` method (e.g. `Encoder`).
+            min_coherence: Groups with a lower coherence are rejected without LM validation.
+        """
+        self.encoder = encoder
+        self.min_coherence = min_coherence
+    
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.asarray(self.encoder.encode(texts), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+    
+    @staticmethod
+    def _paper_claims(paper: ResearchPaper) -> List[str]:
+        claims = [c for c in paper.core_claims if c and c.strip()]
+        return claims or [paper.abstract or paper.title]
+    
+    @staticmethod
+    def _consensus_concepts(baseline: Optional[CognitiveBaseline]) -> List[str]:
+        if baseline is None or not hasattr(baseline.consensus_map, "root"):
+            return []
+        concepts = []
+        stack = [(child, 0) for child in baseline.consensus_map.root.children]
+        while stack:
+            node, depth = stack.pop()
+            concepts.append(node.name)
+            if depth < 2:
+                stack.extend((child, depth + 1) for child in node.children)
+        return concepts
+    
+    def score_groups(
+        self,
+        groups: List[List[ResearchPaper]],
+        cognitive_baseline: Optional[CognitiveBaseline] = None,
+    ) -> List[CoherenceScores]:
+        """
+        Score candidate groups of papers.
+        
+        Args:
+            groups: Candidate groups, each a list of papers
+            cognitive_baseline: Optional baseline whose consensus nodes are used for the consensus distance
+        
+        Returns:
+            One CoherenceScores per group, in the same order
+        """
+        if not groups:
+            return []
+        
+        # Embed all claims and consensus concepts with a single encoder call.
+        papers = [paper for group in groups for paper in group]
+        claims = [self._paper_claims(paper) for paper in papers]
+        concepts = self._consensus_concepts(cognitive_baseline)
+        flat_claims = [claim for paper_claims in claims for claim in paper_claims]
+        embeddings = self._embed(flat_claims + concepts)
+        claim_embeddings, concept_embeddings = embeddings[:len(flat_claims)], embeddings[len(flat_claims):]
+        
+        # Paper vectors: normalized mean of their claim vectors.
+        claim_counts = np.array([len(c) for c in claims])
+        claim_owner = np.repeat(np.arange(len(papers)), claim_counts)
+        paper_vectors = np.zeros((len(papers), embeddings.shape[1]), dtype=np.float32)
+        np.add.at(paper_vectors, claim_owner, claim_embeddings)
+        paper_vectors /= np.maximum(np.linalg.norm(paper_vectors, axis=1, keepdims=True), 1e-12)
+        
+        labels = np.repeat(np.arange(len(groups)), [len(group) for group in groups])
+        similarities = paper_vectors @ paper_vectors.T
+        distances = 1.0 - similarities
+        
+        # Mean distance of every paper to every group, excluding the paper itself.
+        membership = np.eye(len(groups), dtype=np.float32)[labels]  # (num_papers, num_groups)
+        sizes = membership.sum(axis=0)
+        distance_sums = distances @ membership
+        own_counts = sizes[labels] - 1
+        mean_to_groups = distance_sums / sizes
+        a = distance_sums[np.arange(len(papers)), labels] / np.maximum(own_counts, 1)
+        
+        silhouettes = None
+        if len(groups) > 1:
+            mean_to_groups[np.arange(len(papers)), labels] = np.inf
+            b = mean_to_groups.min(axis=1)
+            silhouettes = np.where(own_counts > 0, (b - a) / np.maximum(np.maximum(a, b), 1e-12), 0.0)
+        
+        results = []
+        start = 0
+        claim_start = 0
+        for group in groups:
+            end = start + len(group)
+            members = similarities[start:end, start:end]
+            n = len(group)
+            cohesion = float((members.sum() - np.trace(members)) / (n * (n - 1))) if n > 1 else 1.0
+            
+            centroid = paper_vectors[start:end].mean(axis=0)
+            centroid /= max(np.linalg.norm(centroid), 1e-12)
+            
+            consensus_distance = None
+            if len(concept_embeddings):
+                consensus_distance = float(1.0 - (concept_embeddings @ centroid).max())
+            
+            silhouette = None
+            coherence = max(cohesion, 0.0)
+            if silhouettes is not None:
+                silhouette = float(silhouettes[start:end].mean())
+                coherence = 0.5 * max(cohesion, 0.0) + 0.5 * (silhouette + 1.0) / 2.0
+            
+            claim_end = claim_start + int(claim_counts[start:end].sum())
+            claim_scores = np.clip(claim_embeddings[claim_start:claim_end] @ centroid, 0.0, 1.0)
+            group_claims = [
+                (paper.url, claim)
+                for paper, paper_claims in zip(group, claims[start:end])
+                for claim in paper_claims
+            ]
+            
+            results.append(CoherenceScores(
+                cohesion=cohesion,
+                silhouette=silhouette,
+                consensus_distance=consensus_distance,
+                coherence=float(min(max(coherence, 0.0), 1.0)),
+                claim_confidences={key: float(score) for key, score in zip(group_claims, claim_scores)},
+            ))
+            start = end
+            claim_start = claim_end
+        
+        return results
+    
+    def is_coherent(self, scores: CoherenceScores) -> bool:
+        return scores.coherence >= self.min_coherence
@@ -5,7 +5,10 @@ This module implements Phase 2 of IG-Finder: identifying innovation clusters
 that deviate from the cognitive baseline but maintain internal coherence.
 """
 
+import concurrent.futures
 import dspy
+import hashlib
+import json
 import logging
 import numpy as np
 from typing import List, Dict, Optional, Tuple, Set
@@ -13,6 +16,7 @@ from datetime import datetime
 from collections import defaultdict
 
 from ...interface import Retriever, Information, Agent
+from ...utils import canonicalize_url
 from ...dataclass import KnowledgeBase, ConversationTurn
 from ...logging_wrapper import LoggingWrapper
 from ..dataclass import (
@@ -24,6 +28,10 @@ from ..dataclass import (
     EvolutionState,
     ExtendedKnowledgeNode,
 )
+from ..cache import DeviationAnalysisStore, MetadataCache
+from ..utils import parse_number, prefix_stable_signature
+from .coherence_scoring import CoherenceScores, InternalCoherenceScorer
+from .reranker import EmbeddingReranker
 
 logger = logging.getLogger(__name__)
 
@@ -32,16 +40,21 @@ class FrontierPaperRetriever:
     """
     Retrieves frontier research papers (non-review) published after
     the temporal coverage of the cognitive baseline.
+    
+    If a reranker is given, the candidates are ranked by embedding similarity, parsed
+    publication year and (low) review likelihood instead of the year substring heuristic.
     """
     
-    def __init__(self, retriever: Retriever, top_k: int = 30):
+    def __init__(self, retriever: Retriever, top_k: int = 30, reranker: Optional[EmbeddingReranker] = None):
         self.retriever = retriever
         self.top_k = top_k
+        self.reranker = reranker
     
     def retrieve_frontier_papers(
         self,
         topic: str,
         baseline_temporal_coverage: Optional[datetime] = None,
+        exclude_urls: Optional[List[str]] = None,
     ) -> List[Information]:
         """
         Retrieve research papers (non-review) for the topic.
@@ -49,6 +62,8 @@ class FrontierPaperRetriever:
         Args:
             topic: The research topic
             baseline_temporal_coverage: End date of baseline temporal coverage
+            exclude_urls: Urls of papers already processed (e.g. the baseline reviews), compared
+                by canonical url so that arXiv/DOI variants are excluded as well
             
         Returns:
             List of Information objects containing research papers
@@ -64,23 +79,33 @@ class FrontierPaperRetriever:
             f"{topic} framework",
             f"recent advances in {topic}",
         ]
+        # Queries whose results must reflect the latest publications bypass the retrieval cache.
+        freshness_critical_queries = {f"recent advances in {topic}"}
         
         all_results = []
         for query in research_queries:
-            results = self.retriever.retrieve(query=query, exclude_urls=[])
+            results = self.retriever.retrieve(
+                query=query,
+                exclude_urls=[],
+                use_cache=query not in freshness_critical_queries,
+            )
             all_results.extend(results)
         
-        # Remove duplicates
-        seen_urls = set()
+        # Remove duplicates and already processed papers
+        seen_urls = {canonicalize_url(url) for url in exclude_urls or []}
         unique_results = []
         for result in all_results:
-            if result.url not in seen_urls:
-                seen_urls.add(result.url)
+            url = canonicalize_url(result.url)
+            if url not in seen_urls:
+                seen_urls.add(url)
                 unique_results.append(result)
         
         # Filter out review papers
         research_papers = self._filter_research_papers(unique_results)
         
+        if self.reranker is not None:
+            return self.reranker.rerank(topic, research_papers, self.top_k, prefer_reviews=False)
+        
         # Sort by recency (heuristic: prefer papers with "2023", "2024", etc. in snippets)
         sorted_papers = self._sort_by_recency(research_papers)
         
@@ -204,16 +229,63 @@ class AnalyzePaperDeviation(dspy.Signature):
     reasoning = dspy.OutputField(desc="Reasoning for the deviation assessment")
 
 
+# Inputs of AnalyzePaperDeviation that are shared by all analysis calls of a run (the expert
+# perspective only varies among a handful of values), in the order they lead the prompt.
+DEVIATION_INVARIANT_FIELDS = ["topic", "consensus_summary", "baseline_concepts", "expert_perspective"]
+
+# Version of the deviation analysis prompts. Bump it when ExtractPaperMetadata or AnalyzePaperDeviation
+# change, so that stored analyses (see DeviationAnalysisStore) are not reused.
+DEVIATION_PROMPT_VERSION = "1"
+
+
 class DifferenceAwareAnalyzer:
     """
     Performs difference-aware analysis by comparing frontier papers
     with the cognitive baseline from multiple expert perspectives.
+    
+    With the opt-in "prefix_stable" prompt layout, the run-invariant context leads the
+    deviation analysis prompt so that provider-side prompt caching can be exploited.
+    If a metadata cache is given, the metadata of a paper is only extracted once per
+    content, even across topics sharing the cache.
     """
     
-    def __init__(self, lm: dspy.LM):
+    def __init__(
+        self,
+        lm: dspy.LM,
+        prompt_layout: str = "legacy",
+        metadata_cache: Optional[MetadataCache] = None,
+    ):
         self.lm = lm
+        self.prompt_layout = prompt_layout
+        self.metadata_cache = metadata_cache
         self.paper_metadata_extractor = dspy.ChainOfThought(ExtractPaperMetadata)
-        self.deviation_analyzer = dspy.ChainOfThought(AnalyzePaperDeviation)
+        self.deviation_analyzer = dspy.ChainOfThought(
+            prefix_stable_signature(AnalyzePaperDeviation, DEVIATION_INVARIANT_FIELDS, layout=prompt_layout)
+        )
+    
+    def _extract_metadata(self, paper_info: Information) -> Dict[str, str]:
+        """Raw metadata fields of a paper, from the cache if possible."""
+        if self.metadata_cache is not None:
+            metadata = self.metadata_cache.get(
+                "paper", paper_info.url, paper_info.title, paper_info.description
+            )
+            # Entries stored before a change of the signature are extracted again.
+            if metadata is not None and set(ExtractPaperMetadata.output_fields) <= set(metadata):
+                return metadata
+        
+        with dspy.context(lm=self.lm):
+            metadata_result = self.paper_metadata_extractor(
+                title=paper_info.title,
+                abstract=paper_info.description,
+                url=paper_info.url,
+            )
+        metadata = {name: getattr(metadata_result, name) for name in ExtractPaperMetadata.output_fields}
+        
+        if self.metadata_cache is not None:
+            self.metadata_cache.set(
+                "paper", paper_info.url, paper_info.title, paper_info.description, metadata
+            )
+        return metadata
     
     def analyze_paper(
         self,
@@ -237,24 +309,19 @@ class DifferenceAwareAnalyzer:
         logger.info(f"Analyzing paper: {paper_info.title}")
         
         # Extract paper metadata
-        with dspy.context(lm=self.lm):
-            metadata_result = self.paper_metadata_extractor(
-                title=paper_info.title,
-                abstract=paper_info.description,
-                url=paper_info.url,
-            )
+        metadata = self._extract_metadata(paper_info)
         
         # Parse metadata
         try:
-            year = int(metadata_result.year.strip())
+            year = int(metadata["year"].strip())
         except:
             year = datetime.now().year
         
-        authors = [a.strip() for a in metadata_result.authors.split(',')] if metadata_result.authors != 'Unknown' else []
-        venue = metadata_result.venue if metadata_result.venue != 'Unknown' else ""
-        core_claims = [c.strip() for c in metadata_result.core_claims.split(',')]
-        methodology = metadata_result.methodology
-        key_findings = [f.strip() for f in metadata_result.key_findings.split(',')]
+        authors = [a.strip() for a in metadata["authors"].split(',')] if metadata["authors"] != 'Unknown' else []
+        venue = metadata["venue"] if metadata["venue"] != 'Unknown' else ""
+        core_claims = [c.strip() for c in metadata["core_claims"].split(',')]
+        methodology = metadata["methodology"]
+        key_findings = [f.strip() for f in metadata["key_findings"].split(',')]
         
         research_paper = ResearchPaper(
             title=paper_info.title,
@@ -295,10 +362,12 @@ class DifferenceAwareAnalyzer:
             matched_concepts = [c.strip() for c in deviation_result.matched_baseline_concepts.split(',')]
             deviation_dims = [d.strip() for d in deviation_result.deviation_dimensions.split(',')]
             
-            try:
-                deviation_score = float(deviation_result.deviation_score) / 10.0  # Normalize to 0-1
-            except:
+            deviation_score = parse_number(deviation_result.deviation_score)
+            if deviation_score is None:
+                logger.warning(f"Unparseable deviation score from {expert_name}: {deviation_result.deviation_score!r}")
                 deviation_score = 0.5
+            else:
+                deviation_score = min(max(deviation_score / 10.0, 0.0), 1.0)  # Normalize to 0-1
             
             deviation_analysis = DeviationAnalysis(
                 baseline_node_path=matched_concepts,
@@ -312,6 +381,11 @@ class DifferenceAwareAnalyzer:
         
         return research_paper, deviation_analyses
     
+    def baseline_fingerprint(self, topic: str, baseline: CognitiveBaseline) -> str:
+        """Hash of the baseline context seen by the analysis prompts."""
+        context = [topic, self._summarize_consensus(baseline), self._extract_baseline_concepts(baseline)]
+        return hashlib.sha1(json.dumps(context).encode("utf-8")).hexdigest()[:16]
+    
     def _summarize_consensus(self, baseline: CognitiveBaseline) -> str:
         """Create a summary of the cognitive baseline."""
         summary_parts = []
@@ -372,10 +446,23 @@ class InnovationClusterIdentifier:
     1. Grouping papers with similar deviation patterns
     2. Validating internal logical coherence
     3. Assigning appropriate evolution states
+    
+    Candidate groups are validated concurrently (one LM call each, at most `max_workers`
+    at a time); the resulting clusters keep the order of the candidate groups.
+    
+    If a coherence scorer is given, coherence and evidence confidence scores are computed
+    from claim embeddings, and incoherent groups are rejected before LM validation.
     """
     
-    def __init__(self, lm: dspy.LM):
+    def __init__(
+        self,
+        lm: dspy.LM,
+        max_workers: int = 4,
+        coherence_scorer: Optional[InternalCoherenceScorer] = None,
+    ):
         self.lm = lm
+        self.max_workers = max_workers
+        self.coherence_scorer = coherence_scorer
         self.cluster_identifier = dspy.ChainOfThought(IdentifyInnovationClusters)
     
     def identify_clusters(
@@ -384,6 +471,7 @@ class InnovationClusterIdentifier:
         papers_with_deviations: List[Tuple[ResearchPaper, Dict[str, DeviationAnalysis]]],
         min_cluster_size: int = 2,
         deviation_threshold: float = 0.5,
+        cognitive_baseline: Optional[CognitiveBaseline] = None,
     ) -> List[InnovationCluster]:
         """
         Identify innovation clusters from papers and their deviation analyses.
@@ -393,6 +481,7 @@ class InnovationClusterIdentifier:
             papers_with_deviations: List of (paper, deviation_analyses) tuples
             min_cluster_size: Minimum papers to form a cluster
             deviation_threshold: Minimum deviation score to consider
+            cognitive_baseline: Optional baseline, used by the coherence scorer
             
         Returns:
             List of InnovationCluster objects
@@ -425,25 +514,60 @@ class InnovationClusterIdentifier:
             dimension_groups[dim_key].append((paper, deviations, avg_dev))
         
         # Validate and create clusters
-        clusters = []
-        for dim_key, papers_in_group in dimension_groups.items():
-            if len(papers_in_group) >= min_cluster_size:
-                cluster = self._validate_and_create_cluster(
-                    topic,
-                    papers_in_group,
-                    list(dim_key),
+        candidate_groups = [
+            (papers_in_group, list(dim_key))
+            for dim_key, papers_in_group in dimension_groups.items()
+            if len(papers_in_group) >= min_cluster_size
+        ]
+        
+        coherence_scores = [None] * len(candidate_groups)
+        if self.coherence_scorer is not None and candidate_groups:
+            try:
+                coherence_scores = self.coherence_scorer.score_groups(
+                    [[paper for paper, _, _ in group] for group, _ in candidate_groups],
+                    cognitive_baseline,
                 )
-                if cluster:
-                    clusters.append(cluster)
+            except Exception as e:
+                # Fall back to LM validation alone, as without a scorer.
+                logger.error(f"Failed to compute coherence scores: {e}")
+                coherence_scores = [None] * len(candidate_groups)
+            for (_, common_dimensions), scores in zip(candidate_groups, coherence_scores):
+                if scores is not None and not self.coherence_scorer.is_coherent(scores):
+                    logger.info(f"Rejected incoherent cluster candidate {common_dimensions} (coherence {scores.coherence:.2f})")
+        
+        def validate(candidate):
+            (papers_in_group, common_dimensions), scores = candidate
+            if scores is not None and not self.coherence_scorer.is_coherent(scores):
+                return None
+            try:
+                return self._validate_and_create_cluster(topic, papers_in_group, common_dimensions, scores)
+            except Exception as e:
+                logger.error(f"Failed to validate cluster candidate {common_dimensions}: {e}")
+                return None
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(self.max_workers, 1)) as executor:
+            # map keeps the order of the candidate groups, whatever the completion order.
+            clusters = [
+                cluster
+                for cluster in executor.map(validate, zip(candidate_groups, coherence_scores))
+                if cluster
+            ]
         
         logger.info(f"Identified {len(clusters)} innovation clusters")
         return clusters
     
+    @staticmethod
+    def _stable_cluster_id(papers: List[ResearchPaper]) -> str:
+        """Cluster id derived from the paper urls, reproducible across runs and processes."""
+        digest = hashlib.sha1("\n".join(sorted(p.url for p in papers)).encode("utf-8")).hexdigest()
+        return f"cluster_{len(papers)}_{digest[:10]}"
+    
     def _validate_and_create_cluster(
         self,
         topic: str,
         papers_in_group: List[Tuple[ResearchPaper, Dict[str, DeviationAnalysis], float]],
         common_dimensions: List[str],
+        coherence_scores: Optional[CoherenceScores] = None,
     ) -> Optional[InnovationCluster]:
         """Validate cluster coherence and create InnovationCluster object."""
         
@@ -470,8 +594,8 @@ class InnovationClusterIdentifier:
             logger.info(f"Rejected cluster: {cluster_result.coherence_reasoning}")
             return None
         
-        # Calculate internal coherence score (simplified)
-        coherence_score = 0.7  # Base score for validated clusters
+        # Internal coherence score: computed from embeddings if available, else a base score
+        coherence_score = coherence_scores.coherence if coherence_scores is not None else 0.7
         
         # Create cluster
         papers = [p for p, _, _ in papers_in_group]
@@ -494,17 +618,21 @@ class InnovationClusterIdentifier:
                     paper=paper,
                     claim=claim,
                     supporting_text=paper.abstract[:200],
-                    confidence_score=0.8,
+                    confidence_score=(
+                        coherence_scores.claim_confidences.get((paper.url, claim), 0.8)
+                        if coherence_scores is not None else 0.8
+                    ),
                 ))
         
         innovation_dims = [d.strip() for d in cluster_result.innovation_dimensions.split(',')]
         
         cluster = InnovationCluster(
-            cluster_id=f"cluster_{len(papers)}_{hash(tuple(p.url for p in papers)) % 10000}",
+            cluster_id=self._stable_cluster_id(papers),
             name=cluster_result.cluster_name,
             core_papers=papers,
             deviation_from_consensus=aggregated_deviation,
             internal_coherence_score=coherence_score,
+            consensus_distance=coherence_scores.consensus_distance if coherence_scores is not None else None,
             innovation_dimensions=innovation_dims,
             supporting_evidence=evidence,
             knowledge_path=[topic] + first_deviation.baseline_node_path,
@@ -524,6 +652,10 @@ class InnovativeNonSelfIdentificationModule:
     2. Analyzing papers from multiple expert perspectives
     3. Identifying innovation clusters
     4. Updating mind map with evolution states
+    
+    With an analysis store (incremental mode), only the papers without a stored analysis for the
+    current baseline fingerprint, expert set and prompt version are analyzed, and clusters are
+    identified from the stored and new analyses.
     """
     
     def __init__(
@@ -533,13 +665,28 @@ class InnovativeNonSelfIdentificationModule:
         top_k_papers: int = 30,
         min_cluster_size: int = 2,
         deviation_threshold: float = 0.5,
+        prompt_layout: str = "legacy",
+        reranker: Optional[EmbeddingReranker] = None,
+        max_thread_num: int = 4,
+        coherence_scorer: Optional[InternalCoherenceScorer] = None,
+        metadata_cache: Optional[MetadataCache] = None,
+        analysis_store: Optional[DeviationAnalysisStore] = None,
     ):
-        self.paper_retriever = FrontierPaperRetriever(retriever, top_k=top_k_papers)
+        self.paper_retriever = FrontierPaperRetriever(retriever, top_k=top_k_papers, reranker=reranker)
         self.expert_generator = ExpertPerspectiveGenerator(analysis_lm)
-        self.deviation_analyzer = DifferenceAwareAnalyzer(analysis_lm)
-        self.cluster_identifier = InnovationClusterIdentifier(analysis_lm)
+        self.deviation_analyzer = DifferenceAwareAnalyzer(
+            analysis_lm,
+            prompt_layout=prompt_layout,
+            metadata_cache=metadata_cache,
+        )
+        self.cluster_identifier = InnovationClusterIdentifier(
+            analysis_lm,
+            max_workers=max_thread_num,
+            coherence_scorer=coherence_scorer,
+        )
         self.min_cluster_size = min_cluster_size
         self.deviation_threshold = deviation_threshold
+        self.analysis_store = analysis_store
     
     def identify_innovative_nonself(
         self,
@@ -563,10 +710,11 @@ class InnovativeNonSelfIdentificationModule:
         paper_infos = self.paper_retriever.retrieve_frontier_papers(
             topic,
             cognitive_baseline.temporal_coverage.end if cognitive_baseline.temporal_coverage.end else None,
+            exclude_urls=[review.url for review in cognitive_baseline.review_papers],
         )
         logger.info(f"Retrieved {len(paper_infos)} frontier papers")
         
-        if not paper_infos:
+        if not paper_infos and self.analysis_store is None:
             logger.warning("No frontier papers found.")
             return [], []
         
@@ -577,6 +725,16 @@ class InnovativeNonSelfIdentificationModule:
         
         # Step 3: Analyze papers from multiple perspectives
         logger.info("Step 3: Analyzing papers with difference-aware reasoning...")
+        context = None
+        if self.analysis_store is not None:
+            context = DeviationAnalysisStore.make_context(
+                self.deviation_analyzer.baseline_fingerprint(topic, cognitive_baseline),
+                expert_perspectives,
+                f"{DEVIATION_PROMPT_VERSION}-{self.deviation_analyzer.prompt_layout}",
+            )
+            paper_infos = [info for info in paper_infos if self.analysis_store.get(info.url, context) is None]
+            logger.info(f"{len(paper_infos)} papers have no stored analysis for the current baseline")
+        
         papers_with_deviations = []
         for i, paper_info in enumerate(paper_infos, 1):
             try:
@@ -588,12 +746,22 @@ class InnovativeNonSelfIdentificationModule:
                     expert_perspectives,
                 )
                 papers_with_deviations.append((paper, deviations))
+                if self.analysis_store is not None:
+                    self.analysis_store.put(paper, deviations, context)
             except Exception as e:
                 logger.error(f"Failed to analyze paper {paper_info.title}: {e}")
                 continue
         
         logger.info(f"Successfully analyzed {len(papers_with_deviations)} papers")
         
+        if self.analysis_store is not None:
+            num_stale = self.analysis_store.prune(context)
+            if num_stale:
+                logger.info(f"Dropped {num_stale} stored analyses made against another baseline")
+            self.analysis_store.save()
+            papers_with_deviations = self.analysis_store.entries(context)
+            logger.info(f"Clustering {len(papers_with_deviations)} stored and new analyses")
+        
         # Step 4: Identify innovation clusters
         logger.info("Step 4: Identifying innovation clusters...")
         innovation_clusters = self.cluster_identifier.identify_clusters(
@@ -601,6 +769,7 @@ class InnovativeNonSelfIdentificationModule:
             papers_with_deviations,
             min_cluster_size=self.min_cluster_size,
             deviation_threshold=self.deviation_threshold,
+            cognitive_baseline=cognitive_baseline,
         )
         logger.info(f"Identified {len(innovation_clusters)} innovation clusters")
         
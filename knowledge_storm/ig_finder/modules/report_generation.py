@@ -5,9 +5,12 @@ Generates comprehensive reports identifying innovation gaps for downstream
 review generation systems.
 """
 
+import concurrent.futures
 import dspy
 import logging
-from typing import List, Dict, Tuple
+import queue
+from pathlib import Path
+from typing import Callable, Iterator, List, Dict, NamedTuple, Tuple, Union
 from datetime import datetime
 
 from ...dataclass import KnowledgeBase
@@ -19,6 +22,7 @@ from ..dataclass import (
     ResearchPaper,
     DeviationAnalysis,
 )
+from ..utils import strip_stream_prefix
 
 logger = logging.getLogger(__name__)
 
@@ -57,9 +61,17 @@ class GenerateReviewRecommendations(dspy.Signature):
     recommendations = dspy.OutputField(desc="Detailed recommendations for review generation (organizational structure, innovation emphasis, citation priorities)")
 
 
+class _LMSection(NamedTuple):
+    """Placeholder for an LM-generated report field in the markdown layout."""
+    field: str
+
+
 class InnovationGapReportGenerator:
     """
     Generates comprehensive innovation gap reports.
+    
+    Use `generate_report_streaming` to write the markdown report while the LM-generated
+    sections are being produced, so readers see content within seconds.
     """
     
     def __init__(self, lm: dspy.LM):
@@ -91,36 +103,94 @@ class InnovationGapReportGenerator:
         """
         logger.info("Generating Innovation Gap Report...")
         
-        # Step 1: Summarize cognitive baseline
-        logger.info("Step 1: Summarizing cognitive baseline...")
-        baseline_summary = self._generate_baseline_summary(topic, cognitive_baseline)
+        # The steps form a small dependency graph: the baseline summary and the gap analysis
+        # are independent, recommendations only need the gap analysis, and the narrative
+        # needs the summary. The two critical-path LM calls are summary -> narrative.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            # Step 1: Summarize cognitive baseline
+            logger.info("Step 1: Summarizing cognitive baseline...")
+            summary_future = executor.submit(self._generate_baseline_summary, topic, cognitive_baseline)
+            
+            # Step 2: Perform gap analysis by dimension
+            logger.info("Step 2: Performing gap analysis by dimension...")
+            gap_analysis_by_dim = self._perform_gap_analysis(
+                topic,
+                innovation_clusters,
+                papers_with_deviations,
+            )
+            
+            # Step 3: Generate recommendations for review generation
+            logger.info("Step 3: Generating recommendations...")
+            recommendations_future = executor.submit(
+                self._generate_recommendations,
+                topic,
+                innovation_clusters,
+                gap_analysis_by_dim,
+            )
+            
+            # Step 4: Generate evolution narrative (once the summary is available)
+            baseline_summary = summary_future.result()
+            logger.info("Step 4: Generating evolution narrative...")
+            evolution_narrative = self._generate_evolution_narrative(
+                topic,
+                baseline_summary,
+                innovation_clusters,
+                mind_map_visualization_data.get("innovation_paths", []),
+            )
+            
+            # Step 5: Compile statistics
+            statistics = self._compile_statistics(
+                cognitive_baseline,
+                innovation_clusters,
+                papers_with_deviations,
+                mind_map_visualization_data,
+            )
+            
+            recommendations = recommendations_future.result()
         
-        # Step 2: Perform gap analysis by dimension
-        logger.info("Step 2: Performing gap analysis by dimension...")
-        gap_analysis_by_dim = self._perform_gap_analysis(
-            topic,
-            innovation_clusters,
-            papers_with_deviations,
+        # Create report
+        report = InnovationGapReport(
+            topic=topic,
+            generation_date=datetime.now(),
+            cognitive_baseline_summary=baseline_summary,
+            identified_clusters=innovation_clusters,
+            gap_analysis_by_dimension=gap_analysis_by_dim,
+            evolution_narrative=evolution_narrative,
+            mind_map_visualization_data=mind_map_visualization_data,
+            recommendations_for_review=recommendations,
+            statistics=statistics,
         )
         
-        # Step 3: Generate evolution narrative
-        logger.info("Step 3: Generating evolution narrative...")
-        evolution_narrative = self._generate_evolution_narrative(
-            topic,
-            baseline_summary,
-            innovation_clusters,
-            mind_map_visualization_data.get("innovation_paths", []),
-        )
+        logger.info("Innovation Gap Report generation complete")
+        return report
+    
+    def generate_report_streaming(
+        self,
+        topic: str,
+        cognitive_baseline: CognitiveBaseline,
+        innovation_clusters: List[InnovationCluster],
+        papers_with_deviations: List[Tuple[ResearchPaper, Dict[str, DeviationAnalysis]]],
+        mind_map_visualization_data: Dict,
+        output_path: Union[str, Path],
+    ) -> InnovationGapReport:
+        """
+        Generate the report while streaming its markdown version into `output_path`.
+        
+        Sections that need no LM call are written immediately; the baseline summary,
+        evolution narrative and recommendations are written token by token as the LM
+        produces them. The written file is identical to `format_report_as_markdown`
+        of the returned report.
+        
+        Returns:
+            InnovationGapReport object
+        """
+        logger.info(f"Generating Innovation Gap Report (streaming to {output_path})...")
         
-        # Step 4: Generate recommendations for review generation
-        logger.info("Step 4: Generating recommendations...")
-        recommendations = self._generate_recommendations(
+        gap_analysis_by_dim = self._perform_gap_analysis(
             topic,
             innovation_clusters,
-            gap_analysis_by_dim,
+            papers_with_deviations,
         )
-        
-        # Step 5: Compile statistics
         statistics = self._compile_statistics(
             cognitive_baseline,
             innovation_clusters,
@@ -128,39 +198,129 @@ class InnovationGapReportGenerator:
             mind_map_visualization_data,
         )
         
-        # Create report
+        # LM-generated fields are filled in as their sections are streamed.
         report = InnovationGapReport(
             topic=topic,
             generation_date=datetime.now(),
-            cognitive_baseline_summary=baseline_summary,
+            cognitive_baseline_summary="",
             identified_clusters=innovation_clusters,
             gap_analysis_by_dimension=gap_analysis_by_dim,
-            evolution_narrative=evolution_narrative,
+            evolution_narrative="",
             mind_map_visualization_data=mind_map_visualization_data,
-            recommendations_for_review=recommendations,
+            recommendations_for_review="",
             statistics=statistics,
         )
         
+        # Recommendations do not depend on any other LM section, so they are generated in the
+        # background while the preceding sections are streamed.
+        recommendations_queue: queue.Queue = queue.Queue()
+        
+        def prefetch_recommendations():
+            try:
+                for chunk in self._stream_field(
+                    self.recommendation_generator,
+                    "recommendations",
+                    self._recommendations_inputs(topic, innovation_clusters, gap_analysis_by_dim),
+                ):
+                    recommendations_queue.put(chunk)
+            finally:
+                recommendations_queue.put(None)
+        
+        def drain_recommendations() -> Iterator[str]:
+            while True:
+                chunk = recommendations_queue.get()
+                if chunk is None:
+                    break
+                yield chunk
+            recommendations_future.result()  # re-raise errors of the background generation
+        
+        section_streams: Dict[str, Callable[[], Iterator[str]]] = {
+            "cognitive_baseline_summary": lambda: self._stream_field(
+                self.baseline_summarizer,
+                "baseline_summary",
+                self._baseline_summary_inputs(topic, cognitive_baseline),
+            ),
+            "evolution_narrative": lambda: self._stream_field(
+                self.narrative_generator,
+                "evolution_narrative",
+                self._evolution_narrative_inputs(
+                    topic,
+                    report.cognitive_baseline_summary,
+                    innovation_clusters,
+                    mind_map_visualization_data.get("innovation_paths", []),
+                ),
+            ),
+            "recommendations_for_review": drain_recommendations,
+        }
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor, \
+                open(output_path, "w", encoding="utf-8") as f:
+            recommendations_future = executor.submit(prefetch_recommendations)
+            for part in self._format_markdown_parts(report):
+                if isinstance(part, _LMSection):
+                    logger.info(f"Streaming section: {part.field}")
+                    chunks = []
+                    for chunk in section_streams[part.field]():
+                        f.write(chunk)
+                        f.flush()
+                        chunks.append(chunk)
+                    setattr(report, part.field, "".join(chunks))
+                else:
+                    f.write(part)
+                    f.flush()
+        
         logger.info("Innovation Gap Report generation complete")
         return report
     
-    def _generate_baseline_summary(self, topic: str, baseline: CognitiveBaseline) -> str:
-        """Generate summary of cognitive baseline."""
+    def _stream_field(self, predictor: dspy.Module, output_field: str, inputs: Dict[str, str]) -> Iterator[str]:
+        """
+        Stream a single output field of the predictor's signature directly from the LM.
+        
+        Falls back to a regular (non-streaming) prediction if the LM cannot stream.
+        """
+        signature = predictor.signature
+        if not hasattr(self.lm, "stream"):
+            with dspy.context(lm=self.lm):
+                result = predictor(**inputs)
+            yield getattr(result, output_field)
+            return
+        
+        def field_prefix(name: str) -> str:
+            extra = signature.fields[name].json_schema_extra or {}
+            return extra.get("prefix") or name.replace("_", " ").title() + ":"
+        
+        output_desc = (signature.output_fields[output_field].json_schema_extra or {}).get("desc", output_field)
+        prompt_parts = [signature.instructions, "---"]
+        for name in signature.input_fields:
+            prompt_parts.append(f"{field_prefix(name)} {inputs[name]}")
+        prompt_parts.append(f"Write the {field_prefix(output_field)[:-1]}: {output_desc}. Respond with the text only.")
+        
+        yield from strip_stream_prefix(
+            self.lm.stream("\n\n".join(prompt_parts)),
+            [field_prefix(output_field)],
+        )
+    
+    def _baseline_summary_inputs(self, topic: str, baseline: CognitiveBaseline) -> Dict[str, str]:
+        """Prepare the inputs of the baseline summary."""
         paradigms_str = "; ".join([f"{p.name}: {p.description}" for p in baseline.research_paradigms[:5]])
         methods_str = "; ".join([f"{m.name}: {m.description}" for m in baseline.mainstream_methods[:5]])
         boundaries_str = "; ".join([f"{b.dimension}: {b.description}" for b in baseline.knowledge_boundaries.values()])
         
         temporal_str = f"{baseline.temporal_coverage.start.year if baseline.temporal_coverage.start else 'Unknown'} to {baseline.temporal_coverage.end.year if baseline.temporal_coverage.end else 'Unknown'}"
         
+        return dict(
+            topic=topic,
+            num_reviews=str(len(baseline.review_papers)),
+            paradigms=paradigms_str if paradigms_str else "None identified",
+            methods=methods_str if methods_str else "None identified",
+            boundaries=boundaries_str if boundaries_str else "None identified",
+            temporal_coverage=temporal_str,
+        )
+    
+    def _generate_baseline_summary(self, topic: str, baseline: CognitiveBaseline) -> str:
+        """Generate summary of cognitive baseline."""
         with dspy.context(lm=self.lm):
-            result = self.baseline_summarizer(
-                topic=topic,
-                num_reviews=str(len(baseline.review_papers)),
-                paradigms=paradigms_str if paradigms_str else "None identified",
-                methods=methods_str if methods_str else "None identified",
-                boundaries=boundaries_str if boundaries_str else "None identified",
-                temporal_coverage=temporal_str,
-            )
+            result = self.baseline_summarizer(**self._baseline_summary_inputs(topic, baseline))
         
         return result.baseline_summary
     
@@ -217,14 +377,14 @@ class InnovationGapReportGenerator:
         
         return gap_analyses
     
-    def _generate_evolution_narrative(
+    def _evolution_narrative_inputs(
         self,
         topic: str,
         baseline_summary: str,
         innovation_clusters: List[InnovationCluster],
         innovation_paths: List[List[str]],
-    ) -> str:
-        """Generate evolution narrative."""
+    ) -> Dict[str, str]:
+        """Prepare the inputs of the evolution narrative."""
         # Prepare innovation clusters description
         clusters_desc = []
         for i, cluster in enumerate(innovation_clusters[:5], 1):
@@ -239,23 +399,35 @@ class InnovationGapReportGenerator:
             paths_desc.append(f"{i}. {' → '.join(path)}")
         paths_str = "\n".join(paths_desc) if paths_desc else "No clear paths identified"
         
+        return dict(
+            topic=topic,
+            baseline_summary=baseline_summary,
+            innovation_clusters=clusters_str,
+            innovation_paths=paths_str,
+        )
+    
+    def _generate_evolution_narrative(
+        self,
+        topic: str,
+        baseline_summary: str,
+        innovation_clusters: List[InnovationCluster],
+        innovation_paths: List[List[str]],
+    ) -> str:
+        """Generate evolution narrative."""
         with dspy.context(lm=self.lm):
             result = self.narrative_generator(
-                topic=topic,
-                baseline_summary=baseline_summary,
-                innovation_clusters=clusters_str,
-                innovation_paths=paths_str,
+                **self._evolution_narrative_inputs(topic, baseline_summary, innovation_clusters, innovation_paths)
             )
         
         return result.evolution_narrative
     
-    def _generate_recommendations(
+    def _recommendations_inputs(
         self,
         topic: str,
         innovation_clusters: List[InnovationCluster],
         gap_analysis: Dict[str, GapAnalysis],
-    ) -> str:
-        """Generate recommendations for review generation."""
+    ) -> Dict[str, str]:
+        """Prepare the inputs of the review recommendations."""
         # Prepare cluster descriptions
         clusters_desc = []
         for cluster in innovation_clusters:
@@ -272,11 +444,22 @@ class InnovationGapReportGenerator:
             )
         gaps_str = "\n".join(gaps_desc) if gaps_desc else "No gaps identified"
         
+        return dict(
+            topic=topic,
+            innovation_clusters=clusters_str,
+            gap_analysis=gaps_str,
+        )
+    
+    def _generate_recommendations(
+        self,
+        topic: str,
+        innovation_clusters: List[InnovationCluster],
+        gap_analysis: Dict[str, GapAnalysis],
+    ) -> str:
+        """Generate recommendations for review generation."""
         with dspy.context(lm=self.lm):
             result = self.recommendation_generator(
-                topic=topic,
-                innovation_clusters=clusters_str,
-                gap_analysis=gaps_str,
+                **self._recommendations_inputs(topic, innovation_clusters, gap_analysis)
             )
         
         return result.recommendations
@@ -307,6 +490,13 @@ class InnovationGapReportGenerator:
     
     def format_report_as_markdown(self, report: InnovationGapReport) -> str:
         """Format report as markdown for easy reading."""
+        return "".join(
+            getattr(report, part.field) if isinstance(part, _LMSection) else part
+            for part in self._format_markdown_parts(report)
+        )
+    
+    def _format_markdown_parts(self, report: InnovationGapReport) -> List[Union[str, _LMSection]]:
+        """Markdown layout of the report, with `_LMSection` placeholders for LM-generated text."""
         md_parts = []
         
         # Header
@@ -322,7 +512,7 @@ class InnovationGapReportGenerator:
         
         # Part I: Cognitive Baseline
         md_parts.append("\n## Part I: Cognitive Baseline\n")
-        md_parts.append(report.cognitive_baseline_summary)
+        md_parts.append(_LMSection("cognitive_baseline_summary"))
         md_parts.append("\n")
         
         # Part II: Innovation Clusters
@@ -338,6 +528,8 @@ class InnovationGapReportGenerator:
                 md_parts.append(f"  ... and {len(cluster.core_papers) - 5} more\n")
             md_parts.append(f"\n**Innovation Dimensions:** {', '.join(cluster.innovation_dimensions)}\n\n")
             md_parts.append(f"**Internal Coherence Score:** {cluster.internal_coherence_score:.2f}\n\n")
+            if cluster.consensus_distance is not None:
+                md_parts.append(f"**Distance to Consensus:** {cluster.consensus_distance:.2f}\n\n")
             md_parts.append(f"**Deviation from Consensus:** {cluster.deviation_from_consensus.deviation_description}\n\n")
             md_parts.append(f"**Potential Impact:** {cluster.potential_impact}\n\n")
         
@@ -356,7 +548,7 @@ class InnovationGapReportGenerator:
         
         # Part IV: Evolution Narrative
         md_parts.append("\n## Part IV: Knowledge Evolution Narrative\n")
-        md_parts.append(report.evolution_narrative)
+        md_parts.append(_LMSection("evolution_narrative"))
         md_parts.append("\n")
         
         # Part V: Mind Map Visualization
@@ -368,7 +560,7 @@ class InnovationGapReportGenerator:
         
         # Part VI: Recommendations
         md_parts.append("\n## Part VI: Recommendations for Review Generation\n")
-        md_parts.append(report.recommendations_for_review)
+        md_parts.append(_LMSection("recommendations_for_review"))
         md_parts.append("\n")
         
         # Statistics Appendix
@@ -377,4 +569,4 @@ class InnovationGapReportGenerator:
             if key != "evolution_state_distribution":
                 md_parts.append(f"- **{key}:** {value}\n")
         
-        return "".join(md_parts)
+        return md_parts
@@ -0,0 +1,131 @@
+"""
+Embedding Reranker
+
+Optional reranking stage for the review and frontier paper retrievers. Candidates are
+scored locally from their embeddings, so a larger candidate pool can be reranked
+without any LM call.
+"""
+
+import logging
+import re
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+
+from ...interface import Information
+
+logger = logging.getLogger(__name__)
+
+
+_YEAR_PATTERN = re.compile(r"\b(19[5-9]\d|20\d\d)\b")
+
+
+class EmbeddingReranker:
+    """
+    Reranks candidate papers by combining three signals, all computed in batch:
+    - semantic relevance: cosine similarity between the topic and the title + abstract
+    - recency: exponential decay of the age of the paper, from the year in its metadata or text
+    - review likelihood: how much closer the paper is to a "survey" prototype than to a
+      "research paper" prototype
+    
+    The topic, the prototypes and all candidates are embedded with a single encoder call and
+    scored with one matrix product.
+    """
+    
+    def __init__(
+        self,
+        encoder,
+        relevance_weight: float = 1.0,
+        recency_weight: float = 0.3,
+        review_weight: float = 0.5,
+        recency_half_life: float = 3.0,
+    ):
+        """
+        Args:
+            encoder: Embedding model with an `encode(texts) -> np.ndarray` method (e.g. `Encoder`).
+            relevance_weight: Weight of the semantic relevance to the topic.
+            recency_weight: Weight of the recency score (in [0, 1], 0 for papers without a year).
+            review_weight: Weight of the review likelihood. It is added when selecting reviews and
+                subtracted when selecting research papers.
+            recency_half_life: Age (in years) at which the recency score is halved.
+        """
+        self.encoder = encoder
+        self.relevance_weight = relevance_weight
+        self.recency_weight = recency_weight
+        self.review_weight = review_weight
+        self.recency_half_life = recency_half_life
+    
+    @staticmethod
+    def _candidate_text(info: Information) -> str:
+        return f"{info.title}\n{info.description}"
+    
+    @staticmethod
+    def parse_year(info: Information) -> Optional[int]:
+        """Publication year from the result metadata, or the latest plausible year mentioned in its text."""
+        current_year = datetime.now().year
+        year = info.meta.get("year") if info.meta else None
+        if isinstance(year, int) and 1950 <= year <= current_year:
+            return year
+        
+        text = " ".join([info.title, info.description] + list(info.snippets))
+        years = [int(y) for y in _YEAR_PATTERN.findall(text) if int(y) <= current_year]
+        return max(years) if years else None
+    
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.asarray(self.encoder.encode(texts), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+    
+    def score(self, topic: str, candidates: List[Information], prefer_reviews: bool) -> np.ndarray:
+        """
+        Score the candidates for a topic.
+        
+        Args:
+            topic: The research topic
+            candidates: Candidate papers
+            prefer_reviews: Whether reviews (True) or research papers (False) are wanted
+        
+        Returns:
+            Array of scores, higher is better
+        """
+        if not candidates:
+            return np.zeros(0, dtype=np.float32)
+        
+        embeddings = self._embed(
+            [
+                topic,
+                f"A comprehensive survey and review of {topic}",
+                f"We propose a novel method for {topic} and evaluate it in experiments",
+            ]
+            + [self._candidate_text(info) for info in candidates]
+        )
+        queries, documents = embeddings[:3], embeddings[3:]
+        similarities = documents @ queries.T  # (num_candidates, 3)
+        
+        relevance = similarities[:, 0]
+        review_likelihood = similarities[:, 1] - similarities[:, 2]
+        
+        years = np.array(
+            [self.parse_year(info) or np.nan for info in candidates], dtype=np.float32
+        )
+        age = np.maximum(datetime.now().year - years, 0)
+        recency = np.nan_to_num(np.exp2(-age / self.recency_half_life), nan=0.0)
+        
+        return (
+            self.relevance_weight * relevance
+            + self.recency_weight * recency
+            + (1 if prefer_reviews else -1) * self.review_weight * review_likelihood
+        )
+    
+    def rerank(
+        self,
+        topic: str,
+        candidates: List[Information],
+        top_k: int,
+        prefer_reviews: bool,
+    ) -> List[Information]:
+        """Return the top_k candidates, best first."""
+        scores = self.score(topic, candidates, prefer_reviews)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [candidates[i] for i in order]
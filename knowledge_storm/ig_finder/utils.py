@@ -0,0 +1,298 @@
+"""
+Utilities for IG-Finder framework.
+
+Includes tolerant parsing of LM outputs that are expected to contain JSON,
+prefix stripping of streamed LM outputs, and prompt layout helpers for dspy
+signatures.
+"""
+
+import json
+import re
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Type
+
+import dspy
+
+
+_LITERALS = {"True": "true", "False": "false", "None": "null", "NaN": "null"}
+
+
+# What may follow the opening bracket of a JSON payload, as opposed to bracketed prose
+# such as "[see below]". Objects must start with a (possibly single-quoted) key.
+_PAYLOAD_START = {
+    "{": re.compile(r"""\s*["'}]"""),
+    "[": re.compile(r"""\s*(?:["'{\[\]]|-?\d|(?:true|false|null|True|False|None|NaN)\b)"""),
+}
+
+
+class _JSONRepairer:
+    """
+    Tolerant JSON parser for LM outputs, reading a single payload from its first bracket.
+    
+    It repairs the usual LM mistakes:
+    - prose or markdown code fences after the JSON payload
+    - single-quoted strings and Python literals (True/False/None)
+    - raw newlines inside strings and trailing commas
+    - truncated output (open strings and containers are closed, a dangling
+      incomplete element is dropped); `truncated` tells whether this was needed
+    """
+    
+    def __init__(self, text: str):
+        self._out: List[str] = []
+        self._stack: List[str] = []  # open containers, "{" or "["
+        self._quote: Optional[str] = None  # quote char of the open string, if any
+        self._escape = False
+        self._word: List[str] = []  # bare word (number or literal) being read
+        self._started = False
+        self.complete = False
+        # (output length, open containers) at each point where the output can be cut
+        self._checkpoints: List[Tuple[int, Tuple[str, ...]]] = []
+        for char in text:
+            if self.complete:
+                break
+            self._feed_char(char)
+    
+    def _feed_char(self, char: str):
+        if not self._started:
+            if char not in "{[":
+                return  # skip leading whitespace
+            self._started = True
+        
+        if self._quote is not None:
+            self._feed_string_char(char)
+            return
+        
+        if char.isalnum() or char in "+-._":
+            self._word.append(char)
+            return
+        self._flush_word()
+        
+        if char in "\"'":
+            self._quote = char
+            self._out.append('"')
+        elif char in "{[":
+            self._stack.append(char)
+            self._out.append(char)
+            if char == "[":
+                self._checkpoints.append((len(self._out), tuple(self._stack)))
+        elif char in "}]":
+            self._strip_trailing_comma()
+            if self._stack:
+                self._stack.pop()
+            self._out.append("}" if char == "}" else "]")
+            if not self._stack:
+                self.complete = True
+        elif char == ",":
+            self._strip_trailing_comma()
+            self._checkpoints.append((len(self._out), tuple(self._stack)))
+            self._out.append(char)
+        elif char in ":" or char.isspace():
+            self._out.append(char)
+    
+    def _feed_string_char(self, char: str):
+        if self._escape:
+            self._escape = False
+            if char == "'":
+                self._out.append("'")
+            elif char in '"\\/bfnrtu':
+                self._out.append("\\" + char)
+            else:
+                self._out.append("\\\\" + char)  # keep an invalid escape as a literal backslash
+        elif char == "\\":
+            self._escape = True
+        elif char == self._quote:
+            self._quote = None
+            self._out.append('"')
+        elif char == '"':
+            self._out.append('\\"')
+        elif char == "\n":
+            self._out.append("\\n")
+        elif char == "\t":
+            self._out.append("\\t")
+        elif char == "\r":
+            pass
+        else:
+            self._out.append(char)
+    
+    def _flush_word(self):
+        if self._word:
+            word = "".join(self._word)
+            self._out.append(_LITERALS.get(word, word))
+            self._word = []
+    
+    def _strip_trailing_comma(self):
+        i = len(self._out) - 1
+        while i >= 0 and self._out[i].isspace():
+            i -= 1
+        if i >= 0 and self._out[i] == ",":
+            del self._out[i:]
+    
+    @property
+    def truncated(self) -> bool:
+        """Whether the payload is still open, so `value()` has to close it (e.g. output cut at max_tokens)."""
+        return self._started and not self.complete
+    
+    @staticmethod
+    def _close(text: str, stack) -> str:
+        text = text.rstrip().rstrip(",:").rstrip()
+        return text + "".join("}" if c == "{" else "]" for c in reversed(stack))
+    
+    def value(self) -> Any:
+        """
+        Return the parsed (and repaired) value of the payload.
+        
+        Raises:
+            ValueError: If no JSON object or array could be recovered.
+        """
+        if not self._started:
+            raise ValueError("No JSON object or array found in the output.")
+        
+        text = "".join(self._out)
+        if self._word:
+            text += _LITERALS.get("".join(self._word), "".join(self._word))
+        if self._quote is not None:
+            text += '"'
+        
+        candidates = [self._close(text, self._stack)]
+        if not self.complete:
+            # Fall back to dropping the trailing (incomplete) element.
+            for length, stack in reversed(self._checkpoints):
+                candidates.append(self._close("".join(self._out[:length]), stack))
+        
+        for candidate in candidates:
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+        raise ValueError("Could not repair the JSON output.")
+
+
+def parse_json_output(
+    text: str,
+    expected_type: Optional[type] = None,
+    key: Optional[str] = None,
+    allow_truncated: bool = False,
+) -> Any:
+    """
+    Parse (and repair if needed) JSON produced by an LM.
+    
+    The payload starts at the first '{' or '[' that is followed by JSON content, so
+    bracketed prose before it (e.g. 'Here [see below]: [1, 2]') is skipped. A payload
+    that cannot be repaired is an error; later spans (e.g. an inner object of a
+    malformed list) are never taken for it.
+    
+    Args:
+        text: Raw LM output.
+        expected_type: Optional expected type of the value (list or dict).
+        key: Optional field name. An object wrapping the value under this key
+            (as returned by JSON mode, which requires a top-level object) is unwrapped.
+        allow_truncated: Whether to accept a truncated payload, repaired by closing it.
+            Otherwise truncated output is an error, as the repaired value may be missing
+            content.
+    
+    Returns:
+        The parsed value.
+    
+    Raises:
+        ValueError: If the output cannot be parsed, is truncated or has the wrong type.
+    """
+    if text is None:
+        raise ValueError("Empty output.")
+    
+    start = next(
+        (m.start() for m in re.finditer(r"[\[{]", text) if _PAYLOAD_START[m.group()].match(text, m.end())),
+        None,
+    )
+    if start is None:
+        raise ValueError("No JSON object or array found in the output.")
+    parser = _JSONRepairer(text[start:])
+    value = parser.value()
+    if parser.truncated and not allow_truncated:
+        raise ValueError("Truncated JSON output.")
+    
+    if key is not None and isinstance(value, dict) and key in value:
+        # A dict value is only unwrapped if the key is its sole entry.
+        if expected_type is not dict or list(value.keys()) == [key]:
+            value = value[key]
+    
+    if expected_type is list and isinstance(value, dict):
+        # A single object where a list of objects was expected.
+        value = [value]
+    if expected_type is not None and not isinstance(value, expected_type):
+        raise ValueError(f"Expected {expected_type.__name__}, got {type(value).__name__}.")
+    return value
+
+
+def parse_number(text: str) -> Optional[float]:
+    """Parse the first number in an LM output such as '7', '7/10' or 'Score: 7.5 out of 10'."""
+    if text is None:
+        return None
+    match = re.search(r"-?\d+(?:\.\d+)?", str(text))
+    return float(match.group(0)) if match else None
+
+
+def strip_stream_prefix(chunks: Iterable[str], prefixes: List[str]) -> Iterator[str]:
+    """
+    Incrementally strip a leading field label (e.g. "Baseline Summary:") from a streamed LM output.
+    
+    Only the first few characters are buffered until it is known whether the stream starts with
+    one of `prefixes` (case-insensitive); everything after that is passed through unchanged.
+    """
+    max_len = max((len(p) for p in prefixes), default=0)
+    buffer = ""
+    chunks = iter(chunks)
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer.lstrip()) >= max_len:
+            break
+    
+    stripped = buffer.lstrip()
+    for prefix in prefixes:
+        if stripped.lower().startswith(prefix.lower()):
+            stripped = stripped[len(prefix):].lstrip()
+            break
+    if stripped:
+        yield stripped
+    yield from chunks
+
+
+PROMPT_LAYOUTS = ("prefix_stable", "legacy")
+
+
+def prefix_stable_signature(
+    signature: Type[dspy.Signature],
+    invariant_fields: List[str],
+    layout: str = "prefix_stable",
+) -> Type[dspy.Signature]:
+    """
+    Reorder the input fields of a signature so that run-invariant context comes first.
+    
+    Providers cache prompts by their leading prefix, so putting the context shared by
+    many calls (topic, consensus, ...) before per-item content (paper title, content)
+    lets repeated calls reuse the cached prefix, reducing latency and input cost.
+    
+    Args:
+        signature: The dspy signature to reorder.
+        invariant_fields: Input fields shared across calls, in the desired order.
+        layout: "prefix_stable" to reorder, or "legacy" to return the signature unchanged.
+    
+    Returns:
+        A signature with the same fields and instructions, and the reordered input fields.
+    """
+    if layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unknown prompt layout {layout!r}, expected one of {PROMPT_LAYOUTS}.")
+    if layout == "legacy":
+        return signature
+    
+    unknown = [name for name in invariant_fields if name not in signature.input_fields]
+    if unknown:
+        raise ValueError(f"Fields {unknown} are not input fields of {signature.__name__}.")
+    
+    ordered_inputs = list(invariant_fields) + [
+        name for name in signature.input_fields if name not in invariant_fields
+    ]
+    fields = {name: signature.input_fields[name] for name in ordered_inputs}
+    fields.update(signature.output_fields)
+    
+    namespace = {"__doc__": signature.instructions, **fields}
+    namespace["__annotations__"] = {name: field.annotation or str for name, field in fields.items()}
+    return type(signature)(f"PrefixStable{signature.__name__}", (dspy.Signature,), namespace)
@@ -1,15 +1,27 @@
+import asyncio
 import concurrent.futures
+import copy
 import dspy
 import functools
 import hashlib
 import json
 import logging
+import threading
 import time
 from abc import ABC, abstractmethod
 from collections import OrderedDict
 from typing import Dict, List, Optional, Union, TYPE_CHECKING
 
-from .utils import ArticleTextProcessing
+from .utils import (
+    ArticleTextProcessing,
+    BM25Index,
+    RetrievalCache,
+    canonicalize_url,
+    get_http_client_pool,
+    in_event_loop,
+    reciprocal_rank_fusion,
+    run_async,
+)
 
 logging.basicConfig(
     level=logging.INFO, format="%(name)s : %(levelname)-8s : %(message)s"
@@ -66,14 +78,7 @@ class Information:
         self.url = url
         self.meta = meta if meta is not None else {}
         self.citation_uuid = -1
-
-    def __hash__(self):
-        return hash(
-            (
-                self.url,
-                tuple(sorted(self.snippets)),
-            )
-        )
+        self._hash = None
 
     def __eq__(self, other):
         if not isinstance(other, Information):
@@ -85,10 +90,32 @@ class Information:
         )
 
     def __hash__(self):
-        return int(
-            self._md5_hash((self.url, tuple(sorted(self.snippets)), self._meta_str())),
-            16,
-        )
+        # The hash is cached. Once hashed, the url, snippets and question/query meta must
+        # only be changed through `merge`, which resets it.
+        if (
+            getattr(self, "_hash", None) is None
+        ):  # also objects unpickled from older versions
+            self._hash = int(
+                self._md5_hash(
+                    (self.url, tuple(sorted(self.snippets)), self._meta_str())
+                ),
+                16,
+            )
+        return self._hash
+
+    def merge(self, other: "Information"):
+        """Merge a duplicate hit of the same source into this object.
+
+        New snippets are appended, and the longer description and a missing title are taken over.
+        """
+        new_snippets = [s for s in other.snippets if s not in self.snippets]
+        if new_snippets:
+            self.snippets = self.snippets + new_snippets
+            self._hash = None
+        if len(other.description) > len(self.description):
+            self.description = other.description
+        if not self.title:
+            self.title = other.title
 
     def _meta_str(self):
         """Generate a string representation of relevant meta information."""
@@ -257,6 +284,46 @@ class Article(ABC):
             return node
 
 
+class InformationRegistry:
+    """
+    Interning registry of retrieved information, keyed by canonical url (see `canonicalize_url`).
+
+    Every hit of the same source, whichever query or stage retrieved it, is merged into a single
+    `Information` object, so downstream stages process each source (and pay LM calls for it) once.
+    """
+
+    def __init__(self):
+        self._by_url: Dict[str, Information] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_url)
+
+    def __contains__(self, url: str) -> bool:
+        return canonicalize_url(url) in self._by_url
+
+    def get(self, url: str) -> Optional[Information]:
+        return self._by_url.get(canonicalize_url(url))
+
+    def intern(self, info: Information) -> Information:
+        """Return the registered object for the source of `info`, merging `info` into it."""
+        url = canonicalize_url(info.url)
+        with self._lock:
+            existing = self._by_url.get(url)
+            if existing is None:
+                # The canonical url is only the key; the first-seen url is kept for display.
+                info.meta.setdefault("queries", [])
+                if "query" in info.meta:
+                    info.meta["queries"].append(info.meta["query"])
+                self._by_url[url] = info
+                return info
+            existing.merge(info)
+            query = info.meta.get("query")
+            if query is not None and query not in existing.meta["queries"]:
+                existing.meta["queries"].append(query)
+            return existing
+
+
 class Retriever:
     """
     An abstract base class for retriever modules. It provides a template for retrieving information based on a query.
@@ -266,14 +333,44 @@ class Retriever:
     The retrieval model/search engine used for each part should be declared with a suffix '_rm' in the attribute name.
     """
 
-    def __init__(self, rm: dspy.Retrieve, max_thread: int = 1):
+    def __init__(
+        self,
+        rm: dspy.Retrieve,
+        max_thread: int = 1,
+        cache: Optional[RetrievalCache] = None,
+        registry: Optional[InformationRegistry] = None,
+    ):
+        """
+        Args:
+            rm: The retrieval module.
+            max_thread: Maximum number of threads used to issue the queries of `retrieve`. When called from
+                a running event loop, rms supporting `abatch` issue them concurrently on an event loop instead.
+            cache: Optional persistent cache of the rm results. Queries are only sent to the rm on a cache miss.
+            registry: Optional registry interning the results by canonical url. Duplicate hits are then
+                merged into one `Information` and returned once.
+        """
         self.max_thread = max_thread
         self.rm = rm
+        self.cache = cache
+        self.registry = registry
+
+    def with_registry(
+        self, registry: Optional[InformationRegistry] = None
+    ) -> "Retriever":
+        """Return a shallow copy interning its results in `registry` (a new one by default).
+
+        The copy shares the rm and the cache with this retriever, which is left unchanged.
+        """
+        view = copy.copy(self)
+        view.registry = registry if registry is not None else InformationRegistry()
+        return view
 
     def collect_and_reset_rm_usage(self):
         combined_usage = []
         if hasattr(getattr(self, "rm"), "get_usage_and_reset"):
             combined_usage.append(getattr(self, "rm").get_usage_and_reset())
+        if self.cache is not None:
+            combined_usage.append(self.cache.get_usage_and_reset())
 
         name_to_usage = {}
         for usage in combined_usage:
@@ -285,39 +382,271 @@ class Retriever:
 
         return name_to_usage
 
-    def retrieve(
-        self, query: Union[str, List[str]], exclude_urls: List[str] = []
+    @staticmethod
+    def _to_information(
+        retrieved_data_list: List[Dict], query: str
     ) -> List[Information]:
-        queries = query if isinstance(query, list) else [query]
         to_return = []
+        for data in retrieved_data_list:
+            for i in range(len(data["snippets"])):
+                # STORM generate the article with citations. We do not consider multi-hop citations.
+                # Remove citations in the source to avoid confusion.
+                data["snippets"][i] = ArticleTextProcessing.remove_citations(
+                    data["snippets"][i]
+                )
+            storm_info = Information.from_dict(data)
+            storm_info.meta["query"] = query
+            to_return.append(storm_info)
+        return to_return
 
-        def process_query(q):
-            retrieved_data_list = self.rm(
-                query_or_queries=[q], exclude_urls=exclude_urls
+    def _lookup_cache(
+        self, queries: List[str], exclude_urls: List[str], use_cache: bool
+    ) -> Dict[str, List[Dict]]:
+        """Return the cached rm results of the queries that hit the cache."""
+        if self.cache is None or not use_cache:
+            return {}
+        cached = {}
+        for q in queries:
+            retrieved_data_list = self.cache.get(self.rm, q, exclude_urls)
+            if retrieved_data_list is not None:
+                cached[q] = retrieved_data_list
+        return cached
+
+    def _collect(
+        self,
+        queries: List[str],
+        exclude_urls: List[str],
+        cached: Dict[str, List[Dict]],
+        fetched: Dict[str, List[Dict]],
+    ) -> List[Information]:
+        if self.cache is not None:
+            # Entries are refreshed even if the lookup was skipped, so the fresh results are reused later.
+            # Results of failed searches (see `SearchResults`) are left out by the cache.
+            for q, retrieved_data_list in fetched.items():
+                self.cache.set(self.rm, q, exclude_urls, retrieved_data_list)
+
+        to_return = []
+        for q in queries:
+            retrieved_data_list = fetched[q] if q in fetched else cached[q]
+            to_return.extend(self._to_information(retrieved_data_list, q))
+        return self._intern(to_return)
+
+    def _intern(self, infos: List[Information]) -> List[Information]:
+        """Replace the results by their interned objects, each returned once."""
+        if self.registry is None:
+            return infos
+        return list(
+            {id(info): info for info in map(self.registry.intern, infos)}.values()
+        )
+
+    async def aretrieve(
+        self,
+        query: Union[str, List[str]],
+        exclude_urls: List[str] = [],
+        use_cache: bool = True,
+    ) -> List[Information]:
+        """Asynchronous version of `retrieve`. All queries are issued concurrently if the rm supports it."""
+        queries = query if isinstance(query, list) else [query]
+        cached = self._lookup_cache(queries, exclude_urls, use_cache)
+        misses = list(dict.fromkeys(q for q in queries if q not in cached))
+
+        if hasattr(self.rm, "abatch"):
+            results = await self.rm.abatch(misses, exclude_urls=exclude_urls)
+        else:
+            results = await asyncio.gather(
+                *(
+                    asyncio.to_thread(
+                        self.rm, query_or_queries=[q], exclude_urls=exclude_urls
+                    )
+                    for q in misses
+                )
             )
-            local_to_return = []
-            for data in retrieved_data_list:
-                for i in range(len(data["snippets"])):
-                    # STORM generate the article with citations. We do not consider multi-hop citations.
-                    # Remove citations in the source to avoid confusion.
-                    data["snippets"][i] = ArticleTextProcessing.remove_citations(
-                        data["snippets"][i]
+
+        return self._collect(queries, exclude_urls, cached, dict(zip(misses, results)))
+
+    def retrieve(
+        self,
+        query: Union[str, List[str]],
+        exclude_urls: List[str] = [],
+        use_cache: bool = True,
+    ) -> List[Information]:
+        """Retrieve information for the query or queries.
+
+        Args:
+            query: The query or queries.
+            exclude_urls: Urls to exclude from the results.
+            use_cache: Whether cached results may be used (if a cache is set). Disable it for
+                freshness-critical queries; their fresh results still update the cache.
+        """
+        queries = query if isinstance(query, list) else [query]
+
+        if hasattr(self.rm, "abatch") and in_event_loop():
+            # Called from a coroutine: the rm issues all queries concurrently on a fresh event loop
+            # in a worker thread, whose async HTTP client is closed before the loop ends.
+            async def aretrieve_and_close():
+                try:
+                    return await self.aretrieve(
+                        queries, exclude_urls=exclude_urls, use_cache=use_cache
                     )
-                storm_info = Information.from_dict(data)
-                storm_info.meta["query"] = q
-                local_to_return.append(storm_info)
-            return local_to_return
+                finally:
+                    await get_http_client_pool().aclose()
+
+            return run_async(aretrieve_and_close())
+
+        cached = self._lookup_cache(queries, exclude_urls, use_cache)
+        misses = list(dict.fromkeys(q for q in queries if q not in cached))
+
+        def process_query(q):
+            return self.rm(query_or_queries=[q], exclude_urls=exclude_urls)
 
         with concurrent.futures.ThreadPoolExecutor(
             max_workers=self.max_thread
         ) as executor:
-            results = list(executor.map(process_query, queries))
+            results = list(executor.map(process_query, misses))
+
+        return self._collect(queries, exclude_urls, cached, dict(zip(misses, results)))
+
+
+class HybridRetriever(Retriever):
+    """
+    Retriever fusing the results of several retrievers (e.g. web search and a local vector or BM25
+    index) with reciprocal rank fusion.
+
+    For each query, the ranking of every underlying retriever is fused with a lexical ranking of
+    the pooled candidates by an in-memory BM25 index, so results found by several sources or
+    matching the query closely rise to the top without extra LM calls. Results with the same url
+    are merged into one `Information` carrying the snippets of all hits.
+    """
+
+    def __init__(
+        self,
+        retrievers: List[Retriever],
+        rrf_k: int = 60,
+        use_lexical_ranking: bool = True,
+        max_results_per_query: Optional[int] = None,
+        registry: Optional[InformationRegistry] = None,
+    ):
+        """
+        Args:
+            retrievers: The underlying retrievers, each with its own rm and optional cache.
+            rrf_k: Constant k of reciprocal rank fusion; larger values flatten the rank weights.
+            use_lexical_ranking: Whether to add the BM25 ranking of the pooled candidates to the fusion.
+            max_results_per_query: Optional number of fused results kept per query.
+            registry: Optional registry interning the fused results by canonical url.
+        """
+        if not retrievers:
+            raise ValueError("Please provide at least one retriever.")
+        super().__init__(rm=None, max_thread=len(retrievers), registry=registry)
+        self.retrievers = retrievers
+        self.rrf_k = rrf_k
+        self.use_lexical_ranking = use_lexical_ranking
+        self.max_results_per_query = max_results_per_query
+
+    def collect_and_reset_rm_usage(self):
+        name_to_usage = {}
+        for retriever in self.retrievers:
+            for model_name, query_cnt in retriever.collect_and_reset_rm_usage().items():
+                name_to_usage[model_name] = name_to_usage.get(model_name, 0) + query_cnt
+        return name_to_usage
+
+    @staticmethod
+    def _lexical_ranking(query: str, candidates: List[Information]) -> List[str]:
+        index = BM25Index.build(
+            " ".join([info.title, info.description] + list(info.snippets))
+            for info in candidates
+        )
+        ids, _ = index.search(query, len(candidates))
+        return [canonicalize_url(candidates[i].url) for i in ids]
+
+    def _fuse(self, query: str, rankings: List[List[Information]]) -> List[Information]:
+        by_url = {}
+        for ranking in rankings:
+            for info in ranking:
+                url = canonicalize_url(info.url)
+                if url not in by_url:
+                    by_url[url] = Information(
+                        url=info.url,
+                        description=info.description,
+                        snippets=list(info.snippets),
+                        title=info.title,
+                        # The queries of the fused result are recorded by this retriever's registry.
+                        meta={k: v for k, v in info.meta.items() if k != "queries"},
+                    )
+                else:
+                    by_url[url].merge(info)
 
-        for result in results:
-            to_return.extend(result)
+        url_rankings = [
+            list(dict.fromkeys(canonicalize_url(info.url) for info in ranking))
+            for ranking in rankings
+        ]
+        if self.use_lexical_ranking and by_url:
+            url_rankings.append(self._lexical_ranking(query, list(by_url.values())))
 
+        fused = reciprocal_rank_fusion(url_rankings, k=self.rrf_k)
+        if self.max_results_per_query is not None:
+            fused = fused[: self.max_results_per_query]
+        to_return = []
+        for rank, url in enumerate(fused):
+            info = by_url[url]
+            info.meta["query"] = query
+            info.meta["fusion_rank"] = rank
+            to_return.append(info)
         return to_return
 
+    def _fuse_all(
+        self, queries: List[str], per_retriever: List[List[Information]]
+    ) -> List[Information]:
+        to_return = []
+        for q in queries:
+            # Interned results hit by several queries record all of them in "queries".
+            rankings = [
+                [
+                    info
+                    for info in results
+                    if q in info.meta.get("queries", [info.meta.get("query")])
+                ]
+                for results in per_retriever
+            ]
+            to_return.extend(self._fuse(q, rankings))
+        return self._intern(to_return)
+
+    async def aretrieve(
+        self,
+        query: Union[str, List[str]],
+        exclude_urls: List[str] = [],
+        use_cache: bool = True,
+    ) -> List[Information]:
+        queries = list(dict.fromkeys(query if isinstance(query, list) else [query]))
+        per_retriever = await asyncio.gather(
+            *(
+                retriever.aretrieve(
+                    queries, exclude_urls=exclude_urls, use_cache=use_cache
+                )
+                for retriever in self.retrievers
+            )
+        )
+        return self._fuse_all(queries, per_retriever)
+
+    def retrieve(
+        self,
+        query: Union[str, List[str]],
+        exclude_urls: List[str] = [],
+        use_cache: bool = True,
+    ) -> List[Information]:
+        queries = list(dict.fromkeys(query if isinstance(query, list) else [query]))
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_thread
+        ) as executor:
+            per_retriever = list(
+                executor.map(
+                    lambda retriever: retriever.retrieve(
+                        queries, exclude_urls=exclude_urls, use_cache=use_cache
+                    ),
+                    self.retrievers,
+                )
+            )
+        return self._fuse_all(queries, per_retriever)
+
 
 class KnowledgeCurationModule(ABC):
     """
@@ -461,14 +790,13 @@ class LMConfigs(ABC):
         for usage in combined_usage:
             for model_name, tokens in usage.items():
                 if model_name not in model_name_to_usage:
-                    model_name_to_usage[model_name] = tokens
+                    model_name_to_usage[model_name] = dict(tokens)
                 else:
-                    model_name_to_usage[model_name]["prompt_tokens"] += tokens[
-                        "prompt_tokens"
-                    ]
-                    model_name_to_usage[model_name]["completion_tokens"] += tokens[
-                        "completion_tokens"
-                    ]
+                    # Sum every counter so that extra statistics (e.g. hedge spend) are kept.
+                    for key, value in tokens.items():
+                        model_name_to_usage[model_name][key] = (
+                            model_name_to_usage[model_name].get(key, 0) + value
+                        )
 
         return model_name_to_usage
 
@@ -1,4 +1,6 @@
 import backoff
+import collections
+import concurrent.futures
 import dspy
 import functools
 import logging
@@ -6,7 +8,8 @@ import os
 import random
 import requests
 import threading
-from typing import Optional, Literal, Any
+import time
+from typing import Optional, Literal, Any, Iterator, List
 import ujson
 from pathlib import Path
 
@@ -189,6 +192,99 @@ def _inspect_history(lm, n: int = 1):
 ############################
 
 
+class HedgingPolicy:
+    """Opt-in policy for hedging slow `LitellmModel` requests to cut provider tail latency.
+
+    When a request has not returned after the learned `quantile` latency of the LM it is attached to,
+    a duplicate request is fired (optionally to a fallback endpoint) and the first successful response
+    wins. The other request is cancelled if it has not started yet, otherwise its result is ignored and
+    its token usage is booked as hedge spend on the LM (see `LitellmModel.get_usage_and_reset`).
+
+    The latency distribution is learned online per `LitellmModel` instance (i.e. per role), so one
+    policy can safely be shared by several LMs. Latencies are measured from when a worker starts the
+    request, and cache hits are not recorded. Requests are not hedged while all workers are busy.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        min_samples: int = 20,
+        window_size: int = 200,
+        min_delay: float = 1.0,
+        max_delay: Optional[float] = None,
+        initial_delay: Optional[float] = None,
+        fallback_kwargs: Optional[dict] = None,
+        max_workers: int = 16,
+    ):
+        """
+        Args:
+            quantile: Latency quantile after which a duplicate request is fired.
+            min_samples: Number of observed latencies needed before the quantile is trusted.
+            window_size: Number of most recent latencies used to estimate the quantile.
+            min_delay: Lower bound (seconds) on the hedging delay.
+            max_delay: Optional upper bound (seconds) on the hedging delay.
+            initial_delay: Hedging delay used until `min_samples` latencies are observed.
+                If None, requests are not hedged during warm-up.
+            fallback_kwargs: Request parameters overriding the original ones for the duplicate request,
+                e.g. {"model": "azure/gpt-4o", "api_base": ..., "api_key": ...}.
+            max_workers: Maximum number of in-flight requests issued through this policy.
+        """
+        if not 0 < quantile < 1:
+            raise ValueError("quantile must be in (0, 1).")
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.fallback_kwargs = fallback_kwargs or {}
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="lm-hedge"
+                )
+            return self._executor
+
+    def submit(self, fn, *args) -> concurrent.futures.Future:
+        """Submit a request to the executor, keeping count of the requests queued or running."""
+        with self._executor_lock:
+            self._in_flight += 1
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._request_done)
+        return future
+
+    def _request_done(self, future: concurrent.futures.Future):
+        with self._executor_lock:
+            self._in_flight -= 1
+
+    @property
+    def saturated(self) -> bool:
+        """Whether every worker is busy, so a duplicate request would only wait in the queue."""
+        with self._executor_lock:
+            return self._in_flight >= self.max_workers
+
+    def hedge_delay(self, latencies: List[float]) -> Optional[float]:
+        """Return the delay (seconds) after which to hedge, or None to not hedge the request."""
+        if len(latencies) < self.min_samples:
+            delay = self.initial_delay
+        else:
+            ordered = sorted(latencies)
+            delay = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+        if delay is None:
+            return None
+        delay = max(delay, self.min_delay)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay
+
+
 class LitellmModel(LM):
     """A wrapper class for LiteLLM.
 
@@ -200,12 +296,36 @@ class LitellmModel(LM):
         model: str = "openai/gpt-4o-mini",
         api_key: Optional[str] = None,
         model_type: Literal["chat", "text"] = "chat",
+        hedging_policy: Optional[HedgingPolicy] = None,
         **kwargs,
     ):
         super().__init__(model=model, api_key=api_key, model_type=model_type, **kwargs)
         self._token_usage_lock = threading.Lock()
         self.prompt_tokens = 0
         self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+
+        # Opt-in request hedging (see `HedgingPolicy`).
+        self.hedging_policy = hedging_policy
+        self._latencies = collections.deque(
+            maxlen=hedging_policy.window_size if hedging_policy else 1
+        )
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self.hedge_prompt_tokens = 0
+        self.hedge_completion_tokens = 0
+
+    @staticmethod
+    def _get_cached_prompt_tokens(usage_data) -> int:
+        """Number of prompt tokens served from the provider's prompt (prefix) cache."""
+        details = usage_data.get("prompt_tokens_details") or {}
+        if not isinstance(details, dict):
+            details = getattr(details, "__dict__", {})
+        return (
+            details.get("cached_tokens")
+            or usage_data.get("cache_read_input_tokens")  # Anthropic
+            or 0
+        )
 
     def log_usage(self, response):
         """Log the total tokens from the OpenAI API response."""
@@ -214,21 +334,132 @@ class LitellmModel(LM):
             with self._token_usage_lock:
                 self.prompt_tokens += usage_data.get("prompt_tokens", 0)
                 self.completion_tokens += usage_data.get("completion_tokens", 0)
+                self.cached_prompt_tokens += self._get_cached_prompt_tokens(usage_data)
+
+    def _log_hedge_usage(self, future: concurrent.futures.Future):
+        """Book the tokens of a discarded (losing) request as hedge spend."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        usage_data = future.result().json().get("usage")
+        if usage_data:
+            with self._token_usage_lock:
+                self.hedge_prompt_tokens += usage_data.get("prompt_tokens", 0)
+                self.hedge_completion_tokens += usage_data.get("completion_tokens", 0)
 
     def get_usage_and_reset(self):
         """Get the total tokens used and reset the token usage."""
-        usage = {
-            self.model
-            or self.kwargs.get("model")
-            or self.kwargs.get("engine"): {
+        with self._token_usage_lock:
+            usage = {
                 "prompt_tokens": self.prompt_tokens,
                 "completion_tokens": self.completion_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
             }
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.cached_prompt_tokens = 0
+            if self.hedging_policy is not None:
+                usage.update(
+                    {
+                        "hedged_requests": self.hedged_requests,
+                        "hedge_wins": self.hedge_wins,
+                        "hedge_prompt_tokens": self.hedge_prompt_tokens,
+                        "hedge_completion_tokens": self.hedge_completion_tokens,
+                    }
+                )
+                self.hedged_requests = 0
+                self.hedge_wins = 0
+                self.hedge_prompt_tokens = 0
+                self.hedge_completion_tokens = 0
+
+        return {
+            self.model or self.kwargs.get("model") or self.kwargs.get("engine"): usage
         }
-        self.prompt_tokens = 0
-        self.completion_tokens = 0
 
-        return usage
+    def get_response_format(
+        self, schema: Optional[dict] = None, name: str = "response"
+    ) -> Optional[dict]:
+        """Return the strictest JSON `response_format` supported by the provider, or None.
+
+        Schema-constrained output is used when a schema is given and the model supports it,
+        otherwise plain JSON mode. The prompt should still mention JSON, as required by JSON mode.
+        """
+        try:
+            if schema is not None and litellm.supports_response_schema(model=self.model):
+                return {
+                    "type": "json_schema",
+                    "json_schema": {"name": name, "schema": schema},
+                }
+            supported_params = litellm.get_supported_openai_params(model=self.model)
+            if "response_format" in (supported_params or []):
+                return {"type": "json_object"}
+        except Exception:
+            # Models unknown to LiteLLM's model map.
+            pass
+        return None
+
+    def _hedged_completion(self, completion, request: str, hedge_request: str):
+        """Run `completion(request)` and fire `completion(hedge_request)` if it is slower than the learned quantile."""
+        policy = self.hedging_policy
+        with self._token_usage_lock:
+            delay = policy.hedge_delay(list(self._latencies))
+
+        started = threading.Event()
+
+        def timed_completion(request):
+            # Latency is measured from when a worker picks the request up, so time spent
+            # queued behind other requests of the policy is not mistaken for provider latency.
+            started.set()
+            start_time = time.perf_counter()
+            response = completion(request)
+            latency = time.perf_counter() - start_time
+            # Cache hits say nothing about the provider and would drag the quantile down.
+            hidden_params = getattr(response, "_hidden_params", None)
+            if isinstance(hidden_params, dict):
+                if hidden_params.get("cache_hit") or hidden_params.get(
+                    "hedging_latency_recorded"
+                ):
+                    return response
+                # The LRU cache returns this same object on later hits.
+                hidden_params["hedging_latency_recorded"] = True
+            with self._token_usage_lock:
+                self._latencies.append(latency)
+            return response
+
+        primary = policy.submit(timed_completion, request)
+        if delay is None:
+            return primary.result()
+
+        # Also released if the request never runs (e.g. it is cancelled).
+        primary.add_done_callback(lambda future: started.set())
+        started.wait()
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        if done or policy.saturated:
+            # A duplicate request would only queue behind the busy workers.
+            return primary.result()
+
+        hedge = policy.submit(completion, hedge_request)
+        with self._token_usage_lock:
+            self.hedged_requests += 1
+
+        # Take the first successful response; only fail if both requests fail.
+        winner = None
+        pending = {primary, hedge}
+        while pending and winner is None:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            winner = next((f for f in done if f.exception() is None), None)
+        if winner is None:
+            return primary.result()
+
+        loser = hedge if winner is primary else primary
+        if winner is hedge:
+            with self._token_usage_lock:
+                self.hedge_wins += 1
+        if not loser.cancel():
+            loser.add_done_callback(self._log_hedge_usage)
+
+        return winner.result()
 
     def __call__(self, prompt=None, messages=None, **kwargs):
         # Build the request.
@@ -244,9 +475,15 @@ class LitellmModel(LM):
                 cached_litellm_text_completion if cache else litellm_text_completion
             )
 
-        response = completion(
-            ujson.dumps(dict(model=self.model, messages=messages, **kwargs))
-        )
+        request = dict(model=self.model, messages=messages, **kwargs)
+        if self.hedging_policy is None:
+            response = completion(ujson.dumps(request))
+        else:
+            response = self._hedged_completion(
+                completion,
+                ujson.dumps(request),
+                ujson.dumps({**request, **self.hedging_policy.fallback_kwargs}),
+            )
         response_dict = response.json()
         self.log_usage(response_dict)
         outputs = [
@@ -267,6 +504,44 @@ class LitellmModel(LM):
 
         return outputs
 
+    def stream(self, prompt=None, messages=None, **kwargs) -> Iterator[str]:
+        """Yield the completion text incrementally as the provider streams it (chat models only).
+
+        Streamed responses bypass the LRU & disk caches and request hedging. Token usage and the
+        history entry are recorded once the stream is exhausted.
+        """
+        if self.model_type != "chat":
+            raise ValueError("Streaming is only supported for chat models.")
+        kwargs.pop("cache", None)
+        messages = messages or [{"role": "user", "content": prompt}]
+        kwargs = {**self.kwargs, **kwargs}
+
+        response = litellm.completion(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs,
+        )
+        chunks = []
+        usage = {}
+        for chunk in response:
+            if getattr(chunk, "usage", None):
+                usage = dict(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                chunks.append(delta)
+                yield delta
+
+        self.log_usage({"usage": usage})
+        outputs = ["".join(chunks)]
+        kwargs = {k: v for k, v in kwargs.items() if not k.startswith("api_")}
+        entry = dict(prompt=prompt, messages=messages, kwargs=kwargs, response=None)
+        entry = dict(**entry, outputs=outputs, usage=usage, cost=None)
+        self.history.append(entry)
+
 
 # ========================================================================
 # The following language model classes were deprecated after v1.1.0.
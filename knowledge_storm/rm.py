@@ -1,13 +1,80 @@
+import asyncio
+import json
 import logging
 import os
-from typing import Callable, Union, List
+import weakref
+from typing import Callable, Union, List, Dict, Optional
 
 import backoff
 import dspy
-import requests
+import httpx
+import numpy as np
 from dsp import backoff_hdlr, giveup_hdlr
+from tqdm import tqdm
+
+from .utils import (
+    BM25Index,
+    FileIOHelper,
+    NumpyVectorStore,
+    SearchResults,
+    WebPageHelper,
+    blockwise_dot,
+    get_http_client_pool,
+    reciprocal_rank_fusion,
+    top_k_indices,
+)
+
+
+class AsyncRetrieveMixin:
+    """Adds a concurrent `aforward` coroutine to a `dspy.Retrieve` subclass.
+
+    All queries are issued concurrently, at most `max_concurrency` at a time per retriever (and event loop).
+    Retrievers backed by a plain HTTP API override `_asearch` to use the shared async HTTP client; the
+    default runs the synchronous `forward` of each query in a worker thread.
+    """
 
-from .utils import WebPageHelper
+    max_concurrency: int = 8
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # asyncio primitives are bound to one event loop, so keep one semaphore per loop.
+        semaphores = self.__dict__.setdefault(
+            "_semaphores", weakref.WeakKeyDictionary()
+        )
+        loop = asyncio.get_running_loop()
+        if loop not in semaphores:
+            semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphores[loop]
+
+    async def _asearch(
+        self, query: str, exclude_urls: List[str], client: httpx.AsyncClient
+    ) -> List[Dict]:
+        """Search for a single query."""
+        return await asyncio.to_thread(self.forward, [query], exclude_urls)
+
+    async def abatch(
+        self, queries: List[str], exclude_urls: List[str] = []
+    ) -> List[List[Dict]]:
+        """Search for all queries concurrently and return the results of each query."""
+        semaphore = self._get_semaphore()
+        client = get_http_client_pool().get_async_client()
+
+        async def search(query):
+            async with semaphore:
+                return await self._asearch(query, exclude_urls, client)
+
+        return list(await asyncio.gather(*(search(query) for query in queries)))
+
+    async def aforward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Asynchronous version of `forward` that issues all queries concurrently."""
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        results = await self.abatch(queries, exclude_urls)
+        return [r for query_results in results for r in query_results]
 
 
 class YouRM(dspy.Retrieve):
@@ -54,10 +121,11 @@ class YouRM(dspy.Retrieve):
         )
         self.usage += len(queries)
         collected_results = []
+        failed = False
         for query in queries:
             try:
                 headers = {"X-API-Key": self.ydc_api_key}
-                results = requests.get(
+                results = get_http_client_pool().get(
                     f"https://api.ydc-index.io/search?query={query}",
                     headers=headers,
                 ).json()
@@ -70,11 +138,12 @@ class YouRM(dspy.Retrieve):
                     collected_results.extend(authoritative_results[: self.k])
             except Exception as e:
                 logging.error(f"Error occurs when searching query {query}: {e}")
+                failed = True
 
-        return collected_results
+        return SearchResults(collected_results, failed=failed)
 
 
-class BingSearch(dspy.Retrieve):
+class BingSearch(AsyncRetrieveMixin, dspy.Retrieve):
     def __init__(
         self,
         bing_search_api_key=None,
@@ -125,6 +194,49 @@ class BingSearch(dspy.Retrieve):
 
         return {"BingSearch": usage}
 
+    def _search_request(self, query: str) -> Dict:
+        return dict(
+            url=self.endpoint,
+            headers={"Ocp-Apim-Subscription-Key": self.bing_api_key},
+            params={**self.params, "q": query},
+        )
+
+    def _parse_results(self, results: Dict, exclude_urls: List[str]) -> Dict:
+        url_to_results = {}
+        for d in results["webPages"]["value"]:
+            if self.is_valid_source(d["url"]) and d["url"] not in exclude_urls:
+                url_to_results[d["url"]] = {
+                    "url": d["url"],
+                    "title": d["name"],
+                    "description": d["snippet"],
+                }
+        return url_to_results
+
+    def _attach_snippets(self, url_to_results: Dict) -> List[Dict]:
+        valid_url_to_snippets = self.webpage_helper.urls_to_snippets(
+            list(url_to_results.keys())
+        )
+        collected_results = []
+        for url in valid_url_to_snippets:
+            r = url_to_results[url]
+            r["snippets"] = valid_url_to_snippets[url]["snippets"]
+            collected_results.append(r)
+
+        return collected_results
+
+    async def _asearch(
+        self, query: str, exclude_urls: List[str], client: httpx.AsyncClient
+    ) -> List[Dict]:
+        self.usage += 1
+        try:
+            response = await client.get(**self._search_request(query))
+            url_to_results = self._parse_results(response.json(), exclude_urls)
+        except Exception as e:
+            logging.error(f"Error occurs when searching query {query}: {e}")
+            return SearchResults(failed=True)
+
+        return await asyncio.to_thread(self._attach_snippets, url_to_results)
+
     def forward(
         self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
     ):
@@ -145,35 +257,19 @@ class BingSearch(dspy.Retrieve):
         self.usage += len(queries)
 
         url_to_results = {}
-
-        headers = {"Ocp-Apim-Subscription-Key": self.bing_api_key}
+        failed = False
 
         for query in queries:
             try:
-                results = requests.get(
-                    self.endpoint, headers=headers, params={**self.params, "q": query}
-                ).json()
-
-                for d in results["webPages"]["value"]:
-                    if self.is_valid_source(d["url"]) and d["url"] not in exclude_urls:
-                        url_to_results[d["url"]] = {
-                            "url": d["url"],
-                            "title": d["name"],
-                            "description": d["snippet"],
-                        }
+                results = (
+                    get_http_client_pool().get(**self._search_request(query)).json()
+                )
+                url_to_results.update(self._parse_results(results, exclude_urls))
             except Exception as e:
                 logging.error(f"Error occurs when searching query {query}: {e}")
+                failed = True
 
-        valid_url_to_snippets = self.webpage_helper.urls_to_snippets(
-            list(url_to_results.keys())
-        )
-        collected_results = []
-        for url in valid_url_to_snippets:
-            r = url_to_results[url]
-            r["snippets"] = valid_url_to_snippets[url]["snippets"]
-            collected_results.append(r)
-
-        return collected_results
+        return SearchResults(self._attach_snippets(url_to_results), failed=failed)
 
 
 class VectorRM(dspy.Retrieve):
@@ -303,13 +399,48 @@ class VectorRM(dspy.Retrieve):
         """
         return self.qdrant.client.count(collection_name=self.collection_name)
 
-    def forward(self, query_or_queries: Union[str, List[str]], exclude_urls: List[str]):
+    def _search_requests(self, queries: List[str], exclude_urls: List[str]) -> List:
+        from qdrant_client import models
+
+        query_filter = None
+        if exclude_urls:
+            query_filter = models.Filter(
+                must_not=[
+                    models.FieldCondition(
+                        key=f"{self.qdrant.metadata_payload_key}.url",
+                        match=models.MatchAny(any=list(exclude_urls)),
+                    )
+                ]
+            )
+        # One batched forward pass of the embedding model for all queries.
+        vectors = self.model.embed_documents(queries)
+        vector_name = getattr(self.qdrant, "vector_name", None)
+        return [
+            models.SearchRequest(
+                vector=(
+                    models.NamedVector(name=vector_name, vector=vector)
+                    if vector_name
+                    else vector
+                ),
+                filter=query_filter,
+                limit=self.k,
+                with_payload=True,
+            )
+            for vector in vectors
+        ]
+
+    def forward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
         """
         Search in your data for self.k top passages for query or queries.
 
+        All queries are embedded in one batch and searched with one Qdrant batch request.
+
         Args:
             query_or_queries (Union[str, List[str]]): The query or queries to search for.
-            exclude_urls (List[str]): Dummy parameter to match the interface. Does not have any effect.
+            exclude_urls (List[str]): A list of urls to exclude from the search results, applied as a
+                payload filter on the server.
 
         Returns:
             a list of Dicts, each dict has keys of 'description', 'snippets' (list of strings), 'title', 'url'
@@ -320,23 +451,412 @@ class VectorRM(dspy.Retrieve):
             else query_or_queries
         )
         self.usage += len(queries)
+        if not queries:
+            return []
+        batch_results = self.client.search_batch(
+            collection_name=self.collection_name,
+            requests=self._search_requests(queries, exclude_urls),
+        )
         collected_results = []
-        for query in queries:
-            related_docs = self.qdrant.similarity_search_with_score(query, k=self.k)
-            for i in range(len(related_docs)):
-                doc = related_docs[i][0]
+        for points in batch_results:
+            for point in points:
+                metadata = point.payload.get(self.qdrant.metadata_payload_key) or {}
                 collected_results.append(
                     {
-                        "description": doc.metadata["description"],
-                        "snippets": [doc.page_content],
-                        "title": doc.metadata["title"],
-                        "url": doc.metadata["url"],
+                        "description": metadata.get("description", ""),
+                        "snippets": [
+                            point.payload.get(self.qdrant.content_payload_key, "")
+                        ],
+                        "title": metadata.get("title", ""),
+                        "url": metadata["url"],
                     }
                 )
 
         return collected_results
 
 
+class NumpyVectorRM(dspy.Retrieve):
+    """Retrieve information from custom documents using an in-process NumPy vector index.
+
+    A lightweight alternative to `VectorRM` that needs no Qdrant server: normalized embeddings are
+    stored in a memory-mapped float16 matrix (see `NumpyVectorStore` in utils.py) and a batch of
+    queries is answered with one matrix product and an argpartition top-k. The documents have the
+    same fields as for `VectorRM` (content, title, url and optionally description) and can be
+    appended at any time with `add_documents`.
+    """
+
+    def __init__(
+        self,
+        store_dir: str,
+        embedding_model: Optional[str] = None,
+        encoder=None,
+        device: str = "cpu",
+        k: int = 3,
+    ):
+        """
+        Params:
+            store_dir: Directory of the vector store, created if it does not exist.
+            embedding_model: Name of the Hugging Face embedding model. Ignored if `encoder` is given.
+            encoder: Optional embedding model with an `encode(texts) -> np.ndarray` method
+                (e.g. `Encoder` in encoder.py).
+            device: Device to run the Hugging Face embedding model on, can be "mps", "cuda", "cpu".
+            k: Number of top chunks to retrieve.
+        """
+        super().__init__(k=k)
+        self.usage = 0
+        if encoder is None:
+            if not embedding_model:
+                raise ValueError("Please provide an embedding model or an encoder.")
+            from langchain_huggingface import HuggingFaceEmbeddings
+
+            encoder = HuggingFaceEmbeddings(
+                model_name=embedding_model,
+                model_kwargs={"device": device},
+                encode_kwargs={"normalize_embeddings": True},
+            )
+        self.store_dir = store_dir
+        self._encoder = encoder
+        self._store = NumpyVectorStore(store_dir)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if hasattr(self._encoder, "embed_documents"):
+            return np.asarray(self._encoder.embed_documents(texts), dtype=np.float32)
+        return np.asarray(self._encoder.encode(texts), dtype=np.float32)
+
+    def add_documents(self, documents: List[Dict], batch_size: int = 64):
+        """Embed and append documents, each a dict with 'content', 'title', 'url' and 'description'."""
+        for start in tqdm(range(0, len(documents), batch_size)):
+            batch = documents[start : start + batch_size]
+            self._store.append(
+                self._encode([document["content"] for document in batch]),
+                [
+                    {
+                        "content": document["content"],
+                        "title": document.get("title", ""),
+                        "url": document["url"],
+                        "description": document.get("description", ""),
+                    }
+                    for document in batch
+                ],
+            )
+
+    def get_usage_and_reset(self):
+        usage = self.usage
+        self.usage = 0
+
+        return {"NumpyVectorRM": usage}
+
+    def get_vector_count(self):
+        return len(self._store)
+
+    def forward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """
+        Search in your data for self.k top passages for query or queries.
+
+        Args:
+            query_or_queries (Union[str, List[str]]): The query or queries to search for.
+            exclude_urls (List[str]): A list of urls to exclude from the search results.
+
+        Returns:
+            a list of Dicts, each dict has keys of 'description', 'snippets' (list of strings), 'title', 'url'
+        """
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        self.usage += len(queries)
+        if not queries or len(self._store) == 0:
+            return []
+        exclude_urls = set(exclude_urls)
+
+        embeddings = self._encode(queries)
+        query_results = [[] for _ in queries]
+        # Over-fetch so that k chunks remain after dropping excluded urls. A url may have many
+        # chunks, so queries still short of k results are searched again with twice the depth
+        # until the store is exhausted.
+        pending = list(range(len(queries)))
+        fetch_k = self.k + len(exclude_urls)
+        while pending:
+            fetch_k = min(fetch_k, len(self._store))
+            still_pending = []
+            for i, hits in zip(pending, self._store.search(embeddings[pending], fetch_k)):
+                query_results[i] = []
+                for index, _ in hits:
+                    if len(query_results[i]) == self.k:
+                        break
+                    document = self._store.get_document(index)
+                    if document["url"] in exclude_urls:
+                        continue
+                    query_results[i].append(
+                        {
+                            "description": document["description"],
+                            "snippets": [document["content"]],
+                            "title": document["title"],
+                            "url": document["url"],
+                        }
+                    )
+                if len(query_results[i]) < self.k and fetch_k < len(self._store):
+                    still_pending.append(i)
+            pending = still_pending
+            fetch_k *= 2
+
+        return [result for results in query_results for result in results]
+
+
+class LocalCorpusRM(dspy.Retrieve):
+    """Retrieve papers from a local dump of paper metadata, without any network access.
+
+    The corpus is a JSONL or Parquet file with one paper per row and the fields:
+        - title: The title of the paper.
+        - abstract: The abstract of the paper.
+        - url: The URL of the paper, used as the unique identifier of the paper.
+        - year (optional): The publication year.
+        - venue (optional): The publication venue.
+        - is_review (optional): Whether the paper is a review or survey.
+    Queries are answered with BM25 over title and abstract and, if an encoder is given, fused with
+    dense retrieval over normalized embeddings by reciprocal rank fusion. Both indexes are saved to
+    `index_dir` and memory-mapped on later runs.
+    """
+
+    def __init__(
+        self,
+        corpus_path: str,
+        index_dir: Optional[str] = None,
+        k: int = 3,
+        encoder=None,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        is_review: Optional[bool] = None,
+        fusion_depth: int = 100,
+    ):
+        """
+        Params:
+            corpus_path: Path to the JSONL or Parquet corpus.
+            index_dir: Directory in which the indexes are saved. If None, they are built in memory.
+            k: Number of top papers to retrieve.
+            encoder: Optional embedding model with an `encode(texts) -> np.ndarray` method
+                (e.g. `Encoder` in encoder.py) to enable dense retrieval.
+            min_year: Only retrieve papers published in or after this year.
+            max_year: Only retrieve papers published in or before this year.
+            is_review: If set, only retrieve review papers (True) or non-review papers (False).
+            fusion_depth: Number of candidates taken from each index before fusion.
+        """
+        super().__init__(k=k)
+        if not os.path.exists(corpus_path):
+            raise ValueError(f"Corpus {corpus_path} does not exist.")
+        self.usage = 0
+        self.corpus_path = corpus_path
+        self.index_dir = index_dir
+        self.min_year = min_year
+        self.max_year = max_year
+        self.is_review = is_review
+        self.fusion_depth = fusion_depth
+        self._encoder = encoder
+
+        self._papers = self._load_corpus(corpus_path)
+        self._url_to_id = {paper["url"]: i for i, paper in enumerate(self._papers)}
+        self._years = np.array(
+            [self._parse_year(paper.get("year")) for paper in self._papers],
+            dtype=np.int32,
+        )
+        self._reviews = np.array(
+            [bool(paper.get("is_review")) for paper in self._papers], dtype=bool
+        )
+        self._bm25 = self._load_or_build_bm25()
+        self._embeddings = (
+            self._load_or_build_embeddings() if encoder is not None else None
+        )
+
+    @staticmethod
+    def _load_corpus(corpus_path: str) -> List[Dict]:
+        if corpus_path.endswith(".parquet"):
+            import pandas as pd
+
+            records = pd.read_parquet(corpus_path).to_dict(orient="records")
+        elif corpus_path.endswith((".jsonl", ".json")):
+            with open(corpus_path, "r", encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        else:
+            raise ValueError(
+                "Not valid file format. Please provide a jsonl or parquet file."
+            )
+
+        papers = []
+        for record in records:
+            if not record.get("url"):
+                continue
+            papers.append(
+                {
+                    "title": record.get("title") or "",
+                    "abstract": record.get("abstract") or "",
+                    "url": record["url"],
+                    "year": record.get("year"),
+                    "venue": record.get("venue") or "",
+                    "is_review": bool(record.get("is_review")),
+                }
+            )
+        return papers
+
+    @staticmethod
+    def _parse_year(year) -> int:
+        try:
+            return int(str(year)[:4])
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def _paper_text(paper: Dict) -> str:
+        return f"{paper['title']}\n{paper['abstract']}"
+
+    def _corpus_fingerprint(self) -> Dict:
+        stat = os.stat(self.corpus_path)
+        return {
+            "corpus_path": os.path.abspath(self.corpus_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "num_papers": len(self._papers),
+        }
+
+    def _is_index_valid(self, manifest_name: str) -> bool:
+        manifest_path = os.path.join(self.index_dir, manifest_name)
+        return (
+            os.path.exists(manifest_path)
+            and FileIOHelper.load_json(manifest_path) == self._corpus_fingerprint()
+        )
+
+    def _save_manifest(self, manifest_name: str):
+        FileIOHelper.dump_json(
+            self._corpus_fingerprint(), os.path.join(self.index_dir, manifest_name)
+        )
+
+    def _load_or_build_bm25(self) -> BM25Index:
+        if self.index_dir is None:
+            return BM25Index.build(self._paper_text(p) for p in self._papers)
+        bm25_dir = os.path.join(self.index_dir, "bm25")
+        if BM25Index.exists(bm25_dir) and self._is_index_valid("bm25_manifest.json"):
+            return BM25Index.load(bm25_dir)
+
+        logging.info(f"Building BM25 index for {len(self._papers)} papers...")
+        index = BM25Index.build(self._paper_text(p) for p in self._papers)
+        index.save(bm25_dir)
+        self._save_manifest("bm25_manifest.json")
+        return BM25Index.load(bm25_dir)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.asarray(self._encoder.encode(texts), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def _load_or_build_embeddings(self, batch_size: int = 256) -> np.ndarray:
+        embeddings_path = (
+            os.path.join(self.index_dir, "embeddings.npy") if self.index_dir else None
+        )
+        if (
+            embeddings_path is not None
+            and os.path.exists(embeddings_path)
+            and self._is_index_valid("embeddings_manifest.json")
+        ):
+            return np.load(embeddings_path, mmap_mode="r")
+
+        logging.info(f"Embedding {len(self._papers)} papers...")
+        embeddings = np.concatenate(
+            [
+                self._encode(
+                    [self._paper_text(p) for p in self._papers[i : i + batch_size]]
+                ).astype(np.float16)
+                for i in range(0, len(self._papers), batch_size)
+            ]
+        )
+        if embeddings_path is None:
+            return embeddings
+        os.makedirs(self.index_dir, exist_ok=True)
+        np.save(embeddings_path, embeddings)
+        self._save_manifest("embeddings_manifest.json")
+        return np.load(embeddings_path, mmap_mode="r")
+
+    def get_usage_and_reset(self):
+        usage = self.usage
+        self.usage = 0
+
+        return {"LocalCorpusRM": usage}
+
+    def _filter_mask(self, exclude_urls: List[str]) -> Optional[np.ndarray]:
+        mask = np.ones(len(self._papers), dtype=bool)
+        if self.min_year is not None:
+            mask &= self._years >= self.min_year
+        if self.max_year is not None:
+            mask &= self._years <= self.max_year
+        if self.is_review is not None:
+            mask &= self._reviews == self.is_review
+        for url in exclude_urls:
+            paper_id = self._url_to_id.get(url)
+            if paper_id is not None:
+                mask[paper_id] = False
+        return mask
+
+    def _to_result(self, paper_id: int) -> Dict:
+        paper = self._papers[paper_id]
+        return {
+            "description": paper["abstract"],
+            "snippets": [paper["abstract"] or paper["title"]],
+            "title": paper["title"],
+            "url": paper["url"],
+            "meta": {
+                "year": int(self._years[paper_id]) or None,
+                "venue": paper["venue"],
+                "is_review": paper["is_review"],
+            },
+        }
+
+    def forward(
+        self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
+    ):
+        """Search the local corpus for self.k top papers for query or queries.
+
+        Args:
+            query_or_queries (Union[str, List[str]]): The query or queries to search for.
+            exclude_urls (List[str]): A list of urls to exclude from the search results.
+
+        Returns:
+            a list of Dicts, each dict has keys of 'description', 'snippets' (list of strings), 'title', 'url'
+            and 'meta' (year, venue and is_review)
+        """
+        queries = (
+            [query_or_queries]
+            if isinstance(query_or_queries, str)
+            else query_or_queries
+        )
+        self.usage += len(queries)
+        mask = self._filter_mask(exclude_urls)
+        depth = max(self.k, self.fusion_depth) if self._encoder else self.k
+
+        dense_rankings = [[] for _ in queries]
+        if self._embeddings is not None:
+            # All queries are embedded and scored in one batch.
+            scores = blockwise_dot(self._embeddings, self._encode(queries))
+            scores[:, ~mask] = -np.inf
+            dense_rankings = [top_k_indices(row, depth).tolist() for row in scores]
+
+        collected_results = []
+        seen_ids = set()
+        for query, dense_ranking in zip(queries, dense_rankings):
+            bm25_ranking = self._bm25.search(query, depth, mask=mask)[0].tolist()
+            ranking = (
+                reciprocal_rank_fusion([bm25_ranking, dense_ranking])
+                if dense_ranking
+                else bm25_ranking
+            )
+            for paper_id in ranking[: self.k]:
+                if paper_id not in seen_ids:
+                    seen_ids.add(paper_id)
+                    collected_results.append(self._to_result(paper_id))
+
+        return collected_results
+
+
 class StanfordOvalArxivRM(dspy.Retrieve):
     """[Alpha] This retrieval class is for internal use only, not intended for the public."""
 
@@ -355,7 +875,7 @@ class StanfordOvalArxivRM(dspy.Retrieve):
     def _retrieve(self, query: str):
         payload = {"query": query, "num_blocks": self.k, "rerank": self.rerank}
 
-        response = requests.post(
+        response = get_http_client_pool().post(
             self.endpoint, json=payload, headers={"Content-Type": "application/json"}
         )
 
@@ -388,6 +908,7 @@ class StanfordOvalArxivRM(dspy.Retrieve):
         self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
     ):
         collected_results = []
+        failed = False
         queries = (
             [query_or_queries]
             if isinstance(query_or_queries, str)
@@ -400,12 +921,16 @@ class StanfordOvalArxivRM(dspy.Retrieve):
                 collected_results.extend(results)
             except Exception as e:
                 logging.error(f"Error occurs when searching query {query}: {e}")
-        return collected_results
+                failed = True
+        return SearchResults(collected_results, failed=failed)
 
 
-class SerperRM(dspy.Retrieve):
+class SerperRM(AsyncRetrieveMixin, dspy.Retrieve):
     """Retrieve information from custom queries using Serper.dev."""
 
+    # Maximum number of query objects Serper accepts in a single request.
+    MAX_BATCH_SIZE = 100
+
     def __init__(
         self,
         serper_search_api_key=None,
@@ -447,8 +972,8 @@ class SerperRM(dspy.Retrieve):
         if query_params is None:
             self.query_params = {"num": k, "autocorrect": True, "page": 1}
         else:
-            self.query_params = query_params
-            self.query_params.update({"num": k})
+            # Copy to leave the caller's dict untouched; the params are never mutated afterwards.
+            self.query_params = {**query_params, "num": k}
         self.serper_search_api_key = serper_search_api_key
         if not self.serper_search_api_key and not os.environ.get("SERPER_API_KEY"):
             raise RuntimeError(
@@ -462,24 +987,49 @@ class SerperRM(dspy.Retrieve):
             self.serper_search_api_key = os.environ["SERPER_API_KEY"]
 
         self.base_url = "https://google.serper.dev"
-
-    def serper_runner(self, query_params):
         self.search_url = f"{self.base_url}/search"
 
-        headers = {
+    def _headers(self) -> Dict:
+        return {
             "X-API-KEY": self.serper_search_api_key,
             "Content-Type": "application/json",
         }
 
-        response = requests.request(
-            "POST", self.search_url, headers=headers, json=query_params
-        )
-
-        if response == None:
+    def _batch_payloads(self, queries: List[str]) -> List[Union[Dict, List[Dict]]]:
+        """Build the request payloads, packing up to `MAX_BATCH_SIZE` queries into each request."""
+        # All available parameters can be found in the playground: https://serper.dev/playground
+        # The type can be search, images, video, places, maps etc that Google provides.
+        query_objects = [
+            {**self.query_params, "q": query, "type": "search"} for query in queries
+        ]
+        batches = [
+            query_objects[i : i + self.MAX_BATCH_SIZE]
+            for i in range(0, len(query_objects), self.MAX_BATCH_SIZE)
+        ]
+        # A single query is sent as a plain object.
+        return [batch if len(batch) > 1 else batch[0] for batch in batches]
+
+    @staticmethod
+    def _payload_queries(payload: Union[Dict, List[Dict]]) -> List[str]:
+        return [
+            query["q"]
+            for query in (payload if isinstance(payload, list) else [payload])
+        ]
+
+    @staticmethod
+    def _parse_response(response: httpx.Response) -> List[Dict]:
+        """Return the search results of a (batched) request, one per query object."""
+        if response.status_code >= 400:
             raise RuntimeError(
-                f"Error had occurred while running the search process.\n Error is {response.reason}, had failed with status code {response.status_code}"
+                f"Error had occurred while running the search process.\n Error is {response.reason_phrase}, had failed with status code {response.status_code}"
             )
+        results = response.json()
+        return results if isinstance(results, list) else [results]
 
+    def serper_runner(self, query_params):
+        response = get_http_client_pool().post(
+            self.search_url, headers=self._headers(), json=query_params
+        )
         return response.json()
 
     def get_usage_and_reset(self):
@@ -491,6 +1041,8 @@ class SerperRM(dspy.Retrieve):
         """
         Calls the API and searches for the query passed in.
 
+        All queries are sent in batched requests. No state is shared between calls, so the method can be
+        called concurrently.
 
         Args:
             query_or_queries (Union[str, List[str]]): The query or queries to search for.
@@ -504,31 +1056,82 @@ class SerperRM(dspy.Retrieve):
             if isinstance(query_or_queries, str)
             else query_or_queries
         )
-
+        queries = [query for query in queries if query != "Queries:"]
         self.usage += len(queries)
-        self.results = []
-        collected_results = []
-        for query in queries:
-            if query == "Queries:":
-                continue
-            query_params = self.query_params
 
-            # All available parameters can be found in the playground: https://serper.dev/playground
-            # Sets the json value for query to be the query that is being parsed.
-            query_params["q"] = query
+        results = []
+        failed = False
+        for payload in self._batch_payloads(queries):
+            try:
+                response = get_http_client_pool().post(
+                    self.search_url, headers=self._headers(), json=payload
+                )
+                results.extend(self._parse_response(response))
+            except Exception as e:
+                logging.error(
+                    f"Error occurs when searching queries {self._payload_queries(payload)}: {e}"
+                )
+                failed = True
+
+        return SearchResults(
+            [
+                r
+                for query_results in self._collect_results(results)
+                for r in query_results
+            ],
+            failed=failed,
+        )
 
-            # Sets the type to be search, can be images, video, places, maps etc that Google provides.
-            query_params["type"] = "search"
+    async def abatch(
+        self, queries: List[str], exclude_urls: List[str] = []
+    ) -> List[List[Dict]]:
+        """Search for all queries in concurrent batched requests and return the results of each query."""
+        searchable = [query for query in queries if query != "Queries:"]
+        self.usage += len(searchable)
+        semaphore = self._get_semaphore()
 
-            self.result = self.serper_runner(query_params)
-            self.results.append(self.result)
+        client = get_http_client_pool().get_async_client()
 
-        # Array of dictionaries that will be used by Storm to create the jsons
-        collected_results = []
+        async def post(payload):
+            try:
+                async with semaphore:
+                    response = await client.post(
+                        self.search_url, headers=self._headers(), json=payload
+                    )
+                return self._parse_response(response)
+            except Exception as e:
+                logging.error(
+                    f"Error occurs when searching queries {self._payload_queries(payload)}: {e}"
+                )
+                return None
+
+        payloads = self._batch_payloads(searchable)
+        responses = await asyncio.gather(*(post(payload) for payload in payloads))
+
+        results = []
+        failed_queries = set()
+        for payload, batch_results in zip(payloads, responses):
+            if batch_results is None:
+                # Empty placeholders keep the results aligned with the queries.
+                batch_queries = self._payload_queries(payload)
+                failed_queries.update(batch_queries)
+                batch_results = [{} for _ in batch_queries]
+            results.extend(batch_results)
+        query_to_results = dict(
+            zip(searchable, await asyncio.to_thread(self._collect_results, results))
+        )
+        return [
+            SearchResults(
+                query_to_results.get(query, []), failed=query in failed_queries
+            )
+            for query in queries
+        ]
 
+    def _collect_results(self, results: List[Dict]) -> List[List[Dict]]:
+        """Convert the raw search results to the retrieval format, keeping one list per query."""
         if self.ENABLE_EXTRA_SNIPPET_EXTRACTION:
             urls = []
-            for result in self.results:
+            for result in results:
                 organic_results = result.get("organic", [])
                 for organic in organic_results:
                     url = organic.get("link")
@@ -538,18 +1141,23 @@ class SerperRM(dspy.Retrieve):
         else:
             valid_url_to_snippets = {}
 
-        for result in self.results:
+        collected_results = []
+        for result in results:
+            # Array of dictionaries that will be used by Storm to create the jsons
+            query_results = []
             try:
                 # An array of dictionaries that contains the snippets, title of the document and url that will be used.
-                organic_results = result.get("organic")
+                organic_results = result.get("organic", [])
                 knowledge_graph = result.get("knowledgeGraph")
                 for organic in organic_results:
                     snippets = [organic.get("snippet")]
                     if self.ENABLE_EXTRA_SNIPPET_EXTRACTION:
                         snippets.extend(
-                            valid_url_to_snippets.get(url, {}).get("snippets", [])
+                            valid_url_to_snippets.get(organic.get("link"), {}).get(
+                                "snippets", []
+                            )
                         )
-                    collected_results.append(
+                    query_results.append(
                         {
                             "snippets": snippets,
                             "title": organic.get("title"),
@@ -562,12 +1170,13 @@ class SerperRM(dspy.Retrieve):
                         }
                     )
             except:
-                continue
+                pass
+            collected_results.append(query_results)
 
         return collected_results
 
 
-class BraveRM(dspy.Retrieve):
+class BraveRM(AsyncRetrieveMixin, dspy.Retrieve):
     def __init__(
         self, brave_search_api_key=None, k=3, is_valid_source: Callable = None
     ):
@@ -594,6 +1203,38 @@ class BraveRM(dspy.Retrieve):
 
         return {"BraveRM": usage}
 
+    def _search_request(self, query: str) -> Dict:
+        return dict(
+            url=f"https://api.search.brave.com/res/v1/web/search?result_filter=web&q={query}",
+            headers={
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip",
+                "X-Subscription-Token": self.brave_search_api_key,
+            },
+        )
+
+    def _parse_results(self, response: Dict) -> List[Dict]:
+        return [
+            {
+                "snippets": result.get("extra_snippets", []),
+                "title": result.get("title"),
+                "url": result.get("url"),
+                "description": result.get("description"),
+            }
+            for result in response.get("web", {}).get("results", [])
+        ]
+
+    async def _asearch(
+        self, query: str, exclude_urls: List[str], client: httpx.AsyncClient
+    ) -> List[Dict]:
+        self.usage += 1
+        try:
+            response = await client.get(**self._search_request(query))
+            return self._parse_results(response.json())
+        except Exception as e:
+            logging.error(f"Error occurs when searching query {query}: {e}")
+            return SearchResults(failed=True)
+
     def forward(
         self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
     ):
@@ -613,35 +1254,21 @@ class BraveRM(dspy.Retrieve):
         )
         self.usage += len(queries)
         collected_results = []
+        failed = False
         for query in queries:
             try:
-                headers = {
-                    "Accept": "application/json",
-                    "Accept-Encoding": "gzip",
-                    "X-Subscription-Token": self.brave_search_api_key,
-                }
-                response = requests.get(
-                    f"https://api.search.brave.com/res/v1/web/search?result_filter=web&q={query}",
-                    headers=headers,
-                ).json()
-                results = response.get("web", {}).get("results", [])
-
-                for result in results:
-                    collected_results.append(
-                        {
-                            "snippets": result.get("extra_snippets", []),
-                            "title": result.get("title"),
-                            "url": result.get("url"),
-                            "description": result.get("description"),
-                        }
-                    )
+                response = (
+                    get_http_client_pool().get(**self._search_request(query)).json()
+                )
+                collected_results.extend(self._parse_results(response))
             except Exception as e:
                 logging.error(f"Error occurs when searching query {query}: {e}")
+                failed = True
 
-        return collected_results
+        return SearchResults(collected_results, failed=failed)
 
 
-class SearXNG(dspy.Retrieve):
+class SearXNG(AsyncRetrieveMixin, dspy.Retrieve):
     def __init__(
         self,
         searxng_api_url,
@@ -676,6 +1303,40 @@ class SearXNG(dspy.Retrieve):
         self.usage = 0
         return {"SearXNG": usage}
 
+    def _search_request(self, query: str) -> Dict:
+        return dict(
+            url=self.searxng_api_url,
+            headers=(
+                {"Authorization": f"Bearer {self.searxng_api_key}"}
+                if self.searxng_api_key
+                else {}
+            ),
+            params={"q": query, "format": "json"},
+        )
+
+    def _parse_results(self, results: Dict, exclude_urls: List[str]) -> List[Dict]:
+        return [
+            {
+                "description": r.get("content", ""),
+                "snippets": [r.get("content", "")],
+                "title": r.get("title", ""),
+                "url": r["url"],
+            }
+            for r in results["results"]
+            if self.is_valid_source(r["url"]) and r["url"] not in exclude_urls
+        ]
+
+    async def _asearch(
+        self, query: str, exclude_urls: List[str], client: httpx.AsyncClient
+    ) -> List[Dict]:
+        self.usage += 1
+        try:
+            response = await client.get(**self._search_request(query))
+            return self._parse_results(response.json(), exclude_urls)
+        except Exception as e:
+            logging.error(f"Error occurs when searching query {query}: {e}")
+            return SearchResults(failed=True)
+
     def forward(
         self, query_or_queries: Union[str, List[str]], exclude_urls: List[str] = []
     ):
@@ -695,37 +1356,22 @@ class SearXNG(dspy.Retrieve):
         )
         self.usage += len(queries)
         collected_results = []
-        headers = (
-            {"Authorization": f"Bearer {self.searxng_api_key}"}
-            if self.searxng_api_key
-            else {}
-        )
+        failed = False
 
         for query in queries:
             try:
-                params = {"q": query, "format": "json"}
-                response = requests.get(
-                    self.searxng_api_url, headers=headers, params=params
+                response = get_http_client_pool().get(**self._search_request(query))
+                collected_results.extend(
+                    self._parse_results(response.json(), exclude_urls)
                 )
-                results = response.json()
-
-                for r in results["results"]:
-                    if self.is_valid_source(r["url"]) and r["url"] not in exclude_urls:
-                        collected_results.append(
-                            {
-                                "description": r.get("content", ""),
-                                "snippets": [r.get("content", "")],
-                                "title": r.get("title", ""),
-                                "url": r["url"],
-                            }
-                        )
             except Exception as e:
                 logging.error(f"Error occurs when searching query {query}: {e}")
+                failed = True
 
-        return collected_results
+        return SearchResults(collected_results, failed=failed)
 
 
-class DuckDuckGoSearchRM(dspy.Retrieve):
+class DuckDuckGoSearchRM(AsyncRetrieveMixin, dspy.Retrieve):
     """Retrieve information from custom queries using DuckDuckGo."""
 
     def __init__(
@@ -855,7 +1501,7 @@ class DuckDuckGoSearchRM(dspy.Retrieve):
         return collected_results
 
 
-class TavilySearchRM(dspy.Retrieve):
+class TavilySearchRM(AsyncRetrieveMixin, dspy.Retrieve):
     """Retrieve information from custom queries using Tavily. Documentation and examples can be found at https://docs.tavily.com/docs/python-sdk/tavily-search/examples"""
 
     def __init__(
@@ -981,7 +1627,7 @@ class TavilySearchRM(dspy.Retrieve):
         return collected_results
 
 
-class GoogleSearch(dspy.Retrieve):
+class GoogleSearch(AsyncRetrieveMixin, dspy.Retrieve):
     def __init__(
         self,
         google_search_api_key=None,
@@ -1065,6 +1711,7 @@ class GoogleSearch(dspy.Retrieve):
         self.usage += len(queries)
 
         url_to_results = {}
+        failed = False
 
         for query in queries:
             try:
@@ -1092,6 +1739,7 @@ class GoogleSearch(dspy.Retrieve):
 
             except Exception as e:
                 logging.error(f"Error occurred while searching query {query}: {e}")
+                failed = True
 
         valid_url_to_snippets = self.webpage_helper.urls_to_snippets(
             list(url_to_results.keys())
@@ -1102,10 +1750,10 @@ class GoogleSearch(dspy.Retrieve):
             r["snippets"] = valid_url_to_snippets[url]["snippets"]
             collected_results.append(r)
 
-        return collected_results
+        return SearchResults(collected_results, failed=failed)
 
 
-class AzureAISearch(dspy.Retrieve):
+class AzureAISearch(AsyncRetrieveMixin, dspy.Retrieve):
     """Retrieve information from custom queries using Azure AI Search.
 
     General Documentation: https://learn.microsoft.com/en-us/azure/search/search-create-service-portal.
@@ -1213,6 +1861,7 @@ class AzureAISearch(dspy.Retrieve):
         )
         self.usage += len(queries)
         collected_results = []
+        failed = False
 
         client = SearchClient(
             self.azure_ai_search_url,
@@ -1234,5 +1883,6 @@ class AzureAISearch(dspy.Retrieve):
                     collected_results.append(document)
             except Exception as e:
                 logging.error(f"Error occurs when searching query {query}: {e}")
+                failed = True
 
-        return collected_results
+        return SearchResults(collected_results, failed=failed)
@@ -1,15 +1,51 @@
+import array
+import asyncio
+import atexit
+import collections
 import concurrent.futures
+import diskcache
 import dspy
+import functools
+import hashlib
 import httpx
+import importlib.util
+import itertools
 import json
 import logging
+import multiprocessing
+import numpy as np
 import os
 import pickle
+import queue
 import re
 import regex
 import sys
+import threading
+import time
 import toml
-from typing import List, Dict
+import uuid
+import weakref
+import zlib
+from typing import (
+    Awaitable,
+    List,
+    Dict,
+    Iterable,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    TYPE_CHECKING,
+)
+from urllib.parse import (
+    parse_qsl,
+    unquote,
+    urlencode,
+    urlparse,
+    urlsplit,
+    urlunsplit,
+)
 from tqdm import tqdm
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -17,6 +53,11 @@ from trafilatura import extract
 
 from .lm import LitellmModel
 
+if TYPE_CHECKING:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from langchain_qdrant import Qdrant
+    from qdrant_client import QdrantClient
+
 logging.getLogger("httpx").setLevel(logging.WARNING)  # Disable INFO logging for httpx.
 
 
@@ -57,6 +98,32 @@ def makeStringRed(message):
     return f"\033[91m {message}\033[00m"
 
 
+T = TypeVar("T")
+
+
+def in_event_loop() -> bool:
+    """Whether the calling thread is running an event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def run_async(coroutine: Awaitable[T]) -> T:
+    """Run a coroutine to completion from synchronous code.
+
+    asyncio.run cannot be nested, so when called from within a running event loop, the coroutine
+    is run on a fresh loop in a worker thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
 class QdrantVectorStoreManager:
     """
     Helper class for managing the Qdrant vector store, can be used with `VectorRM` in rm.py.
@@ -148,6 +215,97 @@ class QdrantVectorStoreManager:
         except Exception as e:
             raise ValueError(f"Error occurs when loading the vector store: {e}")
 
+    @staticmethod
+    def _content_id(url: str, content: str) -> str:
+        """Deterministic point id of a chunk, so re-ingesting the same chunk is a no-op."""
+        digest = hashlib.sha256(f"{url}\n{content}".encode("utf-8")).hexdigest()
+        return str(uuid.UUID(digest[:32]))
+
+    @staticmethod
+    def _checkpoint_path(
+        collection_name: str, file_path: str, vector_store_path: Optional[str]
+    ) -> str:
+        file_hash = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+        checkpoint_dir = vector_store_path or os.path.join(
+            os.path.expanduser("~"), ".storm_local_cache", "ingestion"
+        )
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        return os.path.join(
+            checkpoint_dir, f"{collection_name}.{file_hash[:12]}.checkpoint.json"
+        )
+
+    @staticmethod
+    def _prepare_points(
+        qdrant: "Qdrant",
+        model: "HuggingFaceEmbeddings",
+        text_splitter: RecursiveCharacterTextSplitter,
+        rows: List[Dict],
+        columns: Dict[str, str],
+        batch_size: int,
+    ) -> List:
+        """Split, deduplicate and embed a chunk of CSV rows into Qdrant points."""
+        from qdrant_client import models
+
+        def clean(value):
+            return "" if value is None or value != value else str(value)  # NaN
+
+        point_ids, texts, payloads = [], [], []
+        seen_ids = set()
+        for row in rows:
+            metadata = {
+                "title": clean(row.get(columns["title"])),
+                "url": clean(row[columns["url"]]),
+                "description": clean(row.get(columns["description"])),
+            }
+            content = clean(row[columns["content"]])
+            start_index = 0
+            for chunk in text_splitter.split_text(content):
+                start_index = content.find(chunk, start_index)
+                point_id = QdrantVectorStoreManager._content_id(metadata["url"], chunk)
+                if point_id in seen_ids:
+                    continue
+                seen_ids.add(point_id)
+                point_ids.append(point_id)
+                texts.append(chunk)
+                payloads.append(
+                    {
+                        qdrant.content_payload_key: chunk,
+                        qdrant.metadata_payload_key: {
+                            **metadata,
+                            "start_index": start_index,
+                        },
+                    }
+                )
+
+        # Skip chunks that are already indexed.
+        existing_ids = set()
+        for i in range(0, len(point_ids), 1000):
+            existing_ids.update(
+                str(point.id)
+                for point in qdrant.client.retrieve(
+                    collection_name=qdrant.collection_name,
+                    ids=point_ids[i : i + 1000],
+                    with_payload=False,
+                    with_vectors=False,
+                )
+            )
+        new = [i for i, id_ in enumerate(point_ids) if id_ not in existing_ids]
+
+        vector_name = getattr(qdrant, "vector_name", None)
+        points = []
+        for start in range(0, len(new), batch_size):
+            batch = new[start : start + batch_size]
+            vectors = model.embed_documents([texts[i] for i in batch])
+            points.extend(
+                models.PointStruct(
+                    id=point_ids[i],
+                    vector={vector_name: vector} if vector_name else vector,
+                    payload=payloads[i],
+                )
+                for i, vector in zip(batch, vectors)
+            )
+        return points
+
     @staticmethod
     def create_or_update_vector_store(
         collection_name: str,
@@ -165,15 +323,23 @@ class QdrantVectorStoreManager:
         qdrant_api_key: str = None,
         embedding_model: str = "BAAI/bge-m3",
         device: str = "mps",
+        csv_chunk_size: int = 1000,
+        num_workers: int = 2,
+        max_pending_chunks: int = 4,
+        resume: bool = True,
     ):
-        from qdrant_client import Document
-
         """
         Takes a CSV file and adds each row in the CSV file to the Qdrant collection.
 
         This function expects each row of the CSV file as a document.
         The CSV file should have columns for "content", "title", "URL", and "description".
 
+        The CSV file is streamed in chunks of `csv_chunk_size` rows. Chunks are split and embedded by a
+        pool of `num_workers` workers while finished chunks are uploaded, with at most
+        `max_pending_chunks` chunks in flight. Progress is checkpointed by row offset after each
+        upload, so an interrupted ingestion resumes where it stopped. Chunks are identified by a hash
+        of their url and content, so chunks that are already indexed are skipped.
+
         Args:
             collection_name: Name of the Qdrant collection.
             vector_store_path (str): Path to the directory where the vector store is stored or will be stored.
@@ -183,12 +349,16 @@ class QdrantVectorStoreManager:
             title_column (str): Name of the column containing the title. Default is "title".
             url_column (str): Name of the column containing the URL. Default is "url".
             desc_column (str): Name of the column containing the description. Default is "description".
-            batch_size (int): Batch size for adding documents to the collection.
+            batch_size (int): Batch size for embedding and adding documents to the collection.
             chunk_size: Size of each chunk if you need to build the vector store from documents.
             chunk_overlap: Overlap between chunks if you need to build the vector store from documents.
             embedding_model: Name of the Hugging Face embedding model.
             device: Device to run the embeddings model on, can be "mps", "cuda", "cpu".
             qdrant_api_key: API key for the Qdrant server (Only required if the Qdrant server is online).
+            csv_chunk_size: Number of CSV rows read and processed at a time.
+            num_workers: Number of workers splitting and embedding chunks of rows.
+            max_pending_chunks: Maximum number of chunks of rows being processed or waiting for upload.
+            resume: Whether to resume from the checkpoint of a previous interrupted ingestion.
         """
         # check if the collection name is provided
         if collection_name is None:
@@ -236,38 +406,35 @@ class QdrantVectorStoreManager:
         if qdrant is None:
             raise ValueError("Qdrant client is not initialized.")
 
-        # read the csv file
+        # check that content column exists and url column exists
         import pandas as pd
 
-        df = pd.read_csv(file_path)
-        # check that content column exists and url column exists
-        if content_column not in df.columns:
+        header = pd.read_csv(file_path, nrows=0).columns
+        if content_column not in header:
             raise ValueError(
                 f"Content column {content_column} not found in the csv file."
             )
-        if url_column not in df.columns:
+        if url_column not in header:
             raise ValueError(f"URL column {url_column} not found in the csv file.")
-
-        documents = [
-            Document(
-                page_content=row[content_column],
-                metadata={
-                    "title": row.get(title_column, ""),
-                    "url": row[url_column],
-                    "description": row.get(desc_column, ""),
-                },
-            )
-            for row in df.to_dict(orient="records")
-        ]
-
-        # split the documents
-        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        columns = {
+            "content": content_column,
+            "title": title_column,
+            "url": url_column,
+            "description": desc_column,
+        }
+
+        checkpoint_path = QdrantVectorStoreManager._checkpoint_path(
+            collection_name, file_path, vector_store_path
+        )
+        rows_done = 0
+        if resume and os.path.exists(checkpoint_path):
+            rows_done = FileIOHelper.load_json(checkpoint_path)["rows_done"]
+            print(f"Resuming ingestion of {file_path} from row {rows_done}...")
 
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             length_function=len,
-            add_start_index=True,
             separators=[
                 "\n\n",
                 "\n",
@@ -282,20 +449,70 @@ class QdrantVectorStoreManager:
                 "",
             ],
         )
-        split_documents = text_splitter.split_documents(documents)
-
-        # update and save the vector store
-        num_batches = (len(split_documents) + batch_size - 1) // batch_size
-        for i in tqdm(range(num_batches)):
-            start_idx = i * batch_size
-            end_idx = min((i + 1) * batch_size, len(split_documents))
-            qdrant.add_documents(
-                documents=split_documents[start_idx:end_idx],
-                batch_size=batch_size,
-            )
 
-        # close the qdrant client
-        qdrant.client.close()
+        # Chunks of rows are processed in parallel; futures are queued in row order and
+        # uploaded by a separate thread, so the checkpoint always covers a prefix of the file.
+        pending = queue.Queue(maxsize=max_pending_chunks)
+        upload_errors = []
+
+        def upload():
+            nonlocal rows_done
+            while True:
+                item = pending.get()
+                if item is None:
+                    return
+                future, num_rows = item
+                if upload_errors:
+                    continue
+                try:
+                    points = future.result()
+                    for i in range(0, len(points), batch_size):
+                        qdrant.client.upsert(
+                            collection_name=collection_name,
+                            points=points[i : i + batch_size],
+                        )
+                    rows_done += num_rows
+                    FileIOHelper.dump_json({"rows_done": rows_done}, checkpoint_path)
+                    progress.update(num_rows)
+                except Exception as e:
+                    upload_errors.append(e)
+
+        progress = tqdm(initial=rows_done, unit="rows")
+        uploader = threading.Thread(target=upload, daemon=True)
+        uploader.start()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=num_workers
+            ) as executor:
+                reader = pd.read_csv(
+                    file_path,
+                    chunksize=csv_chunk_size,
+                    skiprows=range(1, rows_done + 1),
+                )
+                for df in reader:
+                    if upload_errors:
+                        break
+                    future = executor.submit(
+                        QdrantVectorStoreManager._prepare_points,
+                        qdrant,
+                        model,
+                        text_splitter,
+                        df.to_dict(orient="records"),
+                        columns,
+                        batch_size,
+                    )
+                    pending.put((future, len(df)))
+        finally:
+            pending.put(None)
+            uploader.join()
+            progress.close()
+            # close the qdrant client
+            qdrant.client.close()
+
+        if upload_errors:
+            raise upload_errors[0]
+        # The ingestion is complete; a later run re-reads the file, skipping indexed chunks.
+        os.remove(checkpoint_path)
 
 
 class ArticleTextProcessing:
@@ -630,9 +847,873 @@ class FileIOHelper:
             return pickle.load(f)
 
 
+class HTTPClientPool:
+    """Thread-safe pool of keep-alive HTTP clients shared by the search retrievers in rm.py.
+
+    One `httpx.Client` is kept per host, so connections (and their TCP/TLS handshakes) are reused
+    across queries and threads, and the number of open connections is bounded per host. Redirects
+    are followed, as with `requests`.
+    HTTP/2 is used when the optional `h2` package is installed.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host: int = 20,
+        max_keepalive_connections_per_host: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        http2: Optional[bool] = None,
+    ):
+        """
+        Args:
+            max_connections_per_host: Maximum number of concurrent connections to a single host.
+            max_keepalive_connections_per_host: Maximum number of idle connections kept alive per host.
+            keepalive_expiry: Seconds an idle connection is kept alive.
+            timeout: Default timeout (in seconds) for reading, writing and acquiring a pooled connection.
+            connect_timeout: Default timeout (in seconds) for establishing a connection.
+            http2: Whether to use HTTP/2. Defaults to True if `h2` is installed.
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_keepalive_connections_per_host,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        if http2 is None:
+            http2 = importlib.util.find_spec("h2") is not None
+        self.http2 = http2
+        self._clients: Dict[str, httpx.Client] = {}
+        # Async clients are bound to the event loop they are used in, so one is kept per loop.
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get_client(self, url: str) -> httpx.Client:
+        """Return the pooled client for the host of `url`."""
+        host = httpx.URL(url).netloc.decode("ascii")
+        client = self._clients.get(host)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(host)
+                if client is None:
+                    client = httpx.Client(
+                        limits=self.limits,
+                        timeout=self.timeout,
+                        http2=self.http2,
+                        follow_redirects=True,
+                    )
+                    self._clients[host] = client
+        return client
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return self.get_client(url).request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        """Return the long-lived `httpx.AsyncClient` of the running event loop, creating it on first use.
+
+        The client has the pool's limits and timeouts and is shared by all coroutines of the loop, so
+        connections are reused across batches. Close it with `aclose` before the loop is closed.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    http2=self.http2,
+                    follow_redirects=True,
+                )
+                self._async_clients[loop] = client
+        return client
+
+    async def aclose(self):
+        """Close the async client of the running event loop, if any."""
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients = {}
+
+
+_http_client_pool = None
+_http_client_pool_lock = threading.Lock()
+
+
+def get_http_client_pool() -> HTTPClientPool:
+    """Return the process-wide `HTTPClientPool` used by the retrievers in rm.py."""
+    global _http_client_pool
+    if _http_client_pool is None:
+        with _http_client_pool_lock:
+            if _http_client_pool is None:
+                _http_client_pool = HTTPClientPool()
+    return _http_client_pool
+
+
+class SearchResults(list):
+    """List of search results that also records whether a search request failed.
+
+    Retrieval modules log errors and return the results they could collect, so a failed
+    request looks like a query without results; `failed` tells them apart, e.g. to keep
+    failures out of `RetrievalCache`.
+    """
+
+    def __init__(self, results: Iterable[Dict] = (), failed: bool = False):
+        super().__init__(results)
+        self.failed = failed
+
+
+class RetrievalCache:
+    """Persistent cache of search results, used by `Retriever` in interface.py.
+
+    Entries are keyed by the retrieval module class, the normalized query, k, the excluded urls and the
+    module's search parameters, and expire after `ttl` seconds. Empty results expire after
+    `empty_ttl` seconds, as they are often caused by transient problems.
+    """
+
+    # Attributes of a retrieval module that are runtime state rather than search parameters.
+    _IGNORED_PARAMS = {"usage", "k", "stage", "results", "result", "search_url"}
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        ttl: float = 7 * 24 * 3600,
+        empty_ttl: float = 3600,
+        size_limit: int = 2**30,
+    ):
+        """
+        Args:
+            cache_dir: Directory of the cache. Defaults to ~/.storm_local_cache/retrieval.
+            ttl: Time (in seconds) after which a cached result expires.
+            empty_ttl: Time (in seconds) after which a cached empty result expires.
+            size_limit: Maximum size (in bytes) of the cache on disk.
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                os.path.expanduser("~"), ".storm_local_cache", "retrieval"
+            )
+        self.cache = diskcache.Cache(cache_dir, size_limit=size_limit)
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @classmethod
+    def _search_params(cls, rm) -> Dict:
+        """Collect the JSON-serializable configuration of `rm`, leaving out credentials."""
+        params = {}
+        for name, value in vars(rm).items():
+            if (
+                name.startswith("_")
+                or name in cls._IGNORED_PARAMS
+                or any(secret in name.lower() for secret in ("key", "token", "secret"))
+            ):
+                continue
+            try:
+                params[name] = json.dumps(value, sort_keys=True)
+            except (TypeError, ValueError):
+                continue
+        return params
+
+    def make_key(self, rm, query: str, exclude_urls: List[str]) -> str:
+        key = {
+            "rm": f"{type(rm).__module__}.{type(rm).__qualname__}",
+            "query": self.normalize_query(query),
+            "k": getattr(rm, "k", None),
+            "exclude_urls": sorted(exclude_urls),
+            "params": self._search_params(rm),
+        }
+        return hashlib.sha256(
+            json.dumps(key, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, rm, query: str, exclude_urls: List[str]) -> Optional[List[Dict]]:
+        """Return the cached results, or None on a miss."""
+        results = self.cache.get(self.make_key(rm, query, exclude_urls))
+        with self._lock:
+            if results is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return results
+
+    def set(self, rm, query: str, exclude_urls: List[str], results: List[Dict]):
+        """Cache the results of a query. Results of failed searches are not cached."""
+        if getattr(results, "failed", False):
+            return
+        self.cache.set(
+            self.make_key(rm, query, exclude_urls),
+            list(results),
+            expire=self.ttl if results else self.empty_ttl,
+        )
+
+    def get_usage_and_reset(self):
+        with self._lock:
+            usage = {
+                "RetrievalCacheHits": self.hits,
+                "RetrievalCacheMisses": self.misses,
+            }
+            self.hits = 0
+            self.misses = 0
+        return usage
+
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was "
+    "were with we our via".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokenizer used by the BM25 indexes."""
+    return [
+        token
+        for token in _TOKEN_PATTERN.findall(text.lower())
+        if token not in _STOPWORDS
+    ]
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest finite scores in descending order, using argpartition."""
+    candidates = np.flatnonzero(np.isfinite(scores))
+    if len(candidates) > k:
+        partition = np.argpartition(scores[candidates], -k)[-k:]
+        candidates = candidates[partition]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def blockwise_dot(
+    matrix: np.ndarray, queries: np.ndarray, block_size: int = 65536
+) -> np.ndarray:
+    """Compute `queries @ matrix.T` as float32, one block of rows at a time.
+
+    Each block of a (possibly float16 or memory-mapped) matrix is cast to float32 before the
+    product, so the BLAS kernel is used without materializing a float32 copy of the whole matrix.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+    for start in range(0, len(matrix), block_size):
+        block = np.asarray(matrix[start : start + block_size], dtype=np.float32)
+        scores[:, start : start + len(block)] = queries @ block.T
+    return scores
+
+
+def reciprocal_rank_fusion(rankings: List[Sequence], k: int = 60) -> List:
+    """Fuse several rankings of ids into one, scoring each id by sum(1 / (k + rank))."""
+    scores = collections.defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class BM25Index:
+    """Okapi BM25 index over a static document collection.
+
+    Postings are stored as a term-major CSR matrix (`indptr`, `doc_ids`, `term_freqs`), so scoring
+    a query touches only the postings of its terms. A saved index is made of plain .npy files that
+    are memory-mapped on load, so large corpora are paged in by the OS instead of read into memory.
+    """
+
+    _ARRAYS = ("indptr", "doc_ids", "term_freqs", "doc_lens")
+
+    def __init__(
+        self,
+        vocabulary: Dict[str, int],
+        indptr: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lens: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+
+        num_docs = len(doc_lens)
+        doc_freqs = np.diff(indptr).astype(np.float32)
+        self.idf = np.log1p((num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        avg_len = float(doc_lens.mean()) if num_docs else 0.0
+        # Per-document part of the BM25 denominator, precomputed once.
+        self._norms = (k1 * (1 - b + b * doc_lens / max(avg_len, 1e-9))).astype(
+            np.float32
+        )
+
+    def __len__(self):
+        return len(self.doc_lens)
+
+    @classmethod
+    def build(cls, documents: Iterable[str], k1: float = 1.5, b: float = 0.75):
+        vocabulary = {}
+        term_ids = array.array("q")
+        doc_ids = array.array("q")
+        term_freqs = array.array("q")
+        doc_lens = array.array("q")
+        for doc_id, document in enumerate(documents):
+            tokens = tokenize(document)
+            doc_lens.append(len(tokens))
+            for token, count in collections.Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+                doc_ids.append(doc_id)
+                term_freqs.append(count)
+
+        term_ids = np.frombuffer(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=indptr[1:])
+        return cls(
+            vocabulary,
+            indptr,
+            np.frombuffer(doc_ids, dtype=np.int64)[order].astype(np.int32),
+            np.frombuffer(term_freqs, dtype=np.int64)[order].astype(np.float32),
+            np.frombuffer(doc_lens, dtype=np.int64).astype(np.float32),
+            k1=k1,
+            b=b,
+        )
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(index_dir, f"{name}.npy"), getattr(self, name))
+        FileIOHelper.dump_json(
+            {"vocabulary": self.vocabulary, "k1": self.k1, "b": self.b},
+            os.path.join(index_dir, "bm25.json"),
+        )
+
+    @classmethod
+    def exists(cls, index_dir: str) -> bool:
+        return all(
+            os.path.exists(os.path.join(index_dir, file_name))
+            for file_name in ["bm25.json"] + [f"{name}.npy" for name in cls._ARRAYS]
+        )
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "BM25Index":
+        config = FileIOHelper.load_json(os.path.join(index_dir, "bm25.json"))
+        arrays = {
+            name: np.load(
+                os.path.join(index_dir, f"{name}.npy"),
+                mmap_mode="r" if mmap else None,
+            )
+            for name in cls._ARRAYS
+        }
+        return cls(config["vocabulary"], k1=config["k1"], b=config["b"], **arrays)
+
+    def score(self, query: str) -> np.ndarray:
+        """BM25 score of every document for `query`."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            scores[docs] += (
+                self.idf[term_id] * tf * (self.k1 + 1) / (tf + self._norms[docs])
+            )
+        return scores
+
+    def search(
+        self, query: str, k: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the ids and scores of the top k documents matching `query`.
+
+        Args:
+            query: The query text.
+            k: Number of documents to return.
+            mask: Optional boolean array; documents where it is False are not returned.
+        """
+        scores = self.score(query)
+        scores[scores <= 0] = -np.inf
+        if mask is not None:
+            scores[~mask] = -np.inf
+        ids = top_k_indices(scores, k)
+        return ids, scores[ids]
+
+
+class NumpyVectorStore:
+    """Append-only store of normalized embeddings and their documents, searched in process.
+
+    Embeddings are kept as a raw float16 matrix on disk and memory-mapped, so a store of a few
+    million chunks needs no external service and little resident memory. Documents are appended to
+    a JSONL file and read back by offset. The row count in `store.json` is written last, so rows
+    from an interrupted append are ignored (and overwritten) when the store is reopened.
+
+    Files in `store_dir`: embeddings.f16, documents.jsonl, offsets.u64 and store.json.
+    """
+
+    def __init__(self, store_dir: str, dim: Optional[int] = None):
+        """
+        Args:
+            store_dir: Directory of the store, created if it does not exist.
+            dim: Embedding dimension. Required for a new store unless it is inferred from the first
+                append; checked against the dimension of an existing store.
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        self._config_path = os.path.join(store_dir, "store.json")
+        self._embeddings_path = os.path.join(store_dir, "embeddings.f16")
+        self._documents_path = os.path.join(store_dir, "documents.jsonl")
+        self._offsets_path = os.path.join(store_dir, "offsets.u64")
+
+        config = (
+            FileIOHelper.load_json(self._config_path)
+            if os.path.exists(self._config_path)
+            else {"dim": dim, "count": 0, "documents_size": 0}
+        )
+        if dim is not None and config["dim"] not in (None, dim):
+            raise ValueError(
+                f"Store {store_dir} has dimension {config['dim']}, got {dim}."
+            )
+        self.dim = config["dim"]
+        self._count = config["count"]
+        self._documents_size = config["documents_size"]
+        self._embeddings = None
+        self._offsets = None
+        self._remap()
+
+    def __len__(self):
+        return self._count
+
+    def _remap(self):
+        if self._count == 0:
+            self._embeddings = np.empty((0, self.dim or 0), dtype=np.float16)
+            self._offsets = np.empty(0, dtype=np.uint64)
+            return
+        self._embeddings = np.memmap(
+            self._embeddings_path,
+            dtype=np.float16,
+            mode="r",
+            shape=(self._count, self.dim),
+        )
+        self._offsets = np.memmap(
+            self._offsets_path, dtype=np.uint64, mode="r", shape=(self._count,)
+        )
+
+    @staticmethod
+    def normalize(embeddings) -> np.ndarray:
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def append(self, embeddings, documents: List[Dict]):
+        """Append embeddings (normalized here) and their documents to the store."""
+        embeddings = self.normalize(embeddings)
+        if len(embeddings) != len(documents):
+            raise ValueError("The number of embeddings and documents must match.")
+        if not documents:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(
+                    f"Expected embeddings of dimension {self.dim}, got {embeddings.shape[1]}."
+                )
+
+            lines = [
+                (json.dumps(document, ensure_ascii=False) + "\n").encode("utf-8")
+                for document in documents
+            ]
+            offsets = self._documents_size + np.cumsum(
+                [0] + [len(line) for line in lines[:-1]], dtype=np.uint64
+            )
+            # Truncate to the committed size first to drop rows of an interrupted append.
+            for path, size, data in (
+                (
+                    self._embeddings_path,
+                    self._count * self.dim * 2,
+                    embeddings.astype(np.float16).tobytes(),
+                ),
+                (self._offsets_path, self._count * 8, offsets.astype(np.uint64).tobytes()),
+                (self._documents_path, self._documents_size, b"".join(lines)),
+            ):
+                with open(path, "ab") as f:
+                    f.truncate(size)
+                    f.write(data)
+
+            self._count += len(documents)
+            self._documents_size += sum(len(line) for line in lines)
+            FileIOHelper.dump_json(
+                {
+                    "dim": self.dim,
+                    "count": self._count,
+                    "documents_size": self._documents_size,
+                },
+                self._config_path,
+            )
+            self._remap()
+
+    def get_document(self, index: int) -> Dict:
+        with open(self._documents_path, "rb") as f:
+            f.seek(int(self._offsets[index]))
+            return json.loads(f.readline())
+
+    def search(self, queries, k: int) -> List[List[Tuple[int, float]]]:
+        """Return the (row, cosine similarity) of the top k rows for each query embedding.
+
+        All queries are scored with one (blockwise) matrix product and an argpartition top-k.
+        """
+        embeddings = self._embeddings
+        if len(embeddings) == 0:
+            return [[] for _ in range(len(np.atleast_2d(queries)))]
+        scores = blockwise_dot(embeddings, self.normalize(queries))
+        results = []
+        for row in scores:
+            ids = top_k_indices(row, k)
+            results.append(list(zip(ids.tolist(), row[ids].tolist())))
+        return results
+
+
+def _extract_article_text(html: bytes) -> Optional[str]:
+    """Extract the main text of a web page."""
+    return extract(
+        html,
+        include_tables=False,
+        include_comments=False,
+        output_format="txt",
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _get_text_splitter(snippet_chunk_size: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=snippet_chunk_size,
+        chunk_overlap=0,
+        length_function=len,
+        is_separator_regex=False,
+        separators=[
+            "\n\n",
+            "\n",
+            ".",
+            "\uff0e",  # Fullwidth full stop
+            "\u3002",  # Ideographic full stop
+            ",",
+            "\uff0c",  # Fullwidth comma
+            "\u3001",  # Ideographic comma
+            " ",
+            "\u200B",  # Zero-width space
+            "",
+        ],
+    )
+
+
+class CompactSnippets(Sequence):
+    """Snippets of a page stored as one string plus an array of end offsets.
+
+    This is much smaller to pickle (e.g. to send it back from a worker process or to cache it) than a
+    list of separate strings. Use `list(snippets)` to get the snippets as a list of strings.
+    """
+
+    __slots__ = ("text", "offsets")
+
+    def __init__(self, text: str, offsets: array.array):
+        self.text = text
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, snippets: List[str]) -> "CompactSnippets":
+        offsets = array.array("Q", itertools.accumulate(len(s) for s in snippets))
+        return cls("".join(snippets), offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("snippet index out of range")
+        start = self.offsets[index - 1] if index > 0 else 0
+        return self.text[start : self.offsets[index]]
+
+
+class ExtractedPage(NamedTuple):
+    text: str
+    snippets: CompactSnippets
+
+
+def _extract_page(
+    html: bytes, min_char_count: int, snippet_chunk_size: int
+) -> Optional[ExtractedPage]:
+    """Extract the text of a page and split it into snippets. Runs in the worker processes."""
+    text = _extract_article_text(html)
+    if text is None or len(text) <= min_char_count:
+        return None
+    snippets = _get_text_splitter(snippet_chunk_size).split_text(text)
+    return ExtractedPage(text, CompactSnippets.from_list(snippets))
+
+
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+
+def get_extraction_pool(
+    max_workers: Optional[int] = None,
+) -> concurrent.futures.ProcessPoolExecutor:
+    """Return the process-wide pool of extraction worker processes, creating it on first use.
+
+    All `ExtractionService`s share this pool, so its size is set by the first caller (None for the CPU
+    count). Workers are started with the "forkserver" method where available, else "spawn", since
+    forking a process that runs threads (e.g. the crawler's) can deadlock the children. The pool is
+    shut down at interpreter exit.
+    """
+    global _extraction_pool
+    if _extraction_pool is None:
+        with _extraction_pool_lock:
+            if _extraction_pool is None:
+                start_method = (
+                    "forkserver"
+                    if "forkserver" in multiprocessing.get_all_start_methods()
+                    else "spawn"
+                )
+                _extraction_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    mp_context=multiprocessing.get_context(start_method),
+                )
+    return _extraction_pool
+
+
+@atexit.register
+def shutdown_extraction_pool():
+    """Shut down the shared extraction worker processes, if they were started."""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is not None:
+            _extraction_pool.shutdown()
+            _extraction_pool = None
+
+
+class ExtractionService:
+    """Extracts the main text of web pages and splits it into snippets.
+
+    HTML parsing and text splitting are CPU-bound pure-Python work. By default it runs in the calling
+    process; with `max_workers` set it is moved to the shared pool of worker processes (see
+    `get_extraction_pool`) to scale with the number of cores. Pages are submitted to the workers in chunks
+    to amortize the inter-process communication, and snippets come back as `CompactSnippets`.
+    """
+
+    def __init__(
+        self,
+        min_char_count: int = 150,
+        snippet_chunk_size: int = 1000,
+        max_workers: Optional[int] = 0,
+        chunksize: int = 4,
+    ):
+        """
+        Args:
+            min_char_count: Minimum character count for the article to be considered valid.
+            snippet_chunk_size: Maximum character count for each snippet.
+            max_workers: 0 (default) extracts in the calling process. Otherwise pages are extracted in the
+                shared worker pool, which is created with this many processes (None for the CPU count) if
+                it does not exist yet.
+            chunksize: Number of pages submitted to a worker at once.
+        """
+        self.max_workers = max_workers
+        self.chunksize = chunksize
+        self._extract = functools.partial(
+            _extract_page,
+            min_char_count=min_char_count,
+            snippet_chunk_size=snippet_chunk_size,
+        )
+
+    def extract_many(
+        self, htmls: List[Optional[bytes]]
+    ) -> List[Optional[ExtractedPage]]:
+        """Extract all pages. Pages that are None, or too short once extracted, yield None."""
+        pages = [None] * len(htmls)
+        todo = [i for i, html in enumerate(htmls) if html is not None]
+        if not todo:
+            return pages
+        if self.max_workers == 0:
+            results = map(self._extract, (htmls[i] for i in todo))
+        else:
+            results = get_extraction_pool(self.max_workers).map(
+                self._extract, [htmls[i] for i in todo], chunksize=self.chunksize
+            )
+        for i, page in zip(todo, results):
+            pages[i] = page
+        return pages
+
+    async def aextract(self, html: bytes) -> Optional[ExtractedPage]:
+        """Extract a single page without blocking the event loop."""
+        if self.max_workers == 0:
+            return await asyncio.to_thread(self._extract, html)
+        return await asyncio.get_running_loop().run_in_executor(
+            get_extraction_pool(self.max_workers), self._extract, html
+        )
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a url for use as a cache key: lowercase scheme and host, no default port or fragment."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (
+        scheme == "https" and netloc.endswith(":443")
+    ):
+        netloc = netloc.rsplit(":", 1)[0]
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+_ARXIV_PATH = re.compile(r"^/(?:abs|pdf|html)/(.+?)(?:v\d+)?(?:\.pdf)?/?$")
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+
+def canonicalize_url(url: str) -> str:
+    """Canonical form of a url, so that variants of the same paper or page compare equal.
+
+    On top of `normalize_url`, the scheme is unified to https, "www." and trailing slashes are
+    dropped and tracking parameters are removed. arXiv abs/pdf/html and versioned urls map to
+    https://arxiv.org/abs/<id>, and doi.org / dx.doi.org links to https://doi.org/<lowercased doi>.
+    """
+    parts = urlsplit(normalize_url(url))
+    scheme = "https" if parts.scheme in ("http", "https") else parts.scheme
+    netloc = parts.netloc.removeprefix("www.")
+
+    if netloc in ("arxiv.org", "export.arxiv.org"):
+        match = _ARXIV_PATH.match(parts.path)
+        if match:
+            return f"https://arxiv.org/abs/{match.group(1)}"
+    if netloc in ("doi.org", "dx.doi.org") and len(parts.path) > 1:
+        return f"https://doi.org/{unquote(parts.path[1:]).lower()}"
+
+    query = urlencode(
+        [
+            (name, value)
+            for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not name.lower().startswith(_TRACKING_PARAMS)
+        ]
+    )
+    return urlunsplit((scheme, netloc, parts.path.rstrip("/") or "/", query, ""))
+
+
+_CACHE_MISS = object()
+
+
+class WebPageCache:
+    """Persistent, content-addressed cache of web pages for `WebPageHelper`.
+
+    A url index maps each normalized url to the hash of its content and its ETag/Last-Modified validators.
+    The zlib-compressed HTML and the extracted text and snippets are stored once per content hash, so a page
+    served under several urls is stored and parsed once. Pages fetched less than `max_age` seconds ago are
+    served without any network I/O; older pages are revalidated with a conditional request. The least
+    recently used entries are evicted once the cache exceeds `size_limit` bytes.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_age: float = 24 * 3600,
+        size_limit: int = 2**30,
+    ):
+        """
+        Args:
+            cache_dir: Directory of the cache. Defaults to ~/.storm_local_cache/webpages.
+            max_age: Time (in seconds) during which a cached page is used without revalidation.
+            size_limit: Maximum size (in bytes) of the cache on disk.
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                os.path.expanduser("~"), ".storm_local_cache", "webpages"
+            )
+        self.cache = diskcache.Cache(
+            cache_dir,
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+        )
+        self.max_age = max_age
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        """Return the index entry of the url, or None."""
+        return self.cache.get(("url", normalize_url(url)))
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.max_age
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict]) -> Dict:
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def get_html(self, content_hash: str) -> Optional[bytes]:
+        data = self.cache.get(("html", content_hash))
+        return zlib.decompress(data) if data is not None else None
+
+    def store(self, url: str, html: bytes, headers) -> str:
+        """Store a downloaded page and return its content hash."""
+        content_hash = hashlib.sha256(html).hexdigest()
+        self.cache.add(("html", content_hash), zlib.compress(html))
+        self.cache.set(
+            ("url", normalize_url(url)),
+            {
+                "hash": content_hash,
+                "etag": headers.get("etag"),
+                "last_modified": headers.get("last-modified"),
+                "fetched_at": time.time(),
+            },
+        )
+        return content_hash
+
+    def refresh(self, url: str, entry: Dict):
+        """Mark a page as fresh after a successful revalidation."""
+        self.cache.set(("url", normalize_url(url)), {**entry, "fetched_at": time.time()})
+
+    def get_page(self, content_hash: str, extraction_key: Tuple):
+        """Return the extracted page (None if it was too short), or `_CACHE_MISS`."""
+        data = self.cache.get(("page", content_hash, extraction_key))
+        if data is None:
+            return _CACHE_MISS
+        return pickle.loads(zlib.decompress(data))
+
+    def set_page(
+        self, content_hash: str, extraction_key: Tuple, page: Optional["ExtractedPage"]
+    ):
+        self.cache.set(
+            ("page", content_hash, extraction_key),
+            zlib.compress(pickle.dumps(page)),
+        )
+
+
 class WebPageHelper:
     """Helper class to process web pages.
 
+    Pages are downloaded as streams and truncated at `max_bytes`, so a single huge page cannot exhaust memory.
+    Text extraction and snippet splitting are done by an `ExtractionService`, optionally in worker processes.
+    In async mode, pages are crawled on an event loop with per-domain concurrency limits, and each page is
+    extracted as soon as it arrives, overlapping HTML parsing with network I/O. With a `WebPageCache`, fresh pages are served
+    from disk without downloading or parsing them again.
+
     Acknowledgement: Part of the code is adapted from https://github.com/stanford-oval/WikiChat project.
     """
 
@@ -641,74 +1722,253 @@ class WebPageHelper:
         min_char_count: int = 150,
         snippet_chunk_size: int = 1000,
         max_thread_num: int = 10,
+        timeout: float = 4,
+        max_bytes: Optional[int] = 5 * 1024 * 1024,
+        use_async: bool = False,
+        max_connections_per_domain: int = 2,
+        extraction_processes: Optional[int] = 0,
+        page_cache: Optional[WebPageCache] = None,
     ):
         """
         Args:
             min_char_count: Minimum character count for the article to be considered valid.
             snippet_chunk_size: Maximum character count for each snippet.
             max_thread_num: Maximum number of threads to use for concurrent requests (e.g., downloading webpages).
+                In async mode, the maximum number of concurrent downloads.
+            timeout: Timeout (in seconds) of each download.
+            max_bytes: Maximum number of bytes downloaded per page; longer pages are truncated. None for no limit.
+            use_async: Whether to crawl pages with the async crawler.
+            max_connections_per_domain: Maximum number of concurrent downloads from the same domain (async mode).
+            extraction_processes: 0 (default) extracts text and snippets in the calling process. Otherwise they
+                are extracted in the shared worker pool of `get_extraction_pool` (None for the CPU count).
+            page_cache: Optional persistent cache of downloaded and extracted pages.
         """
-        self.httpx_client = httpx.Client(verify=False)
+        self.httpx_client = httpx.Client(verify=False, follow_redirects=True)
         self.min_char_count = min_char_count
         self.max_thread_num = max_thread_num
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=snippet_chunk_size,
-            chunk_overlap=0,
-            length_function=len,
-            is_separator_regex=False,
-            separators=[
-                "\n\n",
-                "\n",
-                ".",
-                "\uff0e",  # Fullwidth full stop
-                "\u3002",  # Ideographic full stop
-                ",",
-                "\uff0c",  # Fullwidth comma
-                "\u3001",  # Ideographic comma
-                " ",
-                "\u200B",  # Zero-width space
-                "",
-            ],
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.use_async = use_async
+        self.max_connections_per_domain = max_connections_per_domain
+        self.text_splitter = _get_text_splitter(snippet_chunk_size)
+        self.page_cache = page_cache
+        # Extracted pages are cached per extraction setting.
+        self._extraction_key = (min_char_count, snippet_chunk_size)
+        self.extraction_service = ExtractionService(
+            min_char_count=min_char_count,
+            snippet_chunk_size=snippet_chunk_size,
+            max_workers=extraction_processes,
         )
 
-    def download_webpage(self, url: str):
+    def close(self):
+        """Close the HTTP client. The shared extraction pool is shut down at interpreter exit."""
+        self.httpx_client.close()
+
+    def _truncate(self, content: bytearray, url: str) -> bool:
+        """Truncate `content` to `max_bytes` in place. Return True if it was truncated."""
+        if self.max_bytes is not None and len(content) > self.max_bytes:
+            logging.info(f"Truncated {url} at {self.max_bytes} bytes.")
+            del content[self.max_bytes :]
+            return True
+        return False
+
+    def _fetch(self, url: str, headers: Dict = {}):
+        """Return (status code, response headers, content) or None on errors."""
         try:
-            res = self.httpx_client.get(url, timeout=4)
-            if res.status_code >= 400:
-                res.raise_for_status()
-            return res.content
+            with self.httpx_client.stream(
+                "GET", url, headers=headers, timeout=self.timeout
+            ) as res:
+                if res.status_code >= 400:
+                    res.raise_for_status()
+                content = bytearray()
+                for chunk in res.iter_bytes():
+                    content += chunk
+                    if self._truncate(content, url):
+                        break
+            return res.status_code, res.headers, bytes(content)
         except httpx.HTTPError as exc:
             print(f"Error while requesting {exc.request.url!r} - {exc!r}")
             return None
 
-    def urls_to_articles(self, urls: List[str]) -> Dict:
+    async def _afetch(self, client: httpx.AsyncClient, url: str, headers: Dict = {}):
+        try:
+            async with client.stream("GET", url, headers=headers) as res:
+                if res.status_code >= 400:
+                    res.raise_for_status()
+                content = bytearray()
+                async for chunk in res.aiter_bytes():
+                    content += chunk
+                    if self._truncate(content, url):
+                        break
+            return res.status_code, res.headers, bytes(content)
+        except httpx.HTTPError as exc:
+            print(f"Error while requesting {url!r} - {exc!r}")
+            return None
+
+    def _cached_html(self, url: str):
+        """Return (cache entry, cached html). The html is None unless it can be served without network I/O."""
+        entry = self.page_cache.lookup(url)
+        if entry is not None and self.page_cache.is_fresh(entry):
+            return entry, self.page_cache.get_html(entry["hash"])
+        return entry, None
+
+    def _handle_response(self, url: str, entry: Optional[Dict], response):
+        """Store a (conditional) response in the page cache and return (html, content hash)."""
+        status_code, headers, content = response
+        if status_code == 304 and entry is not None:
+            html = self.page_cache.get_html(entry["hash"])
+            if html is not None:
+                self.page_cache.refresh(url, entry)
+                return html, entry["hash"]
+            return None, None  # The cached content was evicted.
+        return content, self.page_cache.store(url, content, headers)
+
+    def _download(self, url: str):
+        """Return (html, content hash). The content hash is None without a page cache."""
+        if self.page_cache is None:
+            response = self._fetch(url)
+            return (response[2] if response is not None else None), None
+
+        entry, html = self._cached_html(url)
+        if html is not None:
+            return html, entry["hash"]
+        response = self._fetch(url, self.page_cache.conditional_headers(entry))
+        if response is None:
+            return None, None
+        html, content_hash = self._handle_response(url, entry, response)
+        if html is None:
+            response = self._fetch(url)
+            if response is None:
+                return None, None
+            html, content_hash = self._handle_response(url, None, response)
+        return html, content_hash
+
+    async def _adownload(self, client: httpx.AsyncClient, url: str):
+        if self.page_cache is None:
+            response = await self._afetch(client, url)
+            return (response[2] if response is not None else None), None
+
+        entry, html = self._cached_html(url)
+        if html is not None:
+            return html, entry["hash"]
+        response = await self._afetch(
+            client, url, self.page_cache.conditional_headers(entry)
+        )
+        if response is None:
+            return None, None
+        html, content_hash = self._handle_response(url, entry, response)
+        if html is None:
+            response = await self._afetch(client, url)
+            if response is None:
+                return None, None
+            html, content_hash = self._handle_response(url, None, response)
+        return html, content_hash
+
+    def download_webpage(self, url: str):
+        return self._download(url)[0]
+
+    async def adownload_webpage(self, client: httpx.AsyncClient, url: str):
+        return (await self._adownload(client, url))[0]
+
+    def _cached_page(self, url: str):
+        """Return the extracted page if it can be served without network I/O, otherwise `_CACHE_MISS`."""
+        if self.page_cache is None:
+            return _CACHE_MISS
+        entry = self.page_cache.lookup(url)
+        if entry is None or not self.page_cache.is_fresh(entry):
+            return _CACHE_MISS
+        return self.page_cache.get_page(entry["hash"], self._extraction_key)
+
+    def _extracted_page(self, content_hash: Optional[str]):
+        """Return the extracted page of already seen content, otherwise `_CACHE_MISS`."""
+        if self.page_cache is None or content_hash is None:
+            return _CACHE_MISS
+        return self.page_cache.get_page(content_hash, self._extraction_key)
+
+    def _store_page(self, content_hash: Optional[str], page: Optional[ExtractedPage]):
+        if self.page_cache is not None and content_hash is not None:
+            self.page_cache.set_page(content_hash, self._extraction_key, page)
+
+    async def aurls_to_pages(self, urls: List[str]) -> Dict[str, ExtractedPage]:
+        """Crawl the urls concurrently and extract each page as it arrives."""
+        semaphore = asyncio.Semaphore(self.max_thread_num)
+        domain_semaphores = collections.defaultdict(
+            lambda: asyncio.Semaphore(self.max_connections_per_domain)
+        )
+        pages = {}
+
+        async with httpx.AsyncClient(
+            verify=False, timeout=self.timeout, follow_redirects=True
+        ) as client:
+
+            async def process(url):
+                page = self._cached_page(url)
+                if page is _CACHE_MISS:
+                    async with domain_semaphores[urlparse(url).netloc], semaphore:
+                        html, content_hash = await self._adownload(client, url)
+                    if html is None:
+                        return
+                    page = self._extracted_page(content_hash)
+                    if page is _CACHE_MISS:
+                        page = await self.extraction_service.aextract(html)
+                        self._store_page(content_hash, page)
+                if page is not None:
+                    pages[url] = page
+
+            await asyncio.gather(*(process(url) for url in dict.fromkeys(urls)))
+
+        return {url: pages[url] for url in urls if url in pages}
+
+    def urls_to_pages(self, urls: List[str]) -> Dict[str, ExtractedPage]:
+        """Download the urls and extract the text and snippets of each valid page."""
+        if self.use_async:
+            return run_async(self.aurls_to_pages(urls))
+
+        pages = {}
+        to_download = []
+        for u in dict.fromkeys(urls):
+            page = self._cached_page(u)
+            if page is _CACHE_MISS:
+                to_download.append(u)
+            elif page is not None:
+                pages[u] = page
+
         with concurrent.futures.ThreadPoolExecutor(
             max_workers=self.max_thread_num
         ) as executor:
-            htmls = list(executor.map(self.download_webpage, urls))
-
-        articles = {}
+            downloads = list(executor.map(self._download, to_download))
 
-        for h, u in zip(htmls, urls):
-            if h is None:
+        to_extract = []
+        for u, (html, content_hash) in zip(to_download, downloads):
+            if html is None:
                 continue
-            article_text = extract(
-                h,
-                include_tables=False,
-                include_comments=False,
-                output_format="txt",
-            )
-            if article_text is not None and len(article_text) > self.min_char_count:
-                articles[u] = {"text": article_text}
+            page = self._extracted_page(content_hash)
+            if page is _CACHE_MISS:
+                to_extract.append((u, html, content_hash))
+            elif page is not None:
+                pages[u] = page
 
-        return articles
+        extracted = self.extraction_service.extract_many([t[1] for t in to_extract])
+        for (u, _, content_hash), page in zip(to_extract, extracted):
+            self._store_page(content_hash, page)
+            if page is not None:
+                pages[u] = page
 
-    def urls_to_snippets(self, urls: List[str]) -> Dict:
-        articles = self.urls_to_articles(urls)
-        for u in articles:
-            articles[u]["snippets"] = self.text_splitter.split_text(articles[u]["text"])
+        return {u: pages[u] for u in urls if u in pages}
 
-        return articles
+    def urls_to_articles(self, urls: List[str]) -> Dict:
+        pages = self.urls_to_pages(urls)
+        return {u: {"text": page.text} for u, page in pages.items()}
+
+    async def aurls_to_articles(self, urls: List[str]) -> Dict:
+        pages = await self.aurls_to_pages(urls)
+        return {u: {"text": page.text} for u, page in pages.items()}
+
+    def urls_to_snippets(self, urls: List[str]) -> Dict:
+        return {
+            u: {"text": page.text, "snippets": list(page.snippets)}
+            for u, page in self.urls_to_pages(urls).items()
+        }
 
 
 def user_input_appropriateness_check(user_input):